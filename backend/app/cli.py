@@ -0,0 +1,108 @@
+"""
+Offline bulk extraction with the same engine, caches and templates as the API.
+
+`run` extracts every PDF under the given directories, matching the given
+globs, or named directly, and writes the results when it finishes. Progress
+is kept in a checkpoint manifest next to the output, so an interrupted run
+picks up where it stopped when started again with the same arguments.
+`export` rewrites the output from a checkpoint, e.g. in another format or
+while a run is still going.
+
+JSONL has one line per document, with the same payload as /api/extract; CSV,
+Parquet and Arrow IPC have one typed row per line item and need pyarrow.
+
+    python -m app.cli run ~/archive/2019 'scans/**/*.pdf' -o invoices.jsonl --workers 8
+    python -m app.cli export --checkpoint invoices.jsonl.checkpoint.sqlite3 -o invoices.csv
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from .config import settings
+from .runtime import create_runtime
+from .services.bulk import BulkProgress, Checkpoint, find_pdfs, run_bulk
+from .services.export import FORMATS, format_for, write_results
+
+def export(checkpoint: Checkpoint, output: str, fmt: str) -> None:
+    rows = write_results(checkpoint.records(), output, fmt)
+    print(f"Wrote {rows} {'documents' if fmt == 'jsonl' else 'rows'} to {output}", file=sys.stderr)
+
+async def run(args: argparse.Namespace, fmt: str) -> None:
+    paths = find_pdfs(args.inputs)
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".checkpoint.sqlite3")
+    try:
+        todo, skipped = checkpoint.pending(paths, retry_failed=not args.skip_failed)
+        progress = BulkProgress(total=len(todo), skipped=skipped)
+        print(f"{len(paths)} PDFs found, {skipped} already done, {len(todo)} to extract", file=sys.stderr)
+        if todo:
+            runtime = create_runtime(settings.model_copy(update={"PDF_PARSE_WORKERS": args.workers}))
+            interactive = sys.stderr.isatty()
+            ticker = asyncio.create_task(report(progress, interactive))
+            try:
+                await run_bulk(runtime.engine, todo, checkpoint, progress,
+                               batch_size=args.batch_size, concurrency=args.concurrency)
+            finally:
+                ticker.cancel()
+                await runtime.aclose()
+                print(("\r" if interactive else "") + progress.line(), file=sys.stderr)
+        export(checkpoint, args.output, fmt)
+    finally:
+        checkpoint.close()
+
+async def report(progress: BulkProgress, interactive: bool) -> None:
+    """Rewrite the progress line every second on a terminal, else log one every 30 seconds"""
+    while True:
+        await asyncio.sleep(1 if interactive else 30)
+        if interactive:
+            print("\r" + progress.line(), end="", file=sys.stderr, flush=True)
+        else:
+            print(time.strftime("%H:%M:%S ") + progress.line(), file=sys.stderr, flush=True)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="extract PDFs and write the results")
+    run_parser.add_argument("inputs", nargs="+", help="directories (searched recursively), globs or PDF files")
+    run_parser.add_argument("-o", "--output", required=True, help="results file: .jsonl, .csv, .parquet or .arrow")
+    run_parser.add_argument("--format", choices=FORMATS, help="instead of guessing from the extension")
+    run_parser.add_argument("--checkpoint", help="manifest path; default OUTPUT.checkpoint.sqlite3")
+    run_parser.add_argument("--workers", type=int, default=settings.PDF_PARSE_WORKERS,
+                            help="processes for PDF parsing and OCR")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="batches extracted at once")
+    run_parser.add_argument("--batch-size", type=int, default=settings.BATCH_PACK_MAX_DOCS,
+                            help="documents per engine batch; small ones share a Gemini request")
+    run_parser.add_argument("--skip-failed", action="store_true",
+                            help="do not retry files that failed in an earlier run")
+
+    export_parser = commands.add_parser("export", help="write the results recorded in a checkpoint")
+    export_parser.add_argument("--checkpoint", required=True)
+    export_parser.add_argument("-o", "--output", required=True)
+    export_parser.add_argument("--format", choices=FORMATS)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    try:
+        fmt = format_for(args.output, args.format)
+        if args.command == "run":
+            asyncio.run(run(args, fmt))
+        else:
+            if not os.path.exists(args.checkpoint):
+                raise FileNotFoundError(f"No such checkpoint: {args.checkpoint}")
+            checkpoint = Checkpoint(args.checkpoint)
+            try:
+                export(checkpoint, args.output, fmt)
+            finally:
+                checkpoint.close()
+    except (ValueError, FileNotFoundError) as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished files are in the checkpoint, run again to resume", file=sys.stderr)
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
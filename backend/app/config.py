@@ -1,11 +1,101 @@
+import os
 from pydantic_settings import BaseSettings
 from typing import Optional
 
 class Settings(BaseSettings):
-    GEMINI_API_KEY: str
+    GEMINI_API_KEY: Optional[str] = None
+    GEMINI_API_BASE: str = "https://generativelanguage.googleapis.com/v1beta"
+    GEMINI_MODEL: str = "gemini-2.5-flash"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
-    
+
+    # Documents longer than this are split and extracted chunk by chunk
+    CHUNK_MAX_TOKENS: int = 2000
+    # Send Gemini text rebuilt from positions, table rows delimited and repeated headers dropped
+    PROMPT_COMPACT: bool = True
+
+    # Batch extraction
+    MAX_BATCH_FILES: int = 100
+    MAX_BATCH_SIZE: int = 200 * 1024 * 1024  # whole request, zips included
+    BATCH_PACK_MAX_CHARS: int = 12000  # document text per packed Gemini request
+    BATCH_PACK_MAX_DOCS: int = 8
+
+    # Serving; with several web workers (gunicorn.conf.py) the limits marked
+    # "split" are totals for the deployment, divided between the workers
+    WEB_WORKERS: int = 1  # gunicorn.conf.py sets this to the number it starts
+    WARM_UP: bool = True  # start parse workers and open connections as the server starts, in the background
+    SHUTDOWN_DRAIN_SECONDS: float = 60.0  # for in-flight requests and jobs to finish on restart
+    METRICS_DIR: str = ".cache/metrics"  # with several web workers, where each leaves its counters for /metrics
+    METRICS_PUBLISH_SECONDS: float = 5.0  # how stale other workers' counters in /metrics can be
+
+    # Concurrency limits
+    PDF_PARSE_WORKERS: int = os.cpu_count() or 1  # processes for CPU-bound parsing, split
+    MAX_CONCURRENT_PARSES: int = 32  # parses queued or running before callers wait
+    GEMINI_MAX_CONNECTIONS: int = 20  # shared HTTP connection pool size
+    GEMINI_TIMEOUT: float = 60.0  # seconds per HTTP attempt
+
+    # Gemini quota and failure handling
+    GEMINI_REQUESTS_PER_MINUTE: float = 1000  # client-side rate limit, split; 0 disables it
+    GEMINI_BURST: int = 20  # split
+    GEMINI_MAX_RETRIES: int = 3  # on 429, 5xx and network errors
+    GEMINI_BACKOFF_BASE: float = 0.5  # seconds, doubled per retry, full jitter
+    GEMINI_BACKOFF_MAX: float = 8.0
+    GEMINI_DEADLINE: float = 120.0  # seconds per call, retries included
+    GEMINI_CIRCUIT_FAILURES: int = 5  # consecutive failures that open the circuit
+    GEMINI_CIRCUIT_RESET: float = 30.0  # seconds before a trial call is let through
+
+    # Text layer parser: auto, pypdf2, pypdfium2 or pdfminer
+    PDF_BACKEND: str = "auto"  # auto reads larger files with pypdfium2 when it is installed, the rest with pypdf2
+    PDF_BACKEND_LARGE_BYTES: int = 256 * 1024  # roughly 100 pages of text
+
+    # Pages read per document: all, or budget for only those the prompt will use
+    PAGE_MODE: str = "all"  # requests may ask for either with ?pages=
+    PAGE_FIRST: int = 1  # budget mode always reads this many pages from the start
+    PAGE_LAST: int = 1  # and this many from the end
+    PAGE_KEYWORDS: str = ""  # comma-separated; pages in between are kept only when they mention one
+    PAGE_BUDGET_CHARS: int = 8000  # stop parsing pages in between once this much text is read
+
+    # OCR for pages without a usable text layer
+    OCR_ENABLED: bool = True
+    OCR_MIN_TEXT_CHARS: int = 20  # alphanumeric characters for a page to skip OCR
+    OCR_MIN_CONFIDENCE: float = 70  # escalate DPI while tesseract confidence is below this
+    OCR_MAX_DPI: int = 300
+
+    # Read well-structured invoices from their layout instead of calling Gemini
+    LOCAL_TABLES_ENABLED: bool = True
+    LOCAL_TABLES_MIN_CONFIDENCE: float = 0.9  # below this the document goes to the LLM
+
+    # Learn per-vendor templates from LLM extractions and apply them locally
+    TEMPLATES_ENABLED: bool = True
+    TEMPLATES_PATH: str = ".cache/templates.sqlite3"  # empty keeps the templates in memory only
+    TEMPLATES_PER_VENDOR: int = 4
+
+    # Check extracted numbers against each other and the document text
+    RECONCILE_ENABLED: bool = True
+    RECONCILE_REEXTRACT: bool = True  # ask Gemini again for a table whose numbers do not add up
+    RECONCILE_MAX_TABLES: int = 1  # re-extracted tables per document
+
+    # Extraction result cache
+    CACHE_ENABLED: bool = True
+    CACHE_PATH: str = ".cache/extractions.sqlite3"  # empty keeps the cache in memory only
+    CACHE_MEMORY_ENTRIES: int = 256
+    CACHE_MAX_DISK_BYTES: int = 256 * 1024 * 1024
+    CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # Near-duplicate detection over the extracted text
+    FINGERPRINT_ENABLED: bool = True
+    FINGERPRINT_PATH: str = ".cache/fingerprints.sqlite3"  # empty keeps the index in memory only
+    FINGERPRINT_MIN_SIMILARITY: float = 0.7  # estimated shingle Jaccard similarity of a near-duplicate
+
+    # Background extraction jobs
+    JOB_BACKEND: str = "sqlite"  # "sqlite" or "memory"
+    JOB_DB_PATH: str = ".cache/jobs.sqlite3"
+    JOB_UPLOAD_DIR: str = ".cache/jobs"
+    JOB_WORKERS: int = 4  # split
+    JOB_REQUEUE_ON_START: bool = True  # gunicorn.conf.py turns it off and requeues once, in the master
+    # Comma-separated hosts callback_url may name; empty allows any host whose addresses are all public
+    JOB_CALLBACK_HOSTS: str = ""
+
     class Config:
         env_file = ".env"
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
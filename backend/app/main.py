@@ -82,19 +82,74 @@
 #         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-import PyPDF2
-import io
-import os
+import asyncio
+import datetime
 import json
-import requests
-from dotenv import load_dotenv
+import logging
+import os
+import zipfile
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-# Load environment variables
-load_dotenv()
+from .config import settings
+from .middleware import MaxBodySizeMiddleware, ServerTimingMiddleware
+from .runtime import Runtime, create_runtime, per_worker
+from .services.export import (GROUP_KEYS, MEDIA_TYPES, aggregate_line_items, document_record, line_item_table,
+                              stream_line_items)
+from .services.jobs import JobQueue, check_callback_url, create_job_store, public_job
+from .services.metrics import ERRORS, REGISTRY, SharedMetrics
+from .services.pipeline import PAGE_MODES, Document, ExtractionEngine
+from .services.uploads import SpooledUpload, TooManyFiles, UploadTooLarge, save_upload, spool_upload, unpack_zip
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = settings.GEMINI_API_KEY
+
+# Shared resources, created once per worker process in lifespan()
+runtime: Runtime = None
+job_queue: JobQueue = None
+engine: ExtractionEngine = None
+# With several web workers, /metrics sums theirs; otherwise it is this process's REGISTRY
+shared_metrics: Optional[SharedMetrics] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global runtime, job_queue, engine, shared_metrics
+    worker_settings = per_worker(settings)
+    runtime = create_runtime(worker_settings)
+    engine = runtime.engine
+    # In the background, so /health answers while parse workers start; early requests queue for them
+    warm_up = asyncio.create_task(runtime.warm_up()) if settings.WARM_UP else None
+    os.makedirs(settings.JOB_UPLOAD_DIR, exist_ok=True)
+    job_queue = JobQueue(
+        store=create_job_store(settings.JOB_BACKEND, settings.JOB_DB_PATH),
+        handler=run_extraction_job,
+        workers=worker_settings.JOB_WORKERS,
+        requeue_on_start=settings.JOB_REQUEUE_ON_START,
+        callback_hosts=[host.strip().lower() for host in settings.JOB_CALLBACK_HOSTS.split(",") if host.strip()],
+    )
+    await job_queue.start()
+    publisher = None
+    if settings.WEB_WORKERS > 1:
+        shared_metrics = SharedMetrics(REGISTRY, settings.METRICS_DIR)
+        publisher = asyncio.create_task(shared_metrics.run(settings.METRICS_PUBLISH_SECONDS))
+    try:
+        yield
+    finally:
+        if warm_up:
+            warm_up.cancel()
+            await asyncio.gather(warm_up, return_exceptions=True)
+        # The server has stopped taking requests and let open ones finish by now
+        await job_queue.stop(drain_seconds=settings.SHUTDOWN_DRAIN_SECONDS)
+        await runtime.aclose()
+        if publisher:
+            publisher.cancel()
+            await asyncio.gather(publisher, return_exceptions=True)
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -102,169 +157,284 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+
+# Leave room for the multipart framing around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    limits={
+        "/api/extract": settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+        "/api/extract/stream": settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+        "/api/extract/batch": settings.MAX_BATCH_SIZE + MULTIPART_OVERHEAD,
+        "/api/export": settings.MAX_BATCH_SIZE + MULTIPART_OVERHEAD,
+        "/api/export/aggregate": settings.MAX_BATCH_SIZE + MULTIPART_OVERHEAD,
+        "/api/jobs": settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    },
 )
 
-# Gemini API configuration
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
+# Outermost, so the total covers the other middleware too
+app.add_middleware(ServerTimingMiddleware)
+
 @app.get("/")
 async def root():
     return {"message": "PDF Data Extractor API is running"}
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "api_key_configured": bool(GEMINI_API_KEY)}
+    """Status and counters of the worker process that answered; /metrics has deployment totals"""
+    structure = engine.stage("structure") if engine else None
+    return {
+        "status": "healthy",
+        "api_key_configured": bool(GEMINI_API_KEY),
+        # The hit, call and timing counters below are this worker's only
+        "worker": {"pid": os.getpid(), "web_workers": settings.WEB_WORKERS},
+        "cache": runtime.result_cache.stats() if runtime and runtime.result_cache else None,
+        "fingerprints": runtime.fingerprint_index.stats() if runtime and runtime.fingerprint_index else None,
+        "templates": runtime.template_registry.stats() if runtime and runtime.template_registry else None,
+        "local_tables": structure.stats.snapshot() if structure else None,
+        "gemini": runtime.gemini_client.stats() if runtime and runtime.gemini_client else None,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Counters and latency histograms in the Prometheus text format, summed over the web workers"""
+    text = await asyncio.to_thread(shared_metrics.render) if shared_metrics else REGISTRY.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+def check_page_mode(pages: Optional[str]) -> Optional[str]:
+    """The ?pages= query parameter: all pages, or only those the prompt budget uses"""
+    if pages is not None and pages not in PAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"pages must be one of {', '.join(PAGE_MODES)}")
+    return pages
 
 @app.post("/api/extract")
-async def extract_pdf_data(file: UploadFile = File(...)):
+async def extract_pdf_data(file: UploadFile = File(...), pages: Optional[str] = None):
     try:
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+        page_mode = check_page_mode(pages)
         
-        content = await file.read()
-        pdf_file = io.BytesIO(content)
-        
-        try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            
-            # DEBUG: Print extracted text
-            print(f"DEBUG: Extracted {len(text)} characters from PDF")
-            print(f"DEBUG: First 200 chars: {text[:200]}")
-            
-        except Exception as e:
-            print(f"ERROR reading PDF: {e}")
-            raise HTTPException(status_code=422, detail=f"Could not read PDF: {str(e)}")
+        async with spool_upload(file, settings.MAX_FILE_SIZE) as upload:
+            doc = await engine.run(Document(upload.path, file.filename, upload.sha256, page_mode=page_mode))
         
-        if not text.strip():
-            print("DEBUG: No text found in PDF")
-            return {
-                "success": False,
-                "filename": file.filename,
-                "data": {
-                    "tables": [],
-                    "summary": None,
-                    "message": "No text found - might be scanned PDF"
-                }
-            }
+        if doc.error is not None:
+            logger.warning(f"Could not process {file.filename}: {doc.error}")
+            raise HTTPException(status_code=422, detail=doc.error)
         
-        # DEBUG: Check if API key exists
-        print(f"DEBUG: API Key present: {bool(GEMINI_API_KEY)}")
-        print(f"DEBUG: API Key (first 10 chars): {GEMINI_API_KEY[:10] if GEMINI_API_KEY else 'None'}")
-        
-        if GEMINI_API_KEY:
-            prompt = """
-            Extract tabular data from this invoice text. 
-            Important: 
-            - Quantity should be a number without $ sign
-            - Price/Rate is the unit price
-            - Total/Amount is quantity × price
-            
-            For the invoice items table, use these exact headers:
-            ["Description", "Quantity", "Unit Price", "Total"]
-            
-            Return ONLY valid JSON:
-            {
-                "tables": [
-                    {
-                        "title": "Invoice Items",
-                        "headers": ["Description", "Quantity", "Unit Price", "Total"],
-                        "rows": [
-                            ["item description", "quantity as number", "price with $", "total with $"]
-                        ]
-                    }
-                ],
-                "summary": {
-                    "total_amount": (final total as number),
-                    "invoice_count": 1,
-                    "date_range": "date range string"
-                }
-            }
-            
-            Invoice text to parse:
-            """ + text[:3000]
-            
-            payload = {
-                "contents": [
-                    {
-                        "parts": [
-                            {"text": prompt}
-                        ]
-                    }
-                ]
-            }
-            
-            try:
-                print(f"DEBUG: Calling Gemini API at {GEMINI_API_URL}")
-                response = requests.post(GEMINI_API_URL, json=payload)
-                print(f"DEBUG: Gemini response status: {response.status_code}")
-                
-                if response.status_code != 200:
-                    print(f"DEBUG: Gemini error response: {response.text}")
-                    
-                response.raise_for_status()
-                
-                result = response.json()
-                print(f"DEBUG: Gemini response keys: {result.keys()}")
-                
-                generated_text = result['candidates'][0]['content']['parts'][0]['text']
-                print(f"DEBUG: Generated text (first 200 chars): {generated_text[:200]}")
-                
-                # Extract JSON from response
-                if "```json" in generated_text:
-                    generated_text = generated_text.split("```json")[1].split("```")[0]
-                elif "{" in generated_text:
-                    start = generated_text.find("{")
-                    end = generated_text.rfind("}") + 1
-                    generated_text = generated_text[start:end]
-                
-                data = json.loads(generated_text)
-                print(f"DEBUG: Parsed data successfully: tables={len(data.get('tables', []))}")
-                
-            except requests.exceptions.RequestException as e:
-                print(f"ERROR: API Request failed: {e}")
-                data = {
-                    "tables": [],
-                    "summary": None,
-                    "error": f"Could not connect to Gemini API: {str(e)}"
-                }
-            except json.JSONDecodeError as e:
-                print(f"ERROR: JSON Parse failed: {e}")
-                print(f"DEBUG: Raw text that failed to parse: {generated_text if 'generated_text' in locals() else 'N/A'}")
-                data = {
-                    "tables": [],
-                    "summary": None,
-                    "error": "Could not parse AI response"
-                }
-            except Exception as e:
-                print(f"ERROR: Unexpected error: {e}")
-                data = {
-                    "tables": [],
-                    "summary": None,
-                    "error": str(e)
-                }
-        else:
-            print("DEBUG: No API key configured")
-            data = {
-                "tables": [],
-                "summary": None,
-                "message": "No API key configured",
-                "text_preview": text[:500]
-            }
-        
-        print(f"DEBUG: Returning data with {len(data.get('tables', []))} tables")
-        return {
-            "success": True,
-            "filename": file.filename,
-            "data": data
-        }
+        return doc.response()
         
+    except UploadTooLarge as e:
+        ERRORS.inc(type="upload_too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        ERRORS.inc(type="internal")
+        logger.exception(f"Unexpected error extracting {file.filename}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_extraction(doc: Document, upload: SpooledUpload) -> AsyncIterator[str]:
+    """Run the engine on one document, yielding its progress events as they happen"""
+    events: asyncio.Queue = asyncio.Queue()
+    doc.on_event = lambda event, data: events.put_nowait((event, data))
+    task = asyncio.create_task(engine.run(doc))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    tables_sent = 0
+    try:
+        yield sse("document", {"filename": doc.filename, "bytes": upload.size})
+        while (item := await events.get()) is not None:
+            event, data = item
+            if event == "table":
+                data = {"index": tables_sent, "table": data}
+                tables_sent += 1
+            yield sse(event, data)
+        await task
+
+        if doc.error is not None:
+            logger.warning(f"Could not process {doc.filename}: {doc.error}")
+            yield sse("error", {"detail": doc.error})
+            return
+        result = doc.data or {}
+        # Cached and packed results arrive whole, so their tables are sent now
+        for index, table in enumerate((result.get("tables") or [])[tables_sent:], tables_sent):
+            yield sse("table", {"index": index, "table": table})
+        yield sse("summary", result.get("summary"))
+        yield sse("result", doc.response())
+    except Exception as e:
+        ERRORS.inc(type="internal")
+        logger.exception(f"Unexpected error streaming {doc.filename}")
+        yield sse("error", {"detail": str(e)})
+    finally:
+        task.cancel()
+        upload.discard()
+
+@app.post("/api/extract/stream")
+async def extract_pdf_stream(file: UploadFile = File(...), pages: Optional[str] = None):
+    """/api/extract as Server-Sent Events, sent as each stage makes progress.
+
+    Events, in order: document; pages (the page count and the pages read)
+    and one page per page read from the text layer; ocr (the pages that need it) and a page for
+    each OCRed page; table for each table as soon as it is parsed from the
+    streamed Gemini answer, or for a document sent in several chunks once
+    the chunks are merged, so a table's index is its place in the result's
+    tables; summary; and result, which carries the same
+    payload as /api/extract and is authoritative. A failure ends the stream
+    with an error event.
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    page_mode = check_page_mode(pages)
+    try:
+        upload = await save_upload(file, settings.MAX_FILE_SIZE)
+    except UploadTooLarge as e:
+        ERRORS.inc(type="upload_too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+
+    doc = Document(upload.path, file.filename, upload.sha256, page_mode=page_mode)
+    return StreamingResponse(
+        stream_extraction(doc, upload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def unique_name(name: str, taken: Dict[str, Any]) -> str:
+    """Disambiguate repeated filenames so every batch result has its own key"""
+    if name not in taken:
+        return name
+    stem, dot, ext = name.rpartition(".")
+    n = 2
+    while f"{stem} ({n}){dot}{ext}" in taken:
+        n += 1
+    return f"{stem} ({n}){dot}{ext}"
+
+async def extract_batch(documents: Dict[str, SpooledUpload], page_mode: Optional[str] = None) -> Dict[str, Any]:
+    docs = [Document(upload.path, name, upload.sha256, page_mode=page_mode) for name, upload in documents.items()]
+    stats = await engine.run_many(docs)
+    return {
+        "success": True,
+        "count": len(documents),
+        "llm_batches": stats.get("llm_batches", 0),
+        "results": {doc.filename: doc.response() for doc in docs},
+    }
+
+async def handle_batch(files: List[UploadFile], handler: Callable[[Dict[str, SpooledUpload]], Awaitable[Any]],
+                       action: str) -> Any:
+    """Spool uploaded PDFs and zip archives of PDFs, then pass them to handler by unique filename"""
+    for file in files:
+        if not file.filename.lower().endswith(('.pdf', '.zip')):
+            raise HTTPException(status_code=400, detail=f"Only PDF or ZIP files are allowed: {file.filename}")
+
+    try:
+        async with AsyncExitStack() as stack:
+            documents: Dict[str, SpooledUpload] = {}
+            for file in files:
+                if file.filename.lower().endswith('.zip'):
+                    archive = await stack.enter_async_context(spool_upload(file, settings.MAX_BATCH_SIZE))
+                    members = await asyncio.to_thread(
+                        unpack_zip, archive.path, settings.MAX_FILE_SIZE, settings.MAX_BATCH_FILES
+                    )
+                    for name, member in members:
+                        stack.callback(member.discard)
+                        documents[unique_name(name, documents)] = member
+                else:
+                    upload = await stack.enter_async_context(spool_upload(file, settings.MAX_FILE_SIZE))
+                    documents[unique_name(file.filename, documents)] = upload
+                if len(documents) > settings.MAX_BATCH_FILES:
+                    raise TooManyFiles(settings.MAX_BATCH_FILES)
+
+            return await handler(documents)
+
+    except (UploadTooLarge, TooManyFiles) as e:
+        ERRORS.inc(type="upload_too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Could not read ZIP archive: {str(e)}")
     except HTTPException:
         raise
     except Exception as e:
-        print(f"ERROR: Unexpected error in main handler: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        ERRORS.inc(type="internal")
+        logger.exception(f"Unexpected error in {action}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/extract/batch")
+async def extract_pdf_batch(files: List[UploadFile] = File(...), pages: Optional[str] = None):
+    """Extract many PDFs, or zip archives of PDFs, in one request"""
+    page_mode = check_page_mode(pages)
+    return await handle_batch(files, lambda documents: extract_batch(documents, page_mode), "batch extraction")
+
+async def extract_line_items(documents: Dict[str, SpooledUpload]) -> Any:
+    docs = [Document(upload.path, name, upload.sha256) for name, upload in documents.items()]
+    await engine.run_many(docs)
+    return await asyncio.to_thread(line_item_table, [document_record(doc) for doc in docs])
+
+@app.post("/api/export")
+async def export_line_items(files: List[UploadFile] = File(...), format: str = Form("csv")):
+    """Typed line items of one or more PDFs, or zip archives of PDFs, as CSV, Parquet or Arrow IPC.
+
+    One row per table row, with amounts and quantities as decimals, the
+    invoice date as a date, and the vendor and invoice total of its document.
+    Documents already extracted are served from the cache.
+    """
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(MEDIA_TYPES)}")
+    table = await handle_batch(files, extract_line_items, "line item export")
+    return StreamingResponse(
+        stream_line_items(table, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="line_items.{format}"'},
+    )
+
+@app.post("/api/export/aggregate")
+async def aggregate_export(files: List[UploadFile] = File(...), by: str = Form("vendor"),
+                           start: Optional[str] = Form(None), end: Optional[str] = Form(None)):
+    """Totals of the line items per group, e.g. by=vendor,month, optionally over invoices dated start..end"""
+    keys = [key.strip() for key in by.split(",") if key.strip()]
+    if any(key not in GROUP_KEYS for key in keys):
+        raise HTTPException(status_code=400, detail=f"by must be a list of {', '.join(GROUP_KEYS)}")
+    try:
+        dates = [datetime.date.fromisoformat(value) if value else None for value in (start, end)]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be dates like 2024-10-31")
+    table = await handle_batch(files, extract_line_items, "line item aggregation")
+    groups = await asyncio.to_thread(aggregate_line_items, table, keys, *dates)
+    return {"by": keys, "start": start, "end": end, "groups": groups}
+
+
+async def run_extraction_job(job: Dict[str, Any], set_status: Callable[[str], None]) -> Dict[str, Any]:
+    """Job handler: the /api/extract pipeline for a PDF already saved to disk"""
+    doc = await engine.run(Document(job["pdf_path"], job["filename"], job["sha256"], on_status=set_status))
+    if doc.error is not None:
+        raise RuntimeError(doc.error)
+    return doc.response()
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), callback_url: Optional[str] = Form(None)):
+    """Queue a PDF for background extraction and return its job id right away"""
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    if callback_url:
+        try:
+            await check_callback_url(callback_url, job_queue.callback_hosts)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        upload = await save_upload(file, settings.MAX_FILE_SIZE, settings.JOB_UPLOAD_DIR)
+    except UploadTooLarge as e:
+        ERRORS.inc(type="upload_too_large")
+        raise HTTPException(status_code=413, detail=str(e))
+
+    job = await job_queue.submit(file.filename, upload.path, upload.sha256, callback_url)
+    return public_job(job)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
\ No newline at end of file
@@ -0,0 +1,95 @@
+import time
+from typing import Dict
+from starlette.datastructures import MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .services.metrics import request_timings, server_timing
+
+class MaxBodySizeMiddleware:
+    """Reject request bodies over a per-path limit while they are still arriving.
+
+    A Content-Length over the limit is refused before any body is read, and
+    one that is not a number with 400.
+    Otherwise the bytes are counted as they are received, and the request fails
+    with 413 as soon as the limit is crossed, so an oversized upload is never
+    buffered in full.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                response = JSONResponse({"detail": "Invalid Content-Length header"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            if declared > limit:
+                response = JSONResponse(
+                    {"detail": f"Request body exceeds the maximum size of {limit} bytes"},
+                    status_code=413,
+                )
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Request body exceeds the maximum size of {limit} bytes",
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+class ServerTimingMiddleware:
+    """Report the spans recorded while handling a request in a Server-Timing header.
+
+    Code under the request records spans with services.metrics.span(); they
+    are collected in a context variable set here, and the header lists them
+    with a "total" for the whole request, so the browser devtools and the
+    frontend can show where the time went.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timings["total"] = 1000 * (time.perf_counter() - started)
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(timings))
+                headers.append("Timing-Allow-Origin", "*")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
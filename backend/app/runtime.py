@@ -0,0 +1,136 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+import logging
+
+from .services.cache import ResultCache
+from .services.extraction import PROMPT_VERSION
+from .services.fingerprint import FingerprintIndex
+from .services.gemini_client import GeminiClient
+from .services.ocr_service import OCRService, check_tesseract
+from .services.pdf_backends import available_backends
+from .services.pipeline import ExtractionEngine, build_engine
+from .services.templates import TemplateRegistry
+from .services.workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Runtime:
+    """The extraction engine and the shared resources behind it.
+
+    One per process: the API builds it in its lifespan, the bulk CLI once per
+    run, so both extract with exactly the same stages, caches and clients.
+    """
+
+    worker_pool: WorkerPool
+    ocr_service: OCRService
+    gemini_client: Optional[GeminiClient]
+    result_cache: Optional[ResultCache]
+    fingerprint_index: Optional[FingerprintIndex]
+    template_registry: Optional[TemplateRegistry]
+    engine: ExtractionEngine
+
+    async def warm_up(self) -> None:
+        """Start the parse workers and open a Gemini connection before the first request"""
+        started = time.perf_counter()
+        processes = await self.worker_pool.warm_up()
+        if self.gemini_client:
+            await self.gemini_client.warm_up()
+        logger.info(f"Warmed up {processes} parse workers in {time.perf_counter() - started:.2f}s")
+
+    async def aclose(self) -> None:
+        if self.gemini_client:
+            await self.gemini_client.aclose()
+        if self.result_cache:
+            self.result_cache.close()
+        if self.fingerprint_index:
+            self.fingerprint_index.close()
+        if self.template_registry:
+            self.template_registry.close()
+        self.worker_pool.shutdown()
+
+def cache_version(settings: Any) -> str:
+    """Results are cached per model and prompt, compacted or not, so changing either starts afresh"""
+    return f"{settings.GEMINI_MODEL}:{PROMPT_VERSION}{':compact' if settings.PROMPT_COMPACT else ''}"
+
+def warm_worker() -> None:
+    """Runs in every parse worker process as it starts, so no document waits for parser imports"""
+    logger.debug(f"PDF backends: {', '.join(available_backends())}")
+    check_tesseract()
+
+def per_worker(settings: Any) -> Any:
+    """Settings for one of WEB_WORKERS processes, with the deployment-wide limits divided between them"""
+    workers = settings.WEB_WORKERS
+    if workers <= 1:
+        return settings
+    return settings.model_copy(update={
+        "PDF_PARSE_WORKERS": max(1, settings.PDF_PARSE_WORKERS // workers),
+        "GEMINI_REQUESTS_PER_MINUTE": settings.GEMINI_REQUESTS_PER_MINUTE / workers,
+        "GEMINI_BURST": max(1, settings.GEMINI_BURST // workers),
+        "JOB_WORKERS": max(1, settings.JOB_WORKERS // workers),
+    })
+
+def create_runtime(settings: Any) -> Runtime:
+    worker_pool = WorkerPool(
+        max_workers=settings.PDF_PARSE_WORKERS,
+        max_pending=settings.MAX_CONCURRENT_PARSES,
+        initializer=warm_worker if settings.WARM_UP else None,
+    )
+    ocr_service = OCRService(worker_pool)
+    gemini_client = None
+    if settings.GEMINI_API_KEY:
+        gemini_client = GeminiClient(
+            api_key=settings.GEMINI_API_KEY,
+            api_base=settings.GEMINI_API_BASE,
+            model=settings.GEMINI_MODEL,
+            max_connections=settings.GEMINI_MAX_CONNECTIONS,
+            timeout=settings.GEMINI_TIMEOUT,
+            requests_per_minute=settings.GEMINI_REQUESTS_PER_MINUTE,
+            burst=settings.GEMINI_BURST,
+            max_retries=settings.GEMINI_MAX_RETRIES,
+            backoff_base=settings.GEMINI_BACKOFF_BASE,
+            backoff_max=settings.GEMINI_BACKOFF_MAX,
+            deadline=settings.GEMINI_DEADLINE,
+            failure_threshold=settings.GEMINI_CIRCUIT_FAILURES,
+            reset_timeout=settings.GEMINI_CIRCUIT_RESET,
+        )
+    result_cache = None
+    if settings.CACHE_ENABLED:
+        result_cache = ResultCache(
+            path=settings.CACHE_PATH,
+            max_memory_entries=settings.CACHE_MEMORY_ENTRIES,
+            max_disk_bytes=settings.CACHE_MAX_DISK_BYTES,
+            ttl_seconds=settings.CACHE_TTL_SECONDS,
+        )
+    fingerprint_index = None
+    if settings.FINGERPRINT_ENABLED:
+        fingerprint_index = FingerprintIndex(
+            path=settings.FINGERPRINT_PATH,
+            min_similarity=settings.FINGERPRINT_MIN_SIMILARITY,
+        )
+    template_registry = None
+    if settings.TEMPLATES_ENABLED:
+        template_registry = TemplateRegistry(
+            path=settings.TEMPLATES_PATH,
+            max_per_vendor=settings.TEMPLATES_PER_VENDOR,
+        )
+    engine = build_engine(
+        settings,
+        worker_pool=worker_pool,
+        ocr_service=ocr_service,
+        client=gemini_client,
+        cache=result_cache,
+        cache_version=cache_version(settings),
+        fingerprints=fingerprint_index,
+        templates=template_registry,
+    )
+    return Runtime(
+        worker_pool=worker_pool,
+        ocr_service=ocr_service,
+        gemini_client=gemini_client,
+        result_cache=result_cache,
+        fingerprint_index=fingerprint_index,
+        template_registry=template_registry,
+        engine=engine,
+    )
@@ -0,0 +1,183 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+from .export import document_record
+from .pipeline import Document, ExtractionEngine
+
+logger = logging.getLogger(__name__)
+
+# Outcomes worth another attempt when a run is resumed
+RETRYABLE = ("failed", "error")
+
+def find_pdfs(inputs: Sequence[str]) -> List[str]:
+    """PDFs under the given directories, matching the given globs, or named directly; sorted, no repeats"""
+    found = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, names in os.walk(entry):
+                found.update(os.path.join(root, name) for name in names if name.lower().endswith(".pdf"))
+        elif glob.has_magic(entry):
+            found.update(path for path in glob.glob(entry, recursive=True)
+                         if os.path.isfile(path) and path.lower().endswith(".pdf"))
+        elif os.path.isfile(entry):
+            found.add(entry)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {entry}")
+    return sorted(os.path.abspath(path) for path in found)
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Checkpoint:
+    """Manifest of a bulk run in SQLite: each file's size, mtime and result.
+
+    A file is recorded as soon as its batch finishes, so an interrupted run
+    loses at most the batches in flight. On the next run a file is skipped
+    if it is recorded with the same size and mtime; changed files, and by
+    default failed ones, are extracted again.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, outcome TEXT NOT NULL,"
+            " record TEXT NOT NULL, seconds REAL NOT NULL, finished REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def pending(self, paths: Iterable[str], retry_failed: bool = True) -> Tuple[List[str], int]:
+        """The paths still to extract, and how many were skipped as already done"""
+        with self._lock:
+            done = {path: (size, mtime, outcome) for path, size, mtime, outcome in self._db.execute(
+                "SELECT path, size, mtime, outcome FROM files"
+            )}
+        todo = []
+        skipped = 0
+        for path in paths:
+            stat = os.stat(path)
+            previous = done.get(path)
+            if (previous is not None and previous[:2] == (stat.st_size, stat.st_mtime)
+                    and not (retry_failed and previous[2] in RETRYABLE)):
+                skipped += 1
+            else:
+                todo.append(path)
+        return todo, skipped
+
+    def record_many(self, entries: Iterable[Tuple[str, int, float, Dict[str, Any], float]]) -> None:
+        """Store (path, size, mtime, record, seconds) for finished files in one transaction"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime, outcome, record, seconds, finished)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(path, size, mtime, record["outcome"], json.dumps(record), seconds, now)
+                 for path, size, mtime, record, seconds in entries],
+            )
+            self._db.commit()
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Every recorded result, by path; read in pages so a large manifest is never all in memory"""
+        last = ""
+        while True:
+            with self._lock:
+                page = self._db.execute(
+                    "SELECT path, record FROM files WHERE path > ? ORDER BY path LIMIT 1000", (last,)
+                ).fetchall()
+            if not page:
+                return
+            for _, record in page:
+                yield json.loads(record)
+            last = page[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = dict(self._db.execute("SELECT outcome, COUNT(*) FROM files GROUP BY outcome").fetchall())
+        return {"files": sum(outcomes.values()), "outcomes": outcomes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+@dataclass
+class BulkProgress:
+    """Throughput and ETA of a bulk run, over this run's files only"""
+
+    total: int
+    skipped: int = 0
+    done: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def files_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.files_per_second()
+        return (self.total - self.done) / rate if rate > 0 else None
+
+    def line(self) -> str:
+        eta = self.eta_seconds()
+        eta_text = "--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        return (f"{self.done}/{self.total} files, {self.failed} failed, {self.skipped} already done"
+                f" | {self.files_per_second():.1f} files/s | ETA {eta_text}")
+
+async def run_bulk(engine: ExtractionEngine, paths: Sequence[str], checkpoint: Checkpoint,
+                   progress: BulkProgress, batch_size: int = 8, concurrency: int = 4,
+                   on_batch: Optional[Callable[[BulkProgress], None]] = None) -> None:
+    """Extract the files in batches through the engine, `concurrency` batches at a time.
+
+    Batches go through ExtractionEngine.run_many, as /api/extract/batch does,
+    so small documents share Gemini requests. Each finished batch is written
+    to the checkpoint before the next one starts on that slot.
+    """
+    batches: asyncio.Queue = asyncio.Queue()
+    for start in range(0, len(paths), batch_size):
+        batches.put_nowait(paths[start:start + batch_size])
+
+    async def extract(batch: Sequence[str]) -> None:
+        started = time.perf_counter()
+        stats = await asyncio.gather(*(asyncio.to_thread(os.stat, path) for path in batch))
+        hashes = await asyncio.gather(*(asyncio.to_thread(file_sha256, path) for path in batch))
+        docs = [Document(path, os.path.basename(path), sha256) for path, sha256 in zip(batch, hashes)]
+        await engine.run_many(docs)
+        seconds = (time.perf_counter() - started) / len(docs)
+        records = [document_record(doc, path) for doc, path in zip(docs, batch)]
+        await asyncio.to_thread(checkpoint.record_many, [
+            (path, stat.st_size, stat.st_mtime, record, seconds)
+            for path, stat, record in zip(batch, stats, records)
+        ])
+        progress.done += len(records)
+        progress.failed += sum(record["outcome"] in RETRYABLE for record in records)
+        if on_batch:
+            on_batch(progress)
+
+    async def worker() -> None:
+        while not batches.empty():
+            batch = batches.get_nowait()
+            try:
+                await extract(batch)
+            except Exception:
+                # Left out of the checkpoint, so the next run tries these files again
+                logger.exception(f"Batch starting at {batch[0]} failed")
+                progress.done += len(batch)
+                progress.failed += len(batch)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
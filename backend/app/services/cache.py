@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Content-addressed cache for extraction results.
+
+    Entries are keyed by a hash of the PDF bytes plus the prompt/model version,
+    so re-uploads of the same document skip parsing and the Gemini call. A small
+    in-memory LRU sits in front of a SQLite file; both tiers honour the TTL and
+    the disk tier is trimmed to max_disk_bytes, least recently used first.
+
+    The disk size is a running total loaded at open, so puts never scan the
+    table. Other web workers write to the same file without updating it, so
+    the total is re-read before each trim, and a trim frees down to
+    TRIM_TARGET of the limit so it does not run again on the next put.
+    """
+
+    TRIM_TARGET = 0.9
+
+    def __init__(self, path: Optional[str], max_memory_entries: int = 256,
+                 max_disk_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 7 * 24 * 3600):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._db = None
+        self._disk_entries = 0
+        self._disk_bytes = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._db.commit()
+            self._load_disk_usage()
+
+    @staticmethod
+    def make_key(content_sha256: str, version: str) -> str:
+        """Combine the document hash with whatever produced its result"""
+        return hashlib.sha256(f"{content_sha256}:{version}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created <= self.ttl_seconds:
+                        self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, created, value)
+                        self._counters["disk_hits"] += 1
+                        return json.loads(value)
+                    self._delete(key, len(value))
+                    self._db.commit()
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        now = time.time()
+        value = json.dumps(data)
+        with self._lock:
+            self._remember(key, now, value)
+            self._counters["stores"] += 1
+            if self._db is not None:
+                row = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now),
+                )
+                if row is None:
+                    self._disk_entries += 1
+                else:
+                    self._disk_bytes -= row[0]
+                self._disk_bytes += len(value)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._trim_disk(now)
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._disk_entries
+                stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load_disk_usage(self) -> None:
+        self._disk_entries, self._disk_bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+
+    def _delete(self, key: str, size: int) -> None:
+        if self._db.execute("DELETE FROM results WHERE key = ?", (key,)).rowcount:
+            self._disk_entries -= 1
+            self._disk_bytes -= size
+
+    def _trim_disk(self, now: float) -> None:
+        """Drop expired entries, then the least recently used, until under TRIM_TARGET of the limit"""
+        self._load_disk_usage()
+        cutoff = now - self.ttl_seconds
+        count, size = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results WHERE created < ?", (cutoff,)
+        ).fetchone()
+        if count:
+            self._db.execute("DELETE FROM results WHERE created < ?", (cutoff,))
+            self._disk_entries -= count
+            self._disk_bytes -= size
+            self._counters["evictions"] += count
+
+        target = self.max_disk_bytes * self.TRIM_TARGET
+        if self._disk_bytes <= target:
+            return
+        victims = []
+        freed = 0
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            victims.append((key,))
+            freed += size
+            if self._disk_bytes - freed <= target:
+                break
+        self._db.executemany("DELETE FROM results WHERE key = ?", victims)
+        self._disk_entries -= len(victims)
+        self._disk_bytes -= freed
+        self._counters["evictions"] += len(victims)
@@ -0,0 +1,104 @@
+import re
+from typing import List
+
+# Gemini averages roughly four characters of English/invoice text per token
+CHARS_PER_TOKEN = 4
+
+# A line that carries at least two numbers or amounts, or three columns
+# separated by runs of spaces, is treated as a table row
+NUMBER = re.compile(r"[-($]*\d[\d,]*(?:\.\d+)?\)?%?")
+COLUMN_GAP = re.compile(r"\S(?: {2,}|\t)\S")
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def is_table_line(line: str) -> bool:
+    return len(NUMBER.findall(line)) >= 2 or len(COLUMN_GAP.findall(line)) >= 2
+
+def split_blocks(page_text: str) -> List[str]:
+    """Split a page into blocks that should not be separated.
+
+    Consecutive table rows form one block together with the line just above
+    them (usually the column headers); other text splits at blank lines.
+    """
+    blocks: List[List[str]] = []
+    current: List[str] = []
+    in_table = False
+    for line in page_text.splitlines():
+        if not line.strip():
+            if current and not in_table:
+                blocks.append(current)
+                current = []
+            continue
+        table_line = is_table_line(line)
+        if table_line and not in_table:
+            # Start a table block, taking the header line along with it
+            header = current.pop() if current else None
+            if current:
+                blocks.append(current)
+            current = [header] if header is not None else []
+        elif in_table and not table_line:
+            blocks.append(current)
+            current = []
+        in_table = table_line
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return ["\n".join(block) for block in blocks]
+
+def split_oversized(block: str, max_chars: int) -> List[str]:
+    """Cut a block that alone exceeds the budget at line boundaries.
+
+    The first line is repeated at the top of every piece so continuation
+    pieces of a table keep their column headers.
+    """
+    lines = block.split("\n")
+    header, rows = lines[0], lines[1:]
+    pieces: List[str] = []
+    current = [header]
+    size = len(header)
+    for row in rows:
+        if size + len(row) + 1 > max_chars and len(current) > 1:
+            pieces.append("\n".join(current))
+            current, size = [header], len(header)
+        current.append(row[:max_chars])
+        size += len(row) + 1
+    pieces.append("\n".join(current))
+    return pieces
+
+def chunk_pages(pages: List[str], max_tokens: int) -> List[str]:
+    """Pack page text into chunks of at most max_tokens (estimated).
+
+    Whole pages are packed together while they fit. A page that does not fit
+    is split into blocks at table and paragraph boundaries, and only a single
+    block larger than the budget is cut mid-table. The order of the text is
+    preserved, so merging chunk results is deterministic.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+
+    def add(piece: str) -> None:
+        nonlocal current, size
+        if current and size + len(piece) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 1
+
+    for page_text in pages:
+        if not page_text.strip():
+            continue
+        if len(page_text) <= max_chars:
+            add(page_text)
+            continue
+        for block in split_blocks(page_text):
+            if len(block) <= max_chars:
+                add(block)
+            else:
+                for piece in split_oversized(block, max_chars):
+                    add(piece)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
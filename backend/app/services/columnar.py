@@ -0,0 +1,65 @@
+from typing import Any, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Amounts keep four decimal places: cents, plus unit prices quoted in fractions of a cent
+AMOUNT_SCALE = 4
+
+# RE2 patterns, run by Arrow over whole columns
+CURRENCY = r"(?P<currency>[$€£¥₹]|\b(?:USD|EUR|GBP|JPY|CAD|AUD|CHF|INR)\b)"
+NEGATIVE = r"^\(.*\)$|^[^0-9]*-"
+DATE_TOKEN = r"(?P<date>\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4}|[A-Za-z]{3,9}\.? \d{1,2}, \d{4}|\d{1,2} [A-Za-z]{3,9} \d{4})"
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y")
+
+def load_pyarrow():
+    """pyarrow with the modules used here, imported on first use since it is slow to load"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Columnar processing needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+def per_value(fn: Callable[[Any], Any], values: Any) -> Any:
+    """fn over the distinct values only; invoice dates and totals repeat on every row of a document"""
+    pa = load_pyarrow()
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    encoded = pa.compute.dictionary_encode(values)
+    return pa.compute.take(fn(encoded.dictionary), encoded.indices)
+
+def parse_decimals(values: Any) -> Any:
+    """Amounts like "$1,200.00", "(50.00)" or "2 hrs" parsed as decimals, a whole column at a time"""
+    return per_value(_parse_decimals, values)
+
+def _parse_decimals(values: Any) -> Any:
+    pa = load_pyarrow()
+    pc = pa.compute
+    text = pc.utf8_trim_whitespace(values)
+    negative = pc.match_substring_regex(text, NEGATIVE)
+    digits = pc.replace_substring_regex(text, r"[^0-9.]", "")
+    digits = pc.replace_substring_regex(digits, rf"^(\d*\.\d{{{AMOUNT_SCALE}}})\d+$", r"\1")
+    valid = pc.match_substring_regex(digits, r"^(\d+(\.\d*)?|\.\d+)$")
+    digits = pc.if_else(valid, digits, pa.scalar(None, pa.string()))
+    # Up to 14 digits before the point fit decimal128(18, 4); anything longer is not an amount
+    digits = pc.if_else(pc.less_equal(pc.utf8_length(pc.replace_substring_regex(digits, r"\..*", "")), 14),
+                        digits, pa.scalar(None, pa.string()))
+    numbers = pc.cast(digits, pa.decimal128(18, AMOUNT_SCALE))
+    return pc.if_else(negative, pc.negate(numbers), numbers)
+
+def parse_dates(values: Any) -> Any:
+    """The first date in each string, in any of DATE_FORMATS"""
+    return per_value(_parse_dates, values)
+
+def _parse_dates(values: Any) -> Any:
+    pa = load_pyarrow()
+    pc = pa.compute
+    token = pc.struct_field(pc.extract_regex(values, DATE_TOKEN), "date")
+    token = pc.replace_substring_regex(token, r"\.", "")
+    return pc.coalesce(*(
+        pc.cast(pc.strptime(token, format=fmt, unit="s", error_is_null=True), pa.date32())
+        for fmt in DATE_FORMATS
+    ))
@@ -0,0 +1,93 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+import logging
+
+from .pdf_backends import LARGE_BYTES, Fragment, choose_backend, group_lines
+
+logger = logging.getLogger(__name__)
+
+CELL_SEPARATOR = "|"
+# Lines of at least this many cells, this many in a row, are a table region
+TABLE_MIN_CELLS = 3
+TABLE_MIN_LINES = 2
+# Headers and footers are looked for among this many lines at each end of a page
+FURNITURE_LINES = 3
+SPACES = re.compile(r"[ \t\u00a0]+")
+DIGITS = re.compile(r"\d+")
+
+def normalize_text(text: str) -> str:
+    """Runs of spaces collapsed, lines trimmed and blank lines dropped"""
+    lines = (SPACES.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def compact_lines(lines: List[List[Fragment]]) -> str:
+    """Page text from positioned lines, with table regions as one delimited row per line.
+
+    The text layer puts every cell on a line of its own; here the cells of a
+    row are joined with "|" when the row belongs to a run of lines with
+    enough cells to be a table, and with a space otherwise.
+    """
+    cells = [[SPACES.sub(" ", fragment[3]).strip() for fragment in line] for line in lines]
+    cells = [[cell for cell in line if cell] for line in cells]
+    wide = [len(line) >= TABLE_MIN_CELLS for line in cells]
+    table = [False] * len(cells)
+    start = 0
+    for i in range(len(cells) + 1):
+        if i == len(cells) or not wide[i]:
+            if i - start >= TABLE_MIN_LINES:
+                table[start:i] = [True] * (i - start)
+            start = i + 1
+    return "\n".join((CELL_SEPARATOR if table[i] else " ").join(line) for i, line in enumerate(cells) if line)
+
+def strip_repeated_lines(page_texts: List[str]) -> List[str]:
+    """Drop headers and footers repeated on most pages, keeping their first appearance.
+
+    A line near the top or bottom of a page is furniture when, with its
+    digits ignored so "Page 3 of 9" matches "Page 4 of 9", it is found near
+    the ends of at least half the pages, and at least two. Table rows are
+    kept, so a table header repeated on every page still heads each chunk.
+    """
+    if len(page_texts) < 2:
+        return page_texts
+    pages = [text.splitlines() for text in page_texts]
+    ends = Counter()
+    for lines in pages:
+        ends.update({DIGITS.sub("#", line) for line in lines[:FURNITURE_LINES] + lines[-FURNITURE_LINES:]})
+    furniture = {line for line, count in ends.items()
+                 if count >= max(2, len(pages) / 2) and CELL_SEPARATOR not in line}
+    if not furniture:
+        return page_texts
+    seen = set()
+    compacted = []
+    for lines in pages:
+        kept = []
+        for i, line in enumerate(lines):
+            key = DIGITS.sub("#", line)
+            near_end = i < FURNITURE_LINES or i >= len(lines) - FURNITURE_LINES
+            if near_end and key in furniture:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        compacted.append("\n".join(kept))
+    return compacted
+
+def compact_pages(pdf_path: str, pages: Sequence[Dict[str, Any]], page_texts: Sequence[str],
+                  backend: str = "auto", large_bytes: int = LARGE_BYTES) -> List[str]:
+    """Page texts as they are worth sending to the LLM.
+
+    pages is the engine's per-page report. Pages read from the text layer
+    are rebuilt from text positions, so table rows come out as delimited
+    lines; OCRed pages only have their whitespace normalized. Repeated
+    headers and footers are then dropped. Runs in a worker process.
+    """
+    positioned = [page["page"] for page in pages if page.get("source", "text_layer") == "text_layer"]
+    rebuilt: Dict[int, str] = {}
+    if positioned:
+        parser = choose_backend(pdf_path, backend, large_bytes)
+        for page in parser.iter_pages(pdf_path, positions=True, numbers=positioned):
+            rebuilt[page.number] = compact_lines(group_lines(page.fragments))
+    texts = [rebuilt[page["page"]] if page["page"] in rebuilt else normalize_text(text)
+             for page, text in zip(pages, page_texts)]
+    return strip_repeated_lines(texts)
@@ -0,0 +1,261 @@
+import datetime
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+import logging
+
+from .columnar import AMOUNT_SCALE, CURRENCY, load_pyarrow, parse_decimals, parse_dates, per_value
+from .pipeline import Document, ExtractionEngine
+from .table_extractor import column_roles
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "csv", "parquet", "arrow")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Line items are typed and written this many at a time
+BATCH_ROWS = 10000
+RECORDS_PER_BATCH = 1000
+GROUP_KEYS = ("vendor", "currency", "year", "month", "date")
+
+def format_for(path: str, fmt: Optional[str] = None) -> str:
+    """The output format asked for, or the one the file extension names"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    fmt = {"json": "jsonl", "ipc": "arrow", "arrows": "arrow"}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}; use one of {', '.join(FORMATS)}")
+    if fmt != "jsonl":
+        load_pyarrow()
+    return fmt
+
+def document_record(doc: Document, path: Optional[str] = None) -> Dict[str, Any]:
+    """What is exported for one document: the API payload plus where it came from"""
+    response = doc.response()
+    return {
+        "path": path,
+        "filename": doc.filename,
+        "sha256": doc.sha256,
+        "outcome": ExtractionEngine.outcome(doc),
+        "success": response["success"],
+        "error": doc.error,
+        "data": response["data"],
+        "timings": doc.timings,
+    }
+
+def line_item_schema():
+    pa = load_pyarrow()
+    amount = pa.decimal128(18, AMOUNT_SCALE)
+    return pa.schema([
+        ("path", pa.string()), ("filename", pa.string()), ("sha256", pa.string()), ("outcome", pa.string()),
+        ("vendor", pa.string()), ("invoice_date", pa.date32()), ("date_range", pa.string()),
+        ("table", pa.string()), ("row", pa.int32()), ("description", pa.string()),
+        ("quantity", amount), ("unit_price", amount), ("amount", amount), ("currency", pa.string()),
+        ("other", pa.string()), ("invoice_total", amount), ("error", pa.string()),
+    ])
+
+def _raw_columns(records: Iterable[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Results flattened to one entry per line item, cells still as text; a document without any gets one"""
+    columns: Dict[str, List[Any]] = {name: [] for name in (
+        "path", "filename", "sha256", "outcome", "vendor", "date_range", "table", "row", "description",
+        "quantity", "unit_price", "amount", "other", "invoice_total", "error")}
+
+    def add(document: Dict[str, Any], item: Dict[str, Any]) -> None:
+        for name, values in columns.items():
+            values.append(item[name] if name in item else document.get(name))
+
+    for record in records:
+        data = record.get("data") or {}
+        summary = data.get("summary") if isinstance(data.get("summary"), dict) else {}
+        document = {key: record.get(key) for key in ("path", "filename", "sha256", "outcome", "error")}
+        document["error"] = document["error"] or data.get("error")
+        document["vendor"] = summary.get("vendor")
+        document["date_range"] = None if summary.get("date_range") is None else str(summary["date_range"])
+        document["invoice_total"] = None if summary.get("total_amount") is None else str(summary["total_amount"])
+
+        found = False
+        for t, table in enumerate(data.get("tables") or []):
+            if not isinstance(table, dict):
+                continue
+            headers = [str(header) for header in table.get("headers") or []]
+            roles = ["amount" if role == "total" else role for role in column_roles(headers)]
+            for r, row in enumerate(table.get("rows") or []):
+                if not isinstance(row, list):
+                    continue
+                item: Dict[str, Any] = {"table": table.get("title") or f"Table {t + 1}", "row": r,
+                                        "description": None, "quantity": None, "unit_price": None, "amount": None}
+                other = {}
+                for j, cell in enumerate(row):
+                    role = roles[j] if j < len(roles) else None
+                    if role in item and item[role] is None:
+                        item[role] = str(cell)
+                    else:
+                        other[headers[j] if j < len(headers) else f"column {j + 1}"] = cell
+                item["other"] = json.dumps(other) if other else None
+                add(document, item)
+                found = True
+        if not found:
+            add(document, {"table": None, "row": None, "description": None, "quantity": None,
+                           "unit_price": None, "amount": None, "other": None})
+    return columns
+
+def line_item_table(records: Iterable[Dict[str, Any]]):
+    """Typed line items of the given document records as an Arrow table.
+
+    Flattening the results is a Python loop; parsing amounts, currencies and
+    dates runs over whole columns in Arrow.
+    """
+    pa = load_pyarrow()
+    pc = pa.compute
+    schema = line_item_schema()
+    raw = _raw_columns(records)
+    strings = {name: pa.array(values, pa.string()) for name, values in raw.items() if name != "row"}
+    money = pc.coalesce(strings["amount"], strings["unit_price"])
+    columns = {
+        **{name: strings[name] for name in ("path", "filename", "sha256", "outcome", "vendor", "date_range",
+                                            "table", "description", "other", "error")},
+        "row": pa.array(raw["row"], pa.int32()),
+        "invoice_date": parse_dates(strings["date_range"]),
+        "quantity": parse_decimals(strings["quantity"]),
+        "unit_price": parse_decimals(strings["unit_price"]),
+        "amount": parse_decimals(strings["amount"]),
+        "currency": pc.struct_field(pc.extract_regex(money, CURRENCY), "currency"),
+        "invoice_total": parse_decimals(strings["invoice_total"]),
+    }
+    return pa.table([columns[field.name] for field in schema], schema=schema)
+
+def _batches(records: Iterable[Dict[str, Any]]) -> Iterator[Any]:
+    chunk: List[Dict[str, Any]] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == RECORDS_PER_BATCH:
+            yield line_item_table(chunk)
+            chunk = []
+    if chunk:
+        yield line_item_table(chunk)
+
+def _writer(fmt: str, sink: Any, schema: Any) -> Any:
+    pa = load_pyarrow()
+    if fmt == "csv":
+        return pa.csv.CSVWriter(sink, schema)
+    if fmt == "parquet":
+        return pa.parquet.ParquetWriter(sink, schema)
+    if fmt == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    raise ValueError(f"Unknown line item format {fmt!r}")
+
+class _Chunks:
+    """A write-only file that hands its bytes over as they are written, for streaming responses"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+def stream_line_items(table: Any, fmt: str) -> Iterator[bytes]:
+    """A line item table as CSV, Parquet or Arrow IPC stream bytes, a batch of rows at a time"""
+    sink = _Chunks()
+    writer = _writer(fmt, sink, table.schema)
+    for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def write_results(records: Iterable[Dict[str, Any]], path: str, fmt: str) -> int:
+    """Write document records as JSONL, or their typed line items in a columnar format; returns rows written"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    written = 0
+    # Written beside the target and moved into place, so a failed export leaves the old file
+    partial = path + ".partial"
+    if fmt == "jsonl":
+        with open(partial, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+    else:
+        writer = _writer(fmt, partial, line_item_schema())
+        try:
+            for table in _batches(records):
+                writer.write_table(table)
+                written += table.num_rows
+        finally:
+            writer.close()
+    os.replace(partial, path)
+    return written
+
+def aggregate_line_items(table: Any, by: Sequence[str], start: Optional[datetime.date] = None,
+                         end: Optional[datetime.date] = None) -> List[Dict[str, Any]]:
+    """Totals of a line item table per group, e.g. by=("vendor", "month"), over invoices dated start..end.
+
+    Each group reports its documents, line items, summed quantities and line
+    amounts, and the sum of the invoices' own totals, counted once per
+    document. Grouping and sums are Arrow group_by kernels.
+    """
+    pa = load_pyarrow()
+    pc = pa.compute
+    unknown = [key for key in by if key not in GROUP_KEYS]
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(unknown)}; use {', '.join(GROUP_KEYS)}")
+    if start is not None or end is not None:
+        dates = table["invoice_date"]
+        keep = pc.is_valid(dates)
+        if start is not None:
+            keep = pc.and_(keep, pc.greater_equal(dates, pa.scalar(start, pa.date32())))
+        if end is not None:
+            keep = pc.and_(keep, pc.less_equal(dates, pa.scalar(end, pa.date32())))
+        table = table.filter(keep)
+
+    formats = {"year": "%Y", "month": "%Y-%m", "date": "%Y-%m-%d"}
+    for key in by:
+        if key in formats:
+            table = table.append_column(key, per_value(
+                lambda dates: pc.strftime(pc.cast(dates, pa.timestamp("s")), format=formats[key]),
+                table["invoice_date"],
+            ))
+    keys = list(dict.fromkeys(by))
+    # A document without a sha256 is told apart by its filename
+    table = table.append_column("document", pc.coalesce(table["sha256"], table["filename"]))
+
+    items = table.group_by(keys).aggregate([
+        ("document", "count_distinct"), ("row", "count"), ("quantity", "sum"), ("amount", "sum"),
+    ])
+    totals = (table.group_by(keys + ["document"]).aggregate([("invoice_total", "max")])
+              .group_by(keys).aggregate([("invoice_total_max", "sum")]))
+    if keys:
+        items = items.join(totals, keys, join_type="left outer").sort_by([(key, "ascending") for key in keys])
+    else:
+        items = pa.Table.from_arrays(items.columns + totals.columns, items.column_names + totals.column_names)
+
+    names = {"document_count_distinct": "documents", "row_count": "line_items", "quantity_sum": "quantity",
+             "amount_sum": "amount", "invoice_total_max_sum": "invoice_total"}
+    groups = []
+    for row in items.to_pylist():
+        group = {names.get(key, key): value for key, value in row.items()}
+        for key in ("quantity", "amount", "invoice_total"):
+            if group.get(key) is not None:
+                group[key] = f"{group[key].normalize():f}"
+        groups.append(group)
+    return groups
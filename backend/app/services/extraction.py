@@ -0,0 +1,393 @@
+import asyncio
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+import httpx
+import logging
+
+from .chunking import chunk_pages
+from .gemini_client import GeminiClient, GeminiError, NoTextError
+from .json_stream import JSONStreamParser, prune_incomplete
+from .metrics import ERRORS, span
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a prompt or parse_model_output() changes so cached results
+# produced by the old prompt are not served any more
+PROMPT_VERSION = "4"
+
+# Kept to the words the model needs: every prompt token is paid for again
+# on each call and delays the first answer token
+INSTRUCTIONS = (
+    'Item table headers: ["Description", "Quantity", "Unit Price", "Total"]. '
+    "Quantity is a number without $; Unit Price is the price or rate; Total is quantity × price. "
+    "Cells of a table row may be separated by |."
+)
+
+RESULT_SCHEMA = json.dumps({
+    "tables": [{"title": "Invoice Items", "headers": ["Description", "Quantity", "Unit Price", "Total"],
+                "rows": [["description", "quantity", "$price", "$total"]]}],
+    "summary": {"total_amount": "final total as a number", "invoice_count": 1, "date_range": "dates"},
+})
+
+def build_prompt(text: str, layout: Optional[List[Dict[str, Any]]] = None) -> str:
+    """layout, the titles and headers of a near-duplicate's tables, replaces the generic instructions"""
+    if layout:
+        return (
+            "Extract this invoice's tables. It follows a known layout: use exactly these tables and "
+            "headers and fill in their rows. Return only JSON: "
+            + json.dumps({
+                "tables": [{**table, "rows": [["..."]]} for table in layout],
+                "summary": {"total_amount": "final total as a number", "invoice_count": 1, "date_range": "dates"},
+            })
+            + "\nInvoice:\n" + text
+        )
+    return ("Extract this invoice's tables. " + INSTRUCTIONS
+            + "\nReturn only JSON: " + RESULT_SCHEMA + "\nInvoice:\n" + text)
+
+def build_batch_prompt(texts: Dict[str, str]) -> str:
+    """Prompt for several invoices at once, answered as one JSON object per document id"""
+    documents = "\n".join(
+        f"=== DOCUMENT {doc_id} ===\n{text}" for doc_id, text in texts.items()
+    )
+    return (
+        'Extract the tables of each invoice below separately; each starts with "=== DOCUMENT <id> ===". '
+        + INSTRUCTIONS
+        + '\nReturn only JSON with one entry per document id: {"documents": {"<id>": ' + RESULT_SCHEMA + "}}"
+        + "\nInvoices:\n" + documents
+    )
+
+class TableStreamParser:
+    """Parse the model's answer as it arrives, reporting each table once it closes.
+
+    Built on JSONStreamParser, so fences, prose and slightly malformed JSON
+    are tolerated, and an answer cut off mid-way still yields every table
+    and row that was complete.
+    """
+
+    def __init__(self, on_table: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_table = on_table
+        self.parser = JSONStreamParser(on_close=self._closed)
+
+    def _closed(self, container: Any, path: tuple) -> None:
+        # ("tables", i) in a single answer, ("documents", id, "tables", i) in a packed one
+        if self.on_table and len(path) >= 2 and path[-2] == "tables" and isinstance(container, dict):
+            self.on_table(container)
+
+    def feed(self, delta: str) -> None:
+        self.parser.feed(delta)
+
+    def complete(self, value: Any) -> bool:
+        return self.parser.complete(value)
+
+    def result(self) -> Dict[str, Any]:
+        """The parsed answer; a truncated one is flagged with "truncated": True.
+
+        Raises json.JSONDecodeError when there is no JSON object to recover.
+        """
+        try:
+            data = self.parser.finish()
+        except ValueError as e:
+            raise json.JSONDecodeError(str(e), "", 0)
+        if not isinstance(data, dict):
+            raise json.JSONDecodeError("Model output is not a JSON object", "", 0)
+        prune_incomplete(data, self.parser)
+        if self.parser.truncated:
+            data["truncated"] = True
+            ERRORS.inc(type="llm_json_truncated")
+        elif self.parser.repairs:
+            ERRORS.inc(type="llm_json_repaired")
+        return data
+
+def _decode_strict(generated_text: str) -> Optional[dict]:
+    """Well-formed answers take this fast path through the C decoder"""
+    start = generated_text.find("{")
+    if start < 0:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(generated_text, start)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def parse_model_output(generated_text: str) -> dict:
+    """Parse a complete answer, tolerating fences, prose and malformed JSON"""
+    with span("json_parse"):
+        data = _decode_strict(generated_text)
+        if data is not None:
+            return data
+        parser = TableStreamParser()
+        parser.feed(generated_text)
+        return parser.result()
+
+def parse_packed_output(generated_text: str) -> Dict[str, Any]:
+    """The per-document results of a packed answer, only those the model finished"""
+    with span("json_parse"):
+        data = _decode_strict(generated_text)
+        if data is not None:
+            documents = data.get("documents")
+            return documents if isinstance(documents, dict) else {}
+        parser = TableStreamParser()
+        parser.feed(generated_text)
+        data = parser.result()
+        documents = data.get("documents") if isinstance(data, dict) else None
+        if not isinstance(documents, dict):
+            return {}
+        # A truncated answer still settles every document it completed
+        return {doc_id: result for doc_id, result in documents.items() if parser.complete(result)}
+
+def error_result(message: str) -> Dict[str, Any]:
+    return {
+        "tables": [],
+        "summary": None,
+        "error": message
+    }
+
+async def stream_answer(client: GeminiClient, prompt: str,
+                        on_table: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Stream Gemini's answer and parse it as it arrives, handing each table to on_table"""
+    parser = TableStreamParser(on_table)
+    async for delta in client.stream(prompt):
+        parser.feed(delta)
+    return parser.result()
+
+async def extract_tables(client: GeminiClient, text: str,
+                         on_table: Optional[Callable[[Dict[str, Any]], None]] = None,
+                         layout: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Ask Gemini to structure the invoice text; errors become payloads.
+
+    With on_table the answer is streamed and tables are reported as they
+    are parsed, before the whole answer has arrived. layout is a known
+    table layout to prompt with, see build_prompt().
+    """
+    generated_text = None
+    prompt = build_prompt(text, layout)
+    try:
+        if on_table is None:
+            generated_text = await client.generate(prompt)
+            logger.debug(f"Generated text (first 200 chars): {generated_text[:200]}")
+            data = parse_model_output(generated_text)
+        else:
+            data = await stream_answer(client, prompt, on_table)
+        logger.debug(f"Parsed data successfully: tables={len(data.get('tables', []))}")
+        return data
+    except NoTextError as e:
+        # Counted and logged by the client; Gemini was reached, so this is not a connection failure
+        return error_result(str(e))
+    except (httpx.HTTPError, GeminiError) as e:
+        ERRORS.inc(type="llm_request")
+        logger.error(f"API Request failed: {e}")
+        return error_result(f"Could not connect to Gemini API: {str(e)}")
+    except json.JSONDecodeError as e:
+        ERRORS.inc(type="llm_json_parse")
+        logger.error(f"JSON Parse failed: {e}")
+        logger.debug(f"Raw text that failed to parse: {generated_text}")
+        return error_result("Could not parse AI response")
+    except Exception as e:
+        ERRORS.inc(type="llm_unexpected")
+        logger.error(f"Unexpected error: {e}")
+        return error_result(str(e))
+
+def pack_documents(texts: Dict[str, str], max_chars: int, max_docs: int) -> List[Dict[str, str]]:
+    """Group documents into packs whose prompt text fits the character budget.
+
+    First-fit in input order, so the result is deterministic. A document that
+    fills the budget on its own ends up in a pack of one.
+    """
+    packs: List[Dict[str, str]] = []
+    sizes: List[int] = []
+    for doc_id, text in texts.items():
+        size = len(text)
+        for i, pack in enumerate(packs):
+            if len(pack) < max_docs and sizes[i] + size <= max_chars:
+                pack[doc_id] = text
+                sizes[i] += size
+                break
+        else:
+            packs.append({doc_id: text})
+            sizes.append(size)
+    return packs
+
+async def extract_tables_packed(client: GeminiClient, texts: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Extract several documents with a single Gemini call.
+
+    Documents the model skipped or left unfinished, or all of them if the
+    combined answer cannot be parsed, are retried one at a time with the
+    regular prompt.
+    """
+    if len(texts) == 1:
+        (doc_id, text), = texts.items()
+        return {doc_id: await extract_tables(client, text)}
+
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        generated_text = await client.generate(build_batch_prompt(texts))
+        documents = parse_packed_output(generated_text)
+        for doc_id in texts:
+            if isinstance(documents.get(doc_id), dict):
+                results[doc_id] = documents[doc_id]
+    except (httpx.HTTPError, GeminiError, json.JSONDecodeError) as e:
+        ERRORS.inc(type="llm_packed")
+        logger.warning(f"Packed extraction of {len(texts)} documents failed: {e}")
+
+    missing = [doc_id for doc_id in texts if doc_id not in results]
+    retried = await asyncio.gather(*(extract_tables(client, texts[doc_id]) for doc_id in missing))
+    results.update(zip(missing, retried))
+    return results
+
+def build_table_prompt(text: str, table: Dict[str, Any], problems: List[str]) -> str:
+    """Prompt to read one table again, saying what was wrong with the first reading"""
+    return (
+        "This table was extracted from the invoice text below, but its numbers do not add up:\n"
+        + json.dumps({"title": table.get("title", ""), "headers": table.get("headers") or [],
+                      "rows": table.get("rows") or []})
+        + "\n\nProblems found:\n" + "\n".join(f"- {problem}" for problem in problems)
+        + "\n\nRead the table again from the text, keeping the same title and headers. "
+        "Every row must be a line item as printed; leave subtotal, tax and total lines out. "
+        'Return ONLY valid JSON: {"title": "...", "headers": [...], "rows": [[...]]}'
+        + "\n\nInvoice text:\n" + text
+    )
+
+def table_text(text: str, table: Dict[str, Any], max_chars: int) -> Optional[str]:
+    """The part of the document text a table came from, with some context around it.
+
+    Found from the first cells of its first and last rows; the whole text if
+    the table cannot be located, or None if that is longer than max_chars.
+    """
+    firsts = [str(row[0]).strip() for row in table.get("rows") or [] if row and str(row[0]).strip()]
+    if firsts:
+        start = text.find(firsts[0])
+        end = text.find(firsts[-1], max(start, 0))
+        if start >= 0 and end >= 0:
+            # Headers come before the first row, the subtotal and total after the last
+            span_start = max(0, start - max_chars // 8)
+            return text[span_start:min(len(text), end + max_chars // 4, span_start + max_chars)]
+    return text if len(text) <= max_chars else None
+
+async def reextract_table(client: GeminiClient, text: str, table: Dict[str, Any],
+                          problems: List[str]) -> Optional[Dict[str, Any]]:
+    """Ask Gemini for one table again; None if the call fails or the answer is not a usable table"""
+    try:
+        data = parse_model_output(await client.generate(build_table_prompt(text, table, problems)))
+    except (httpx.HTTPError, GeminiError, json.JSONDecodeError) as e:
+        ERRORS.inc(type="llm_reextract")
+        logger.warning(f"Re-extracting table {table.get('title')!r} failed: {e}")
+        return None
+    if isinstance(data, dict) and isinstance(data.get("tables"), list) and data["tables"]:
+        data = data["tables"][0]
+    if not isinstance(data, dict) or not isinstance(data.get("rows"), list) or data.get("truncated"):
+        return None
+    return {"title": table.get("title", ""), "headers": table.get("headers") or [],
+            "rows": [row for row in data["rows"] if isinstance(row, list)]}
+
+
+AMOUNT_JUNK = re.compile(r"[^\d.\-]")
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Parse "$1,200.00", "(45.00)", "-$482.50" or a plain number; None if not numeric"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    negative = text.startswith("(") and text.endswith(")")
+    text = AMOUNT_JUNK.sub("", text)
+    if text.count("-") > 1 or text.count(".") > 1 or not any(c.isdigit() for c in text):
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return -abs(number) if negative else number
+
+def _normalise_row(row: List[Any]) -> tuple:
+    return tuple(" ".join(str(cell).split()).lower() for cell in row)
+
+def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-chunk extractions of one document, in chunk order.
+
+    Tables with the same headers are concatenated. A row already produced by
+    an earlier chunk is dropped, as are repeated header rows from continuation
+    pages; duplicates within one chunk are kept since they were in the source.
+    The stated total from the last chunk that has one wins; otherwise it is
+    recomputed from the line items, whose sum is always reported.
+    """
+    tables: Dict[tuple, Dict[str, Any]] = {}
+    seen_rows: Dict[tuple, set] = {}
+    for result in results:
+        for table in result.get("tables") or []:
+            headers = table.get("headers") or []
+            key = _normalise_row(headers)
+            if key not in tables:
+                tables[key] = {"title": table.get("title", ""), "headers": headers, "rows": []}
+                seen_rows[key] = set()
+            chunk_rows = set()
+            for row in table.get("rows") or []:
+                normalised = _normalise_row(row)
+                if normalised == key or normalised in seen_rows[key]:
+                    continue
+                tables[key]["rows"].append(row)
+                chunk_rows.add(normalised)
+            seen_rows[key] |= chunk_rows
+
+    merged_tables = list(tables.values())
+    line_items_total = 0.0
+    for table in merged_tables:
+        total_column = next(
+            (i for i, h in enumerate(table["headers"]) if str(h).strip().lower() in ("total", "amount")), None
+        )
+        if total_column is None:
+            continue
+        for row in table["rows"]:
+            if total_column < len(row):
+                line_items_total += parse_amount(row[total_column]) or 0.0
+
+    summaries = [r["summary"] for r in results if isinstance(r.get("summary"), dict)]
+    summary = None
+    if summaries or merged_tables:
+        stated_totals = [parse_amount(s.get("total_amount")) for s in summaries]
+        stated_totals = [t for t in stated_totals if t]
+        date_ranges = [s.get("date_range") for s in summaries if s.get("date_range")]
+        counts = [s.get("invoice_count") for s in summaries if isinstance(s.get("invoice_count"), int)]
+        summary = {
+            "total_amount": stated_totals[-1] if stated_totals else round(line_items_total, 2),
+            "invoice_count": max(counts) if counts else 1,
+            "date_range": date_ranges[0] if date_ranges else None,
+            "line_items_total": round(line_items_total, 2),
+        }
+
+    return {"tables": merged_tables, "summary": summary}
+
+async def extract_tables_chunked(client: GeminiClient, pages: List[str], max_tokens: int,
+                                 on_table: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                 layout: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Map-reduce extraction of a document of any length.
+
+    The page texts are split into chunks of at most max_tokens, every chunk
+    is sent to Gemini concurrently and the partial results are merged, so
+    latency follows the slowest chunk rather than the page count. on_table
+    sees the tables as they are streamed when there is one chunk, and the
+    merged tables once every chunk has answered otherwise, so they match the
+    result's tables in order. layout is passed to every chunk's prompt.
+    """
+    chunks = chunk_pages(pages, max_tokens)
+    if len(chunks) <= 1:
+        return await extract_tables(client, chunks[0] if chunks else "", on_table, layout)
+
+    logger.info(f"Extracting {len(chunks)} chunks concurrently")
+    results = await asyncio.gather(*(extract_tables(client, chunk, layout=layout) for chunk in chunks))
+    failed = [r["error"] for r in results if "error" in r]
+    if len(failed) == len(results):
+        return results[0]
+
+    merged = merge_results([r for r in results if "error" not in r])
+    merged["chunks"] = len(chunks)
+    if any(r.get("truncated") for r in results):
+        merged["truncated"] = True
+    if failed:
+        # Partial results are returned but, carrying an error, are not cached
+        merged["error"] = f"{len(failed)} of {len(chunks)} chunks failed: {failed[0]}"
+    if on_table is not None:
+        for table in merged["tables"]:
+            on_table(table)
+    return merged
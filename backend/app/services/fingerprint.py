@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_WORDS = 3
+# MinHash signature of BANDS x ROWS values. Two documents share a band, and
+# become candidates, with probability 1 - (1 - J**ROWS)**BANDS for shingle
+# Jaccard similarity J: about 2% at J=0.2, 90% at 0.6 and all but certain at 0.8
+BANDS = 16
+ROWS = 4
+PERMUTATIONS = BANDS * ROWS
+MERSENNE = (1 << 61) - 1
+# Seeded, so signatures written by one process are comparable in every other
+_rng = random.Random(20241015)
+HASHES = [(_rng.randrange(1, MERSENNE), _rng.randrange(MERSENNE)) for _ in range(PERMUTATIONS)]
+# Newest documents read per band; one template can fill a band with thousands
+MAX_BAND_CANDIDATES = 64
+
+NUMBER = re.compile(r"\d[\d,.]*")
+
+def normalize_text(text: str) -> str:
+    """Case, Unicode forms and whitespace folded; everything else, amounts included, kept"""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+def shingles(normalized: str) -> List[int]:
+    """64-bit hashes of the word shingles, numbers masked so one template's invoices look alike"""
+    words = NUMBER.sub("0", normalized).split()
+    return [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big") % MERSENNE
+            for shingle in {" ".join(words[i:i + SHINGLE_WORDS])
+                            for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}]
+
+def minhash(hashes: List[int]) -> Tuple[int, ...]:
+    return tuple(min((a * x + b) % MERSENNE for x in hashes) & 0xFFFFFFFF for a, b in HASHES)
+
+@dataclass(frozen=True)
+class Fingerprint:
+    text_sha256: str  # of the normalized text
+    signature: Tuple[int, ...]  # MinHash, PERMUTATIONS 32-bit values
+
+    @classmethod
+    def of(cls, text: str) -> Optional["Fingerprint"]:
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        return cls(hashlib.sha256(normalized.encode()).hexdigest(), minhash(shingles(normalized)))
+
+    def band_keys(self) -> List[int]:
+        keys = []
+        for band in range(BANDS):
+            rows = array("I", self.signature[band * ROWS:(band + 1) * ROWS]).tobytes()
+            digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+            # SQLite integers are signed 64-bit
+            keys.append(int.from_bytes(digest, "big", signed=True))
+        return keys
+
+    def similarity(self, signature: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the two documents' shingles"""
+        return sum(a == b for a, b in zip(self.signature, signature)) / PERMUTATIONS
+
+@dataclass
+class FingerprintMatch:
+    exact: bool  # the normalized text is identical, not just similar
+    similarity: float
+    result_key: Optional[str]  # ResultCache key of the matched document's result
+    layout: List[Dict[str, Any]]  # its tables' titles and headers
+
+def table_layout(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Titles and headers of a result's tables, without their rows"""
+    return [{"title": table.get("title"), "headers": table["headers"]}
+            for table in data.get("tables") or []
+            if isinstance(table, dict) and isinstance(table.get("headers"), list) and table["headers"]]
+
+class FingerprintIndex:
+    """On-disk index of document text fingerprints.
+
+    Each document is stored under the sha256 of its normalized text, for exact
+    matches, and a MinHash signature of its shingles, for near-duplicates. The
+    signature's LSH bands are kept in a clustered SQLite index, so a lookup is
+    BANDS index probes plus a few candidate rows however many documents there
+    are. Only the result's cache key and table layout are kept here; the
+    result itself stays in ResultCache.
+    """
+
+    def __init__(self, path: Optional[str], min_similarity: float = 0.7):
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stores": 0}
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY, text_sha256 BLOB NOT NULL UNIQUE, signature BLOB NOT NULL,"
+            " result_key TEXT, layout INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        # Documents of one template share a layout, so each is stored once
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS layouts (id INTEGER PRIMARY KEY, layout TEXT NOT NULL UNIQUE)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bands ("
+            " key INTEGER NOT NULL, document INTEGER NOT NULL, PRIMARY KEY (key, document)) WITHOUT ROWID"
+        )
+        self._db.commit()
+
+    def lookup(self, fingerprint: Fingerprint) -> Optional[FingerprintMatch]:
+        """The same text if it was seen before, else the most similar document above min_similarity"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result_key, layouts.layout FROM documents JOIN layouts ON layouts.id = documents.layout"
+                " WHERE text_sha256 = ?", (bytes.fromhex(fingerprint.text_sha256),)
+            ).fetchone()
+            if row is not None:
+                self._counters["exact_hits"] += 1
+                return FingerprintMatch(True, 1.0, row[0], json.loads(row[1]))
+
+            candidates = set()
+            for key in fingerprint.band_keys():
+                candidates.update(document for (document,) in self._db.execute(
+                    "SELECT document FROM bands WHERE key = ? ORDER BY document DESC LIMIT ?",
+                    (key, MAX_BAND_CANDIDATES),
+                ))
+            best: Optional[Tuple[float, int, Optional[str], str]] = None
+            if candidates:
+                placeholders = ",".join("?" * len(candidates))
+                for document, signature, result_key, layout in self._db.execute(
+                    "SELECT documents.id, signature, result_key, layouts.layout FROM documents"
+                    f" JOIN layouts ON layouts.id = documents.layout WHERE documents.id IN ({placeholders})",
+                    tuple(candidates),
+                ):
+                    similarity = fingerprint.similarity(tuple(array("I", signature)))
+                    # Ties go to the newest document
+                    if similarity >= self.min_similarity and (best is None or (similarity, document) > best[:2]):
+                        best = (similarity, document, result_key, layout)
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["near_hits"] += 1
+            return FingerprintMatch(False, best[0], best[2], json.loads(best[3]))
+
+    def add(self, fingerprint: Fingerprint, result_key: Optional[str], layout: List[Dict[str, Any]]) -> None:
+        self.add_many([(fingerprint, result_key, layout)])
+
+    def add_many(self, entries: Iterable[Tuple[Fingerprint, Optional[str], List[Dict[str, Any]]]]) -> None:
+        """Record documents in one transaction; a text seen before gets the newer result"""
+        now = time.time()
+        with self._lock:
+            for fingerprint, result_key, layout in entries:
+                layout_id = self._layout_id(json.dumps(layout))
+                digest = bytes.fromhex(fingerprint.text_sha256)
+                row = self._db.execute("SELECT id FROM documents WHERE text_sha256 = ?", (digest,)).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE documents SET result_key = ?, layout = ?, created = ? WHERE id = ?",
+                        (result_key, layout_id, now, row[0]),
+                    )
+                else:
+                    document = self._db.execute(
+                        "INSERT INTO documents (text_sha256, signature, result_key, layout, created)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (digest, array("I", fingerprint.signature).tobytes(), result_key, layout_id, now),
+                    ).lastrowid
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO bands (key, document) VALUES (?, ?)",
+                        [(key, document) for key in fingerprint.band_keys()],
+                    )
+                self._counters["stores"] += 1
+            self._db.commit()
+
+    def _layout_id(self, layout: str) -> int:
+        row = self._db.execute("SELECT id FROM layouts WHERE layout = ?", (layout,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self._db.execute("INSERT INTO layouts (layout) VALUES (?)", (layout,)).lastrowid
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            # Rows are never deleted, so the largest id is the count without a table scan
+            (stats["documents"],) = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM documents").fetchone()
+            return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
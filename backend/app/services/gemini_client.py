@@ -0,0 +1,413 @@
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+import httpx
+import logging
+
+from .chunking import estimate_tokens
+from .metrics import ERRORS, LLM_TOKENS, record_span
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: quota exhaustion and transient server trouble
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class GeminiError(Exception):
+    """Gemini could not be called, the request was given up on, or the answer had no text"""
+
+class CircuitOpenError(GeminiError):
+    pass
+
+class DeadlineExceeded(GeminiError):
+    pass
+
+class NoTextError(GeminiError):
+    """Gemini answered, but without text: the prompt was blocked or the candidate was empty"""
+
+def first_candidate(result: Any) -> Dict[str, Any]:
+    candidates = result.get("candidates") if isinstance(result, dict) else None
+    if isinstance(candidates, list) and candidates and isinstance(candidates[0], dict):
+        return candidates[0]
+    return {}
+
+def candidate_text(result: Any) -> str:
+    """Text of the first candidate of a (streamed) generateContent answer; empty if there is none"""
+    content = first_candidate(result).get("content")
+    parts = content.get("parts") if isinstance(content, dict) else None
+    if not isinstance(parts, list):
+        return ""
+    return "".join(part.get("text") or "" for part in parts if isinstance(part, dict))
+
+def no_text_reason(result: Any) -> str:
+    """Why an answer has no text: a blocked prompt, or the candidate's finish reason"""
+    feedback = result.get("promptFeedback") if isinstance(result, dict) else None
+    if isinstance(feedback, dict) and feedback.get("blockReason"):
+        return f"Gemini blocked the prompt: {feedback['blockReason']}"
+    finish_reason = first_candidate(result).get("finishReason")
+    if finish_reason:
+        return f"Gemini returned no text, finish reason {finish_reason}"
+    return "Gemini returned no candidates"
+
+class TokenBucket:
+    """Client-side rate limit: `rate` requests per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, deadline: Optional[float] = None) -> float:
+        """Wait for a token and return the seconds spent waiting.
+
+        Callers queue on the lock, so tokens are handed out first come,
+        first served. Raises DeadlineExceeded instead of waiting past deadline.
+        """
+        started = time.monotonic()
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    raise DeadlineExceeded("Rate limit wait would pass the call deadline")
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= 1
+        return time.monotonic() - started
+
+class CircuitBreaker:
+    """Stop calling Gemini while most recent calls fail, then probe it again.
+
+    Closed: calls go through. When at least `failure_threshold` of the last
+    `window` calls failed, and they are at least half of them, the circuit
+    opens and calls fail immediately for `reset_timeout` seconds. Then it is
+    half-open: one trial call is let through, and its outcome closes the
+    circuit again or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, window: int = 20):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True for a failure
+        self._state = self.CLOSED
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._trial_running):
+            raise CircuitOpenError("Gemini circuit breaker is open after repeated failures")
+        if state == self.HALF_OPEN:
+            self._trial_running = True
+
+    def abandon(self) -> None:
+        """The call was cancelled before it had an outcome"""
+        self._trial_running = False
+
+    def record_success(self) -> None:
+        self._outcomes.append(False)
+        if self._trial_running:
+            self._outcomes.clear()
+        self._trial_running = False
+        self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self._outcomes.append(True)
+        failures = sum(self._outcomes)
+        tripped = failures >= self.failure_threshold and failures * 2 >= len(self._outcomes)
+        if self._trial_running or tripped:
+            if self._state != self.OPEN:
+                logger.warning(f"Opening Gemini circuit after {failures} of the last {len(self._outcomes)} calls failed")
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+class GeminiClient:
+    """Async client for the Gemini generateContent REST API.
+
+    One instance is shared by the whole app so every request reuses the same
+    keep-alive connection pool instead of opening a new TLS connection. Calls
+    are paced by a token bucket matched to the API quota, retried with
+    jittered exponential backoff on 429/5xx and network errors, bounded by a
+    per-call deadline, and short-circuited while Gemini keeps failing.
+    """
+
+    def __init__(self, api_key: str, api_base: str, model: str,
+                 max_connections: int = 20, timeout: float = 60.0,
+                 requests_per_minute: float = 1000, burst: int = 20,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 deadline: float = 120.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.model = model
+        self.model_url = f"{api_base.rstrip('/')}/models/{model}"
+        self.url = f"{self.model_url}:generateContent"
+        self.stream_url = f"{self.model_url}:streamGenerateContent"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.rate_limiter = TokenBucket(requests_per_minute / 60, burst) if requests_per_minute > 0 else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._counters = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0, "throttled_seconds": 0.0}
+        self._api_key = api_key
+        self._max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled HTTP client, created on first use: setting up its transport costs a few hundred ms"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"x-goog-api-key": self._api_key},
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                ),
+                timeout=self.timeout,
+            )
+        return self._client
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number `attempt` (full jitter, honours Retry-After)"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _payload(prompt: str) -> Dict[str, Any]:
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {"text": prompt}
+                    ]
+                }
+            ]
+        }
+
+    async def _admit(self, expires: float) -> float:
+        """Rate limit, deadline and circuit checks before an attempt; returns the seconds left"""
+        if self.rate_limiter:
+            self._counters["throttled_seconds"] += await self.rate_limiter.acquire(expires)
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            ERRORS.inc(type="llm_deadline")
+            raise DeadlineExceeded("Gemini call deadline passed")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._counters["rejected"] += 1
+            ERRORS.inc(type="llm_circuit_open")
+            raise
+        self._counters["requests"] += 1
+        return remaining
+
+    def _failed_response(self, response: httpx.Response) -> httpx.HTTPStatusError:
+        """Account for a non-200 answer; raises it at once unless it is worth retrying"""
+        ERRORS.inc(type=f"llm_http_{response.status_code}")
+        logger.warning(f"Gemini returned {response.status_code}: {response.text[:500]}")
+        if response.status_code == 429:
+            # Over quota: Gemini is healthy, the backoff and token bucket handle it
+            self.breaker.record_success()
+        elif response.status_code not in RETRYABLE_STATUS:
+            # The request itself is wrong; Gemini is healthy
+            self.breaker.record_success()
+            response.raise_for_status()
+        else:
+            self.breaker.record_failure()
+        return httpx.HTTPStatusError(
+            f"Gemini returned {response.status_code}", request=response.request, response=response
+        )
+
+    def _no_text(self, result: Any) -> NoTextError:
+        """Account for a 200 without usable text. Gemini is up but the same prompt
+        would get the same answer, so it is neither retried nor a breaker outcome."""
+        self.breaker.abandon()
+        self._counters["failures"] += 1
+        ERRORS.inc(type="llm_no_text")
+        reason = no_text_reason(result)
+        logger.warning(reason)
+        return NoTextError(reason)
+
+    def _transport_failed(self, error: httpx.TransportError) -> None:
+        self.breaker.record_failure()
+        ERRORS.inc(type="llm_transport")
+        logger.warning(f"Gemini request failed: {error!r}")
+
+    async def _backoff_or_raise(self, attempt: int, error: Exception, retry_after: Optional[str],
+                                expires: float) -> None:
+        """Sleep before the next attempt, or raise if retries or time have run out"""
+        if attempt >= self.max_retries:
+            self._counters["failures"] += 1
+            raise error
+        delay = self.backoff(attempt, retry_after)
+        if time.monotonic() + delay >= expires:
+            self._counters["failures"] += 1
+            ERRORS.inc(type="llm_deadline")
+            raise DeadlineExceeded(f"Gemini call deadline passed after {attempt + 1} attempts: {error}")
+        self._counters["retries"] += 1
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _count_tokens(prompt: str, text: str, usage: Dict[str, Any]) -> None:
+        LLM_TOKENS.inc(usage.get("promptTokenCount") or estimate_tokens(prompt), kind="prompt")
+        LLM_TOKENS.inc(usage.get("candidatesTokenCount") or estimate_tokens(text), kind="output")
+
+    async def generate(self, prompt: str, deadline: Optional[float] = None) -> str:
+        """Send a prompt and return the text of the first candidate.
+
+        `deadline` is the total seconds allowed for this call including
+        retries and rate-limit waits; it defaults to the client's deadline.
+        Raises httpx.HTTPStatusError for non-retryable responses or when the
+        retries are used up, and GeminiError when the call is not attempted
+        or the answer has no text, as when the prompt was blocked.
+        """
+        payload = self._payload(prompt)
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+        attempt = 0
+        while True:
+            remaining = await self._admit(expires)
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = await self.client.post(
+                    self.url, json=payload, timeout=min(self.timeout, remaining)
+                )
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except httpx.TransportError as e:
+                record_span("llm_request", time.perf_counter() - started)
+                self._transport_failed(e)
+                error: Exception = e
+            else:
+                record_span("llm_request", time.perf_counter() - started)
+                if response.status_code == 200:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        result = {}
+                    text = candidate_text(result)
+                    if not text:
+                        raise self._no_text(result)
+                    self.breaker.record_success()
+                    self._count_tokens(prompt, text, result.get("usageMetadata") or {})
+                    return text
+                error = self._failed_response(response)
+                retry_after = response.headers.get("retry-after")
+
+            await self._backoff_or_raise(attempt, error, retry_after, expires)
+            attempt += 1
+
+    async def stream(self, prompt: str, deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Send a prompt to streamGenerateContent and yield the answer text as it arrives.
+
+        Pacing, the circuit breaker and the deadline work as in generate().
+        Failures are retried only until the first text has been yielded;
+        after that a broken stream raises, since the caller already has part
+        of the answer.
+        """
+        payload = self._payload(prompt)
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+        attempt = 0
+        while True:
+            remaining = await self._admit(expires)
+            retry_after = None
+            started = time.perf_counter()
+            parts: List[str] = []
+            usage: Dict[str, Any] = {}
+            last_chunk: Dict[str, Any] = {}
+            finished = settled = False
+            try:
+                async with self.client.stream(
+                    "POST", self.stream_url, params={"alt": "sse"}, json=payload,
+                    timeout=min(self.timeout, remaining),
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        settled = True
+                        error: Exception = self._failed_response(response)
+                        retry_after = response.headers.get("retry-after")
+                    else:
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            if time.monotonic() > expires:
+                                ERRORS.inc(type="llm_deadline")
+                                raise DeadlineExceeded("Gemini call deadline passed while streaming")
+                            chunk = json.loads(line[5:])
+                            if not isinstance(chunk, dict):
+                                continue
+                            last_chunk = chunk
+                            usage = chunk.get("usageMetadata") or usage
+                            text = candidate_text(chunk)
+                            if text:
+                                if not parts:
+                                    record_span("llm_first_token", time.perf_counter() - started)
+                                parts.append(text)
+                                yield text
+                        finished = True
+            except httpx.TransportError as e:
+                record_span("llm_request", time.perf_counter() - started)
+                settled = True
+                self._transport_failed(e)
+                if parts:
+                    self._counters["failures"] += 1
+                    raise
+                error = e
+            finally:
+                if not finished and not settled:
+                    # Cancelled, past the deadline, or the consumer stopped reading early
+                    self.breaker.abandon()
+
+            if finished:
+                record_span("llm_request", time.perf_counter() - started)
+                if not parts:
+                    raise self._no_text(last_chunk)
+                self.breaker.record_success()
+                self._count_tokens(prompt, "".join(parts), usage)
+                return
+
+            await self._backoff_or_raise(attempt, error, retry_after, expires)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._counters)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    async def warm_up(self) -> None:
+        """Open a pooled connection before the first call, which then skips the TLS handshake"""
+        try:
+            await self.client.get(self.model_url, timeout=min(self.timeout, 10.0))
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not reach Gemini while warming up: {e}")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
@@ -0,0 +1,370 @@
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JobStatus:
+    QUEUED = "queued"
+    PARSING = "parsing"
+    OCR = "ocr"
+    LLM = "llm"
+    DONE = "done"
+    FAILED = "failed"
+
+class JobStore(ABC):
+    """Persistence for queued jobs; swap implementations without touching the queue"""
+
+    @abstractmethod
+    def add(self, job: Dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def update(self, job_id: str, **fields: Any) -> None: ...
+
+    @abstractmethod
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to PARSING and return it"""
+
+    @abstractmethod
+    def requeue_unfinished(self) -> int:
+        """Put jobs interrupted by a restart back in the queue"""
+
+    def close(self) -> None:
+        pass
+
+class MemoryJobStore(JobStore):
+    """In-process store; jobs are lost when the process exits"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job["status"] == JobStatus.QUEUED]
+            if not queued:
+                return None
+            job = min(queued, key=lambda j: j["created_at"])
+            job.update(status=JobStatus.PARSING, updated_at=time.time())
+            return dict(job)
+
+    def requeue_unfinished(self) -> int:
+        return 0
+
+class SQLiteJobStore(JobStore):
+    """Store backed by a local SQLite file; queued jobs survive restarts"""
+
+    COLUMNS = ("id", "status", "filename", "pdf_path", "sha256", "callback_url",
+               "result", "error", "created_at", "updated_at")
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, pdf_path TEXT,"
+            " sha256 TEXT, callback_url TEXT, result TEXT, error TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._lock = threading.Lock()
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def add(self, job: Dict[str, Any]) -> None:
+        values = [job.get(column) for column in self.COLUMNS]
+        values[self.COLUMNS.index("result")] = None
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                values,
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+            )
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes sharing
+            # the file can never claim the same job
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status = ?"
+                    " ORDER BY created_at LIMIT 1", (JobStatus.QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                        (JobStatus.PARSING, time.time(), row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        job["status"] = JobStatus.PARSING
+        return job
+
+    def requeue_unfinished(self) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status IN (?, ?, ?)",
+                (JobStatus.QUEUED, time.time(), JobStatus.PARSING, JobStatus.OCR, JobStatus.LLM),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._db.close()
+
+def create_job_store(backend: str, path: str) -> JobStore:
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        return SQLiteJobStore(path)
+    raise ValueError(f"Unknown job backend: {backend}")
+
+async def check_callback_url(url: str, allowed_hosts: Sequence[str] = ()) -> None:
+    """Raise ValueError unless job results may be POSTed to url.
+
+    With allowed_hosts, only those hosts are accepted. Without, the host
+    must resolve to public addresses only, so a client cannot have the
+    server call loopback, private or link-local services.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http(s) URL")
+    host = parts.hostname.lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise ValueError(f"callback_url host {host} is not allowed")
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (ValueError, socket.gaierror):
+        raise ValueError(f"callback_url host {host} does not resolve")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if getattr(address, "ipv4_mapped", None):
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ValueError(f"callback_url host {host} is not a public address")
+
+# handler(job, set_status) -> result payload
+JobHandler = Callable[[Dict[str, Any], Callable[[str], None]], Awaitable[Dict[str, Any]]]
+
+class JobQueue:
+    """Runs extraction jobs on background asyncio workers.
+
+    Submitting only records the job, so it costs the same for any document
+    size. Workers claim jobs from the store, report progress through
+    set_status, and POST the finished job to its callback URL if one was given.
+    """
+
+    # How often idle workers re-check the store for jobs added by other processes
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, store: JobStore, handler: JobHandler, workers: int = 2,
+                 callback_timeout: float = 10.0, requeue_on_start: bool = True,
+                 callback_hosts: Sequence[str] = ()):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.requeue_on_start = requeue_on_start
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.callback_timeout = callback_timeout
+        self.callback_hosts = tuple(callback_hosts)
+        # Created with the first callback; building its transport is a good part of startup
+        self._callbacks: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        # Off when several processes share the store: one starting must not
+        # requeue the jobs the others are running
+        if self.requeue_on_start:
+            requeued = await asyncio.to_thread(self.store.requeue_unfinished)
+            if requeued:
+                logger.info(f"Requeued {requeued} interrupted jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._wakeup.set()
+
+    async def stop(self, drain_seconds: float = 0) -> None:
+        """Stop claiming jobs, let running ones finish for up to drain_seconds, then cancel them.
+
+        A cancelled job goes back to the queue for another process, or the
+        next start, to pick up.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks and drain_seconds > 0:
+            _, running = await asyncio.wait(self._tasks, timeout=drain_seconds)
+            if running:
+                logger.warning(f"{len(running)} jobs still running after {drain_seconds:g}s; requeueing them")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._callbacks is not None:
+            await self._callbacks.aclose()
+        self.store.close()
+
+    async def submit(self, filename: str, pdf_path: str, sha256: str,
+                     callback_url: Optional[str] = None) -> Dict[str, Any]:
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": JobStatus.QUEUED,
+            "filename": filename,
+            "pdf_path": pdf_path,
+            "sha256": sha256,
+            "callback_url": callback_url,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await asyncio.to_thread(self.store.add, job)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job = await asyncio.to_thread(self.store.claim_next)
+            if job is None:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        loop = asyncio.get_running_loop()
+        # Status writes run in threads, each after the one before, so a store
+        # locked by another process never stalls the event loop
+        updates: List[asyncio.Task] = []
+
+        def update(**fields: Any) -> asyncio.Task:
+            previous = updates[-1] if updates else None
+            updates.append(loop.create_task(self._update_after(previous, job_id, **fields)))
+            return updates[-1]
+
+        def set_status(status: str) -> None:
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if on_loop:
+                update(status=status)
+            else:
+                # From one of the pipeline's threads
+                loop.call_soon_threadsafe(lambda: update(status=status))
+
+        try:
+            result = await self.handler(job, set_status)
+            await update(status=JobStatus.DONE, result=result)
+        except asyncio.CancelledError:
+            await asyncio.shield(update(status=JobStatus.QUEUED))
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await update(status=JobStatus.FAILED, error=str(e))
+
+        # Kept on cancellation so a requeued job can still be processed
+        try:
+            os.unlink(job["pdf_path"])
+        except OSError:
+            logger.warning(f"Could not remove upload for job {job_id}")
+
+        if job.get("callback_url"):
+            await self._send_callback(job_id, job["callback_url"])
+
+    async def _update_after(self, previous: Optional[asyncio.Task], job_id: str, **fields: Any) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await asyncio.to_thread(self.store.update, job_id, **fields)
+
+    async def _send_callback(self, job_id: str, callback_url: str) -> None:
+        job = await self.get(job_id)
+        try:
+            # Again at send time: what the host resolves to may have changed since the job was submitted
+            await check_callback_url(callback_url, self.callback_hosts)
+        except ValueError as e:
+            logger.warning(f"Callback for job {job_id} refused: {e}")
+            return
+        if self._callbacks is None:
+            # A redirect could point anywhere, so it is not followed
+            self._callbacks = httpx.AsyncClient(timeout=self.callback_timeout, follow_redirects=False)
+        try:
+            response = await self._callbacks.post(callback_url, json=public_job(job))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning(f"Callback for job {job_id} to {callback_url} failed: {e}")
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a job that are returned to API clients"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "result": job["result"],
+        "error": job["error"],
+    }
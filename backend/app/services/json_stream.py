@@ -0,0 +1,318 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+WHITESPACE = " \t\r\n"
+# Characters that end an unquoted token
+DELIMITERS = WHITESPACE + ",:[]{}\"'/"
+
+START = re.compile(r"[{\[]")
+STRING_RUNS = {'"': re.compile(r'[^"\\]+'), "'": re.compile(r"[^'\\]+")}
+BARE_RUN = re.compile(r"[^\s,:\[\]{}\"'/]+")
+SPACE_RUN = re.compile(r"[ \t\r\n]+")
+
+Container = Union[Dict[str, Any], List[Any]]
+Path = Tuple[Union[str, int], ...]
+
+@dataclass
+class _Frame:
+    container: Container
+    path: Optional[Path]  # None for a container that could not be attached
+    expect: str  # dict: key, colon, value or comma; list: value or comma
+    key: Optional[str] = None
+    after_comma: bool = False
+
+def _number(token: str) -> Union[int, float, None]:
+    try:
+        return int(token)
+    except ValueError:
+        pass
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+class JSONStreamParser:
+    """Parse JSON while it arrives, tolerating the mistakes language models make.
+
+    Text before the first "{" or "[" (prose, a ```json fence) and after the
+    top-level value closes is ignored. Containers are attached to their parent
+    as soon as they open, so `value` is a usable partial result at any point,
+    and on_close(container, path) is called the moment one is complete.
+
+    Repaired along the way, each counted in `repairs`: trailing and missing
+    commas, missing colons, single-quoted strings, unquoted keys and words,
+    Python literals, unescaped quotes and raw newlines inside strings,
+    comments, and mismatched closing brackets. finish() closes whatever is
+    still open, drops a half-written string or key, and sets `truncated`.
+    """
+
+    def __init__(self, on_close: Optional[Callable[[Container, Path], None]] = None):
+        self.on_close = on_close
+        self.value: Any = None
+        self.started = False
+        self.done = False
+        self.truncated = False
+        self.repairs = 0
+        self._stack: List[_Frame] = []
+        self._closed: Dict[int, Container] = {}  # id -> container, which also keeps the id from being reused
+        self._token: Optional[str] = None  # "string" or "bare" while one is being read
+        self._buf: List[str] = []
+        self._quote = '"'
+        self._escape: Optional[str] = None  # "" right after a backslash, "uXXXX" while reading one
+        self._quote_seen = False  # a closing quote that may turn out to be part of the string
+        self._pending_space: List[str] = []
+        self._comment: Optional[str] = None
+
+    def complete(self, container: Any) -> bool:
+        """Whether a container from `value` was closed by the input itself"""
+        return id(container) in self._closed
+
+    def feed(self, text: str) -> None:
+        i, n = 0, len(text)
+        while i < n and not self.done:
+            if not self.started:
+                match = START.search(text, i)
+                if match is None:
+                    return
+                i = match.start()
+            elif self._token == "string" and self._escape is None and not self._quote_seen:
+                match = STRING_RUNS[self._quote].match(text, i)
+                if match:
+                    self._buf.append(match.group())
+                    i = match.end()
+                    continue
+            elif self._token == "bare":
+                match = BARE_RUN.match(text, i)
+                if match:
+                    self._buf.append(match.group())
+                    i = match.end()
+                    continue
+            elif self._token is None and self._comment is None:
+                match = SPACE_RUN.match(text, i)
+                if match:
+                    i = match.end()
+                    continue
+            self._step(text[i])
+            i += 1
+
+    def finish(self) -> Any:
+        """End of input: close what is still open and return the value"""
+        if self._token == "string":
+            if self._quote_seen:
+                self._end_string()
+            else:
+                self._token, self._buf = None, []
+                self.repairs += 1
+        elif self._token == "bare":
+            self._end_bare()
+        if not self.started:
+            raise ValueError("No JSON object or array found")
+        while self._stack:
+            # Left open by the input, so not recorded as complete
+            self._stack.pop()
+            self.truncated = True
+        self.done = True
+        return self.value
+
+    def _step(self, ch: str) -> None:
+        if self._token == "string":
+            self._string_char(ch)
+            return
+        if self._comment is not None:
+            self._comment_char(ch)
+            return
+        if self._token == "bare":
+            if ch not in DELIMITERS:
+                self._buf.append(ch)
+                return
+            self._end_bare()
+        if ch in WHITESPACE:
+            return
+        if ch == "/":
+            self._comment = "/"
+        elif ch in "\"'":
+            self._token, self._quote, self._buf = "string", ch, []
+            if ch == "'":
+                self.repairs += 1
+        elif ch in "{[":
+            self._open({} if ch == "{" else [])
+        elif ch in "}]":
+            self._close(ch)
+        elif ch == ",":
+            self._comma()
+        elif ch == ":":
+            self._colon()
+        else:
+            self._token, self._buf = "bare", [ch]
+
+    def _string_char(self, ch: str) -> None:
+        if self._quote_seen:
+            if ch in WHITESPACE:
+                self._pending_space.append(ch)
+                return
+            if ch in ",:}]\"'{[/":
+                self._end_string()
+                self._step(ch)
+                return
+            # The quote was part of the text, as in 27" Monitor
+            self._buf.append(self._quote + "".join(self._pending_space) + ch)
+            self._quote_seen, self._pending_space = False, []
+            self.repairs += 1
+            return
+        if self._escape is not None:
+            if self._escape == "":
+                if ch == "u":
+                    self._escape = "u"
+                    return
+                self._buf.append(ESCAPES.get(ch, ch))
+                self._escape = None
+                return
+            self._escape += ch
+            if len(self._escape) == 5:
+                try:
+                    self._buf.append(chr(int(self._escape[1:], 16)))
+                except ValueError:
+                    self._buf.append("\\" + self._escape)
+                    self.repairs += 1
+                self._escape = None
+            return
+        if ch == "\\":
+            self._escape = ""
+        elif ch == self._quote:
+            self._quote_seen = True
+        else:
+            self._buf.append(ch)
+
+    def _comment_char(self, ch: str) -> None:
+        if self._comment == "/":
+            if ch in "/*":
+                self._comment = "line" if ch == "/" else "block"
+                self.repairs += 1
+                return
+            # A lone slash starts a word
+            self._comment, self._token, self._buf = None, "bare", ["/"]
+            self._step(ch)
+        elif self._comment == "line":
+            if ch == "\n":
+                self._comment = None
+        elif self._comment == "block":
+            if ch == "*":
+                self._comment = "block*"
+        elif self._comment == "block*":
+            self._comment = None if ch == "/" else ("block*" if ch == "*" else "block")
+
+    def _end_string(self) -> None:
+        text = "".join(self._buf)
+        if any("\ud800" <= c <= "\udfff" for c in text):
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        self._token, self._buf = None, []
+        self._quote_seen, self._pending_space = False, []
+        self._add(text, is_string=True)
+
+    def _end_bare(self) -> None:
+        token = "".join(self._buf)
+        self._token, self._buf = None, []
+        if token in LITERALS:
+            value: Any = LITERALS[token]
+            if token[0].isupper():
+                self.repairs += 1
+        else:
+            value = _number(token)
+            if value is None:
+                value = token
+                self.repairs += 1
+        self._add(value, is_string=isinstance(value, str))
+
+    def _add(self, value: Any, is_string: bool = False) -> Optional[Path]:
+        """Place a finished value in the current container; returns its path if it was kept"""
+        if not self._stack:
+            return ()
+        frame = self._stack[-1]
+        container = frame.container
+        if isinstance(container, list):
+            if frame.expect == "comma":
+                self.repairs += 1  # missing comma
+            container.append(value)
+            frame.expect, frame.after_comma = "comma", False
+            return None if frame.path is None else frame.path + (len(container) - 1,)
+
+        if frame.expect == "comma":
+            self.repairs += 1  # missing comma
+            frame.expect = "key"
+        if frame.expect == "key":
+            if is_string or isinstance(value, (int, float, bool)) or value is None:
+                frame.key, frame.expect, frame.after_comma = str(value), "colon", False
+                return None
+            self.repairs += 1  # a container where a key belongs; read it and drop it
+            return None
+        if frame.expect == "colon":
+            self.repairs += 1  # missing colon
+        container[frame.key] = value
+        path = None if frame.path is None else frame.path + (frame.key,)
+        frame.key, frame.expect = None, "comma"
+        return path
+
+    def _open(self, container: Container) -> None:
+        if not self.started:
+            self.started, self.value = True, container
+            path: Optional[Path] = ()
+        else:
+            path = self._add(container)
+        expect = "key" if isinstance(container, dict) else "value"
+        self._stack.append(_Frame(container, path, expect))
+
+    def _close(self, ch: str) -> None:
+        wanted = dict if ch == "}" else list
+        if not isinstance(self._stack[-1].container, wanted):
+            if not any(isinstance(frame.container, wanted) for frame in self._stack):
+                self.repairs += 1  # a stray bracket
+                return
+            while not isinstance(self._stack[-1].container, wanted):
+                self.repairs += 1  # the inner containers were never closed
+                self._pop()
+        frame = self._stack[-1]
+        if frame.after_comma or (isinstance(frame.container, dict) and frame.expect in ("colon", "value")):
+            self.repairs += 1  # trailing comma, or a key without a value
+        self._pop()
+
+    def _pop(self) -> None:
+        frame = self._stack.pop()
+        self._closed[id(frame.container)] = frame.container
+        if self.on_close is not None and frame.path is not None:
+            self.on_close(frame.container, frame.path)
+        if not self._stack:
+            self.done = True
+
+    def _comma(self) -> None:
+        frame = self._stack[-1]
+        if isinstance(frame.container, list):
+            if frame.expect == "value":
+                self.repairs += 1  # an empty element
+            frame.expect = "value"
+        else:
+            if frame.expect != "comma":
+                self.repairs += 1
+            frame.key, frame.expect = None, "key"
+        frame.after_comma = True
+
+    def _colon(self) -> None:
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict) and frame.expect == "colon":
+            frame.expect = "value"
+        else:
+            self.repairs += 1  # a stray colon
+
+def prune_incomplete(value: Any, parser: JSONStreamParser) -> Any:
+    """Drop arrays that were cut off inside an array, such as a half-written table row"""
+    if isinstance(value, dict):
+        for inner in value.values():
+            prune_incomplete(inner, parser)
+    elif isinstance(value, list):
+        value[:] = [inner for inner in value
+                    if not (isinstance(inner, list) and not parser.complete(inner))]
+        for inner in value:
+            prune_incomplete(inner, parser)
+    return value
@@ -0,0 +1,230 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Timings collected while handling the current request, rendered as the
+# Server-Timing header. Unset outside a request, e.g. in background jobs.
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+INF_BUCKET = 'le="+Inf"'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, snapshots: Optional[Sequence[List[list]]] = None) -> List[str]:
+        """This process's values, or with snapshots the sum of those"""
+        if snapshots is None:
+            with self._lock:
+                values = dict(self._values)
+        else:
+            values = {}
+            for snapshot in snapshots:
+                for key, value in snapshot:
+                    values[tuple(key)] = values.get(tuple(key), 0) + value
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._values.items()]
+
+    def render(self, snapshots: Optional[Sequence[List[list]]] = None) -> List[str]:
+        """This process's values, or with snapshots the sum of those"""
+        if snapshots is None:
+            with self._lock:
+                values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        else:
+            values = {}
+            for snapshot in snapshots:
+                for key, counts, total, count in snapshot:
+                    summed = values.get(tuple(key), ([0] * len(self.buckets), 0.0, 0))
+                    values[tuple(key)] = ([a + b for a, b in zip(summed[0], counts)],
+                                          summed[1] + total, summed[2] + count)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _labels(self.labelnames, key, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, INF_BUCKET)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    """The process's metrics, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots: Optional[Sequence[Dict[str, List[list]]]] = None) -> str:
+        """This process's metrics, or with snapshots (from snapshot()) their sum"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render(None if snapshots is None else
+                                       [snapshot.get(metric.name, []) for snapshot in snapshots]))
+        return "\n".join(lines) + "\n"
+
+class SharedMetrics:
+    """Metrics summed over the web workers of one deployment.
+
+    Each worker writes its snapshot to a file of its own in a shared
+    directory, every few seconds and whenever it renders; rendering sums
+    every file there. Files of workers that exited are kept, so totals do
+    not go backwards when gunicorn replaces a worker; gunicorn.conf.py
+    empties the directory when the deployment starts.
+    """
+
+    def __init__(self, registry: Registry, directory: str):
+        self.registry = registry
+        self.directory = directory
+        # Not the pid alone: a replacement worker may be given a pid that was used before
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+
+    def publish(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        partial = self.path + ".tmp"
+        with open(partial, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(partial, self.path)
+
+    def render(self) -> str:
+        self.publish()
+        snapshots: List[Dict[str, Any]] = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics file {name}: {e}")
+        return self.registry.render(snapshots)
+
+    async def run(self, interval: float) -> None:
+        """Publish until cancelled, and once more then so the final counts are kept"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.publish)
+        finally:
+            self.publish()
+
+REGISTRY = Registry()
+
+DOCUMENTS = REGISTRY.counter(
+    "pdf_extractor_documents_total", "Documents processed, by outcome", ["outcome"])
+PAGES = REGISTRY.counter(
+    "pdf_extractor_pages_total", "Pages read, by where their text came from", ["source"])
+UPLOAD_BYTES = REGISTRY.counter(
+    "pdf_extractor_document_bytes_total", "Bytes of PDF processed")
+LLM_TOKENS = REGISTRY.counter(
+    "pdf_extractor_llm_tokens_total", "Gemini tokens, prompt and output", ["kind"])
+DOCUMENT_TOKENS = REGISTRY.counter(
+    "pdf_extractor_document_tokens_total",
+    "Estimated tokens of the document text bound for Gemini, before (raw) and after compaction", ["kind"])
+CACHE_LOOKUPS = REGISTRY.counter(
+    "pdf_extractor_cache_lookups_total", "Result cache lookups, by result", ["result"])
+FINGERPRINT_LOOKUPS = REGISTRY.counter(
+    "pdf_extractor_fingerprint_lookups_total", "Fingerprint index lookups: exact, near or miss", ["result"])
+RECONCILIATIONS = REGISTRY.counter(
+    "pdf_extractor_reconciliations_total",
+    "Documents whose numbers were checked: reconciled, failed, reextracted or fixed", ["result"])
+ERRORS = REGISTRY.counter(
+    "pdf_extractor_errors_total", "Errors, by type", ["type"])
+SPAN_SECONDS = REGISTRY.histogram(
+    "pdf_extractor_span_seconds", "Duration of pipeline stages and the steps inside them", ["span"])
+PAGE_SECONDS = REGISTRY.histogram(
+    "pdf_extractor_page_seconds", "Time to read one page, by text layer or OCR", ["source"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+def record_span(name: str, seconds: float) -> None:
+    """Feed a finished span to its histogram and to the current request's Server-Timing"""
+    SPAN_SECONDS.observe(seconds, span=name)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value; spans repeated across a batch are summed"""
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
@@ -1,20 +1,162 @@
-import pytesseract
-from PIL import Image
-from typing import List
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 import logging
 
+from .pdf_processor import PDFProcessor
+from .workers import WorkerPool
+
+# pytesseract is imported where used, so the API process never loads it
+if TYPE_CHECKING:
+    from PIL import Image
+
 logger = logging.getLogger(__name__)
 
-class OCRService:
-    def extract_text_from_images(self, images: List[Image.Image]) -> str:
-        """Extract text from images using OCR"""
-        text = ""
+# Resolutions tried in order when recognition confidence is too low
+DPI_STEPS = (150, 200, 300)
+PROBE_DPI = 72
+# Long side in pixels to aim for; a US letter page lands on 200 DPI
+TARGET_LONG_SIDE_PX = 2200
+# Share of dark pixels below which a page is treated as blank
+BLANK_INK_RATIO = 0.001
+# Probe confidence at which the text is large enough for the lowest step
+CLEAR_PROBE_CONFIDENCE = 85
+
+def check_tesseract() -> None:
+    """Find the tesseract binary once, when a worker starts, instead of on the first scanned page"""
+    import pytesseract
+
+    try:
+        logger.debug(f"tesseract {pytesseract.get_tesseract_version()}")
+    except Exception as e:
+        logger.warning(f"tesseract is not available, scanned pages will fail: {e}")
+
+def has_usable_text(page_text: str, min_chars: int = 20) -> bool:
+    """Whether a page's text layer is worth keeping instead of running OCR"""
+    return sum(1 for c in page_text if c.isalnum()) >= min_chars
+
+def recognise(image: "Image.Image") -> Tuple[str, float]:
+    """OCR an image, returning its text and the mean word confidence (0-100)"""
+    import pytesseract
+
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if not word.strip() or confidence < 0:
+            continue
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+        confidences.append(confidence)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+def ink_ratio(image: "Image.Image") -> float:
+    histogram = image.convert("L").histogram()
+    return sum(histogram[:128]) / max(1, sum(histogram))
+
+def choose_dpi(width_pt: float, height_pt: float, probe_confidence: float) -> int:
+    """Starting resolution from page size, lowered when the probe already reads the page well"""
+    long_side_in = max(width_pt, height_pt) / 72
+    wanted = TARGET_LONG_SIDE_PX / long_side_in if long_side_in else DPI_STEPS[-1]
+    dpi = next((step for step in DPI_STEPS if step >= wanted), DPI_STEPS[-1])
+    if probe_confidence >= CLEAR_PROBE_CONFIDENCE:
+        dpi = DPI_STEPS[0]
+    return dpi
+
+def ocr_page_adaptive(pdf_path: str, page_number: int, width_pt: float, height_pt: float,
+                      min_confidence: float = 70, max_dpi: int = 300) -> Dict[str, Any]:
+    """OCR one page at the lowest resolution that reads it confidently.
+
+    A low-resolution probe detects blank pages and large, clean text. OCR then
+    starts at a DPI picked from the page size and only escalates towards
+    max_dpi while confidence stays under min_confidence. Runs in a worker
+    process.
+    """
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    start = time.perf_counter()
+    processor = PDFProcessor()
+
+    probe = processor.render_page(pdf_path, page_number, dpi=PROBE_DPI)
+    if probe is None:
+        blank = True
+    else:
+        try:
+            blank = ink_ratio(probe) < BLANK_INK_RATIO
+            if not blank:
+                _, probe_confidence = recognise(probe)
+        finally:
+            probe.close()
+    if blank:
+        return {"page": page_number, "text": "", "source": "blank", "dpi": PROBE_DPI,
+                "confidence": None, "seconds": round(time.perf_counter() - start, 3)}
+
+    dpi = min(choose_dpi(width_pt, height_pt, probe_confidence), max_dpi)
+    best_text, best_confidence, best_dpi = "", -1.0, dpi
+    for step in [dpi] + [s for s in DPI_STEPS if dpi < s <= max_dpi]:
+        image = processor.render_page(pdf_path, page_number, dpi=step)
+        if image is None:
+            break
         try:
-            for i, image in enumerate(images):
-                logger.info(f"Running OCR on page {i+1}")
-                page_text = pytesseract.image_to_string(image)
-                text += page_text + "\n"
-            return text
-        except Exception as e:
-            logger.error(f"OCR error: {str(e)}")
-            return ""
\ No newline at end of file
+            text, confidence = recognise(image)
+        finally:
+            image.close()
+        if confidence > best_confidence:
+            best_text, best_confidence, best_dpi = text, confidence, step
+        if confidence >= min_confidence:
+            break
+
+    return {"page": page_number, "text": best_text, "source": "ocr", "dpi": best_dpi,
+            "confidence": round(best_confidence, 1), "seconds": round(time.perf_counter() - start, 3)}
+
+class OCRService:
+    """OCR of the pages a document's text layer is missing, in the shared parse pool"""
+
+    def __init__(self, worker_pool: WorkerPool):
+        self.worker_pool = worker_pool
+
+    async def fill_missing_pages(self, pdf_path: str, pages: List[Dict[str, Any]],
+                                 min_text_chars: int = 20, min_confidence: float = 70,
+                                 max_dpi: int = 300, on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                 ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Combine the text layer with OCR of only the pages that lack one.
+
+        pages comes from text_layer.extract_pages(). Pages with usable text are
+        never rasterised; the others are OCRed by ocr_page_adaptive(), each
+        submitted to the worker pool on its own, so they count against its
+        queue limit and a page that fails leaves the others alone. Returns the
+        text of every page in order and a per-page report of the source,
+        chosen DPI, confidence and timing. on_page is called with each OCR
+        result as soon as it is ready.
+        """
+        report: List[Optional[Dict[str, Any]]] = []
+        missing = []
+        # pages may be a selection of the document's pages, so results are placed by page number
+        position = {page["page"]: i for i, page in enumerate(pages)}
+        for page in pages:
+            if has_usable_text(page["text"], min_text_chars):
+                report.append({"page": page["page"], "text": page["text"], "source": "text_layer",
+                               "dpi": None, "confidence": None, "seconds": page["seconds"]})
+            else:
+                missing.append(page)
+                report.append(None)
+
+        async def ocr(page: Dict[str, Any]) -> None:
+            try:
+                result = await self.worker_pool.run(ocr_page_adaptive, pdf_path, page["page"], page["width"],
+                                                    page["height"], min_confidence, max_dpi)
+            except Exception as e:
+                logger.error(f"OCR of page {page['page']} failed: {e}")
+                result = {"page": page["page"], "text": page["text"], "source": "ocr_failed",
+                          "dpi": None, "confidence": None, "seconds": page["seconds"]}
+            report[position[page["page"]]] = result
+            if on_page:
+                on_page(result)
+
+        if missing:
+            logger.info(f"Running OCR on {len(missing)} of {len(pages)} pages")
+            await asyncio.gather(*(ocr(page) for page in missing))
+
+        page_texts = [entry.pop("text") for entry in report]
+        return page_texts, report
@@ -0,0 +1,307 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+# Every parser, PyPDF2 included, is imported on first use: they run in worker processes
+if TYPE_CHECKING:
+    import PyPDF2
+
+logger = logging.getLogger(__name__)
+
+Fragment = Tuple[float, float, float, str]  # x, y, font size, text
+
+# In auto mode, files larger than this go to the first of FAST_BACKENDS installed
+LARGE_BYTES = 256 * 1024
+FAST_BACKENDS = ("pypdfium2", "pypdf2")
+RUN_SEPARATOR = re.compile(r"[ \r\n]")
+
+@dataclass
+class PageText:
+    """One page of a PDF's text layer; fragments only when positions were asked for"""
+
+    number: int  # 1-based
+    text: str
+    width: float  # points
+    height: float
+    fragments: Optional[List[Fragment]] = None
+
+def group_lines(fragments: List[Fragment]) -> List[List[Fragment]]:
+    """Group fragments sharing a baseline into lines, top of the page first"""
+    lines: List[List[Fragment]] = []
+    for fragment in sorted(fragments, key=lambda f: (-f[1], f[0])):
+        if lines and abs(lines[-1][0][1] - fragment[1]) <= fragment[2] * 0.3:
+            lines[-1].append(fragment)
+        else:
+            lines.append([fragment])
+    return [sorted(line, key=lambda f: f[0]) for line in lines]
+
+def lines_text(fragments: List[Fragment]) -> str:
+    """Page text rebuilt from positions: one line per baseline, runs left to right"""
+    return "\n".join(" ".join(fragment[3] for fragment in line) for line in group_lines(fragments))
+
+class LazyPDF(ABC):
+    """An open PDF whose pages are parsed only when asked for, by 1-based number"""
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    @abstractmethod
+    def page(self, number: int, positions: bool = False) -> PageText: ...
+
+    @abstractmethod
+    def close(self) -> None: ...
+
+    def __enter__(self) -> "LazyPDF":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class PDFBackend(ABC):
+    """A way of reading a PDF's text layer.
+
+    open() parses no page until it is asked for, so reading a few pages of
+    a long document costs a few pages. Fragment coordinates are PDF points
+    with the origin at the bottom left, whichever backend produced them.
+    Backends run inside worker processes, so they are looked up by name.
+    """
+
+    name = "backend"
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    @abstractmethod
+    def open(self, pdf_path: str) -> LazyPDF: ...
+
+    def iter_pages(self, pdf_path: str, positions: bool = False,
+                   numbers: Optional[Sequence[int]] = None) -> Iterator[PageText]:
+        """The given pages, or every page, one at a time so memory follows the largest page"""
+        with self.open(pdf_path) as pdf:
+            for number in numbers if numbers is not None else range(1, len(pdf) + 1):
+                yield pdf.page(number, positions)
+
+class PyPDF2Backend(PDFBackend):
+    """Pure Python; the reference text that templates and fingerprints were built on"""
+
+    name = "pypdf2"
+
+    def open(self, pdf_path: str) -> LazyPDF:
+        return PyPDF2File(pdf_path)
+
+class PyPDF2File(LazyPDF):
+    """PyPDF2 reads objects from the file as they are used; only the page tree is read up front"""
+
+    def __init__(self, pdf_path: str):
+        import PyPDF2
+
+        self._file = open(pdf_path, "rb")
+        try:
+            self._reader = PyPDF2.PdfReader(self._file)
+            self._count = len(self._reader.pages)
+        except Exception:
+            self._file.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def page(self, number: int, positions: bool = False) -> PageText:
+        page = self._reader.pages[number - 1]
+        text, fragments = read_page(page, positions)
+        return PageText(number, text, float(page.mediabox.width), float(page.mediabox.height), fragments)
+
+    def close(self) -> None:
+        self._file.close()
+
+def read_page(page: "PyPDF2.PageObject", positions: bool = False) -> Tuple[str, Optional[List[Fragment]]]:
+    """Text of a PyPDF2 page and, in the same pass, its text runs with baseline position and font size"""
+    if not positions:
+        return page.extract_text() or "", None
+    fragments: List[Fragment] = []
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        text = text.strip()
+        if not text:
+            return
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        size = (font_size or 10) * (abs(tm[0] * cm[0]) or 1)
+        fragments.append((x, y, size, text))
+
+    return page.extract_text(visitor_text=visitor) or "", fragments
+
+class PdfiumBackend(PDFBackend):
+    """PDFium through pypdfium2: C++, several times faster than PyPDF2 on long documents"""
+
+    name = "pypdfium2"
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import pypdfium2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def open(self, pdf_path: str) -> LazyPDF:
+        return PdfiumFile(pdf_path)
+
+class PdfiumFile(LazyPDF):
+    def __init__(self, pdf_path: str):
+        import pypdfium2
+
+        self._pdf = pypdfium2.PdfDocument(pdf_path)
+
+    def __len__(self) -> int:
+        return len(self._pdf)
+
+    def page(self, number: int, positions: bool = False) -> PageText:
+        page = self._pdf[number - 1]
+        textpage = page.get_textpage()
+        try:
+            width, height = page.get_size()
+            # Character indexes line up with the raw text, so positions are read before \r\n is replaced
+            text = textpage.get_text_range()
+            fragments = pdfium_fragments(textpage, text) if positions else None
+            return PageText(number, text.replace("\r\n", "\n"), float(width), float(height), fragments)
+        finally:
+            textpage.close()
+            page.close()
+
+    def close(self) -> None:
+        self._pdf.close()
+
+def pdfium_fragments(textpage, text: str) -> List[Fragment]:
+    """Text runs of a pypdfium2 text page, placed at their first character's baseline and font size.
+
+    PDFium marks the spaces and line breaks it inserted between separately
+    drawn runs as generated, so runs are split there and nowhere else; a
+    run keeps its own spaces. Only separators and run starts cost a call
+    into PDFium, not every character.
+    """
+    import ctypes
+    import pypdfium2.raw as pdfium_c
+
+    fragments: List[Fragment] = []
+    x, y = ctypes.c_double(), ctypes.c_double()
+    if textpage.count_chars() != len(text):
+        # Characters outside the BMP take two indexes in PDFium; place runs by their text rects instead
+        for i in range(textpage.count_rects()):
+            left, bottom, right, top = textpage.get_rect(i)
+            run = textpage.get_text_bounded(left, bottom, right, top).strip()
+            if run:
+                fragments.append((left, bottom, top - bottom, run))
+        return fragments
+
+    def add(start: int, end: int) -> None:
+        run = text[start:end]
+        stripped = run.lstrip()
+        if not stripped:
+            return
+        first = start + len(run) - len(stripped)
+        pdfium_c.FPDFText_GetCharOrigin(textpage, first, x, y)
+        fragments.append((x.value, y.value, pdfium_c.FPDFText_GetFontSize(textpage, first), stripped.rstrip()))
+
+    start = 0
+    for separator in RUN_SEPARATOR.finditer(text):
+        i = separator.start()
+        if separator.group() != " " or pdfium_c.FPDFText_IsGenerated(textpage, i) == 1:
+            add(start, i)
+            start = i + 1
+    add(start, len(text))
+    return fragments
+
+class PdfminerBackend(PDFBackend):
+    """pdfminer.six layout analysis: slow, but groups text into lines and columns the most reliably.
+
+    Page text is rebuilt from the analysed lines, so table rows stay on one line.
+    """
+
+    name = "pdfminer"
+
+    @classmethod
+    def available(cls) -> bool:
+        try:
+            import pdfminer  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def open(self, pdf_path: str) -> LazyPDF:
+        return PdfminerFile(pdf_path)
+
+class PdfminerFile(LazyPDF):
+    def __init__(self, pdf_path: str):
+        from pdfminer.converter import PDFPageAggregator
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+
+        self._file = open(pdf_path, "rb")
+        try:
+            # Page objects only; their content streams are interpreted in page()
+            self._pages = list(PDFPage.get_pages(self._file))
+        except Exception:
+            self._file.close()
+            raise
+        # At the default char_margin of 2, table cells a few points apart merge into one run
+        self._device = PDFPageAggregator(PDFResourceManager(), laparams=LAParams(char_margin=1.0))
+        self._interpreter = PDFPageInterpreter(self._device.rsrcmgr, self._device)
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def page(self, number: int, positions: bool = False) -> PageText:
+        from pdfminer.layout import LTChar, LTTextContainer, LTTextLine
+
+        self._interpreter.process_page(self._pages[number - 1])
+        layout = self._device.get_result()
+        fragments: List[Fragment] = []
+        for element in layout:
+            if not isinstance(element, LTTextContainer):
+                continue
+            for line in element:
+                run = line.get_text().strip() if isinstance(line, LTTextLine) else ""
+                first = next((char for char in line if isinstance(char, LTChar)), None) if run else None
+                if first is not None:
+                    # The first character's text matrix gives the baseline and font size
+                    fragments.append((first.x0, first.matrix[5], first.size, run))
+        return PageText(number, lines_text(fragments), float(layout.width), float(layout.height),
+                        fragments if positions else None)
+
+    def close(self) -> None:
+        self._file.close()
+
+BACKENDS: Dict[str, PDFBackend] = {
+    backend.name: backend for backend in (PyPDF2Backend(), PdfiumBackend(), PdfminerBackend())
+}
+
+def available_backends() -> List[str]:
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+def get_backend(name: str) -> PDFBackend:
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown PDF backend {name!r}; use auto or one of {', '.join(BACKENDS)}")
+    if not backend.available():
+        raise ValueError(f"PDF backend {name!r} is not installed")
+    return backend
+
+def choose_backend(pdf_path: str, preference: str = "auto", large_bytes: int = LARGE_BYTES) -> PDFBackend:
+    """The backend named by preference, or in auto mode one picked by file size.
+
+    Small files stay on PyPDF2: the LLM call dominates their latency, and
+    their text matches what learned templates and fingerprints were built
+    from. Files over large_bytes, where parsing is the main cost, go to the
+    fastest backend installed.
+    """
+    if preference != "auto":
+        return get_backend(preference)
+    if os.path.getsize(pdf_path) <= large_bytes:
+        return BACKENDS["pypdf2"]
+    return next(BACKENDS[name] for name in FAST_BACKENDS if BACKENDS[name].available())
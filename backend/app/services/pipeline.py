@@ -0,0 +1,736 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+from .cache import ResultCache
+from .chunking import CHARS_PER_TOKEN, estimate_tokens
+from .compaction import compact_pages
+from .extraction import (error_result, extract_tables_chunked, extract_tables_packed, pack_documents, parse_amount,
+                         reextract_table, table_text)
+from .fingerprint import Fingerprint, FingerprintIndex, table_layout
+from .gemini_client import GeminiClient
+from .jobs import JobStatus
+from .metrics import (CACHE_LOOKUPS, DOCUMENTS, DOCUMENT_TOKENS, ERRORS, FINGERPRINT_LOOKUPS, PAGE_SECONDS, PAGES, RECONCILIATIONS,
+                      UPLOAD_BYTES, record_span)
+from .ocr_service import OCRService, has_usable_text
+from .pdf_backends import LARGE_BYTES, choose_backend, get_backend
+from .reconcile import describe_problems, problem_count, reconcile
+from .table_extractor import LocalExtractionStats, extract_layout_tables
+from .templates import TemplateRegistry, extract_with_templates, learn_from_pdf, vendor_key, vendor_name
+from .text_layer import PageSelection, extract_page_selection, extract_pages, join_pages
+from .workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b"%PDF-"
+PAGE_MODES = ("all", "budget")
+
+class DocumentError(Exception):
+    """The document cannot be processed; its remaining stages are skipped"""
+
+@dataclass
+class Document:
+    """One PDF on its way through the engine, and everything stages learned about it"""
+
+    pdf_path: str
+    filename: str
+    sha256: Optional[str] = None
+    on_status: Optional[Callable[[str], None]] = None
+    on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None  # progress, for streaming clients
+    pages: Optional[List[Dict[str, Any]]] = None  # per-page report
+    page_texts: List[str] = field(default_factory=list)
+    parser: str = "auto"  # the PDF backend every stage reads this document with, see pdf_backends
+    page_mode: Optional[str] = None  # "all" or "budget"; None uses the engine's default
+    page_selection: Optional[PageSelection] = None  # set by the engine in budget mode
+    page_count: Optional[int] = None  # pages in the PDF, read or not
+    data: Optional[Dict[str, Any]] = None
+    success: bool = True
+    cached: bool = False
+    cacheable: bool = True
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)  # stage name -> milliseconds
+    fingerprint: Optional[Fingerprint] = None
+    match: Optional[Dict[str, Any]] = None  # how a previously seen document matched this one
+    layout: Optional[List[Dict[str, Any]]] = None  # table layout of a near-duplicate, a prompt hint
+    prompt_pages: Optional[List[str]] = None  # compacted page texts, for documents sent to the LLM
+    prompt_tokens: Optional[Dict[str, int]] = None  # estimated text tokens, raw and as sent
+
+    @property
+    def text(self) -> str:
+        return join_pages(self.page_texts)
+
+    @property
+    def prompt_text(self) -> str:
+        """The text the LLM is given: the compacted pages when there are some"""
+        return join_pages(self.prompt_pages) if self.prompt_pages is not None else self.text
+
+    @property
+    def partial(self) -> bool:
+        """Whether only some of the document's pages were read"""
+        return self.page_count is not None and self.pages is not None and len(self.pages) < self.page_count
+
+    @property
+    def page_numbers(self) -> Optional[List[int]]:
+        """The pages that were read when that is not all of them, for the stages that reopen the PDF"""
+        return [page["page"] for page in self.pages] if self.partial else None
+
+    @property
+    def reusable(self) -> bool:
+        """Whether the result may be served for other uploads; failed, cut-off and unreconciled results are retried instead"""
+        return (self.error is None and self.cacheable and self.success and self.data is not None
+                and "error" not in self.data and not self.data.get("truncated")
+                and not (self.data.get("validation") or {}).get("failed_tables"))
+
+    def cache_key(self, version: str) -> str:
+        if self.page_selection is not None:
+            version = f"{version}:{self.page_selection.key}"
+        return ResultCache.make_key(self.sha256, version)
+
+    def set_status(self, status: str) -> None:
+        if self.on_status:
+            self.on_status(status)
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        if self.on_event:
+            self.on_event(event, data)
+
+    def response(self) -> Dict[str, Any]:
+        """The per-document payload returned by the API"""
+        if self.error is not None:
+            return {"success": False, "filename": self.filename, "data": error_result(self.error),
+                    "timings": self.timings}
+        response = {"success": self.success, "filename": self.filename, "data": self.data,
+                    "cached": self.cached}
+        if self.match is not None:
+            response["match"] = self.match
+        if self.pages is not None:
+            response["pages"] = self.pages
+        if self.partial:
+            response["page_count"] = self.page_count
+        if self.prompt_tokens is not None:
+            response["prompt_tokens"] = self.prompt_tokens
+        response["timings"] = self.timings
+        return response
+
+def _elapsed_ms(started: float) -> float:
+    return round(1000 * (time.perf_counter() - started), 1)
+
+class Stage(ABC):
+    """A step of the extraction engine.
+
+    Stages read and update the Document in place. run() handles one
+    document; run_many() handles a batch and may return batch-level counters,
+    which lets a stage share work across documents. Raising DocumentError
+    marks the document failed without affecting the rest of the batch.
+    """
+
+    name = "stage"
+
+    @abstractmethod
+    async def run(self, doc: Document) -> None: ...
+
+    async def run_many(self, docs: List[Document]) -> Optional[Dict[str, Any]]:
+        await asyncio.gather(*(self._timed(doc) for doc in docs))
+        return None
+
+    async def _timed(self, doc: Document) -> None:
+        started = time.perf_counter()
+        try:
+            await self.run(doc)
+        except DocumentError as e:
+            doc.error = str(e)
+            ERRORS.inc(type=f"{self.name}_failed")
+        finally:
+            doc.timings[self.name] = _elapsed_ms(started)
+            record_span(self.name, time.perf_counter() - started)
+
+class LoadStage(Stage):
+    """Reject files that are not PDFs before they reach the worker pool"""
+
+    name = "load"
+
+    async def run(self, doc: Document) -> None:
+        try:
+            with open(doc.pdf_path, "rb") as pdf_file:
+                header = pdf_file.read(1024)
+        except OSError as e:
+            raise DocumentError(f"Could not read PDF: {str(e)}")
+        if PDF_MAGIC not in header:
+            raise DocumentError("Could not read PDF: not a PDF file")
+        UPLOAD_BYTES.inc(os.path.getsize(doc.pdf_path))
+
+class TextLayerStage(Stage):
+    """Per-page embedded text, parsed in a worker process.
+
+    The PDF backend is chosen here, by file size in auto mode, and kept on
+    the document so the layout and template stages read the same text. A
+    document with a page selection has only the selected pages parsed.
+    """
+
+    name = "text_layer"
+
+    def __init__(self, worker_pool: WorkerPool, backend: str = "auto", large_bytes: int = LARGE_BYTES):
+        if backend != "auto":
+            get_backend(backend)  # an unknown or missing backend fails at startup, not per document
+        self.worker_pool = worker_pool
+        self.backend = backend
+        self.large_bytes = large_bytes
+
+    async def run(self, doc: Document) -> None:
+        try:
+            doc.parser = choose_backend(doc.pdf_path, self.backend, self.large_bytes).name
+            if doc.page_selection is None:
+                doc.pages = await self.worker_pool.run(extract_pages, doc.pdf_path, doc.parser)
+                doc.page_count = len(doc.pages)
+            else:
+                doc.page_count, doc.pages = await self.worker_pool.run(
+                    extract_page_selection, doc.pdf_path, doc.page_selection, doc.parser)
+        except Exception as e:
+            raise DocumentError(f"Could not read PDF: {str(e)}")
+        doc.page_texts = [page["text"] for page in doc.pages]
+        doc.emit("pages", {"count": doc.page_count, "read": [page["page"] for page in doc.pages]})
+        for page in doc.pages:
+            doc.emit("page", {"page": page["page"], "source": "text_layer", "chars": len(page["text"])})
+
+class OCRStage(Stage):
+    """OCR of only the pages without a usable text layer, at a DPI chosen per page"""
+
+    name = "ocr"
+
+    def __init__(self, ocr_service: OCRService, enabled: bool = True, min_text_chars: int = 20,
+                 min_confidence: float = 70, max_dpi: int = 300):
+        self.ocr_service = ocr_service
+        # With OCR disabled every page counts as usable, so none is rasterised
+        self.min_text_chars = min_text_chars if enabled else 0
+        self.min_confidence = min_confidence
+        self.max_dpi = max_dpi
+
+    async def run(self, doc: Document) -> None:
+        missing = [page["page"] for page in doc.pages if not has_usable_text(page["text"], self.min_text_chars)]
+        on_page = None
+        if missing:
+            doc.set_status(JobStatus.OCR)
+            doc.emit("ocr", {"pages": missing})
+
+            def on_page(page: Dict[str, Any]) -> None:
+                doc.emit("page", {
+                    "page": page["page"], "source": page["source"], "chars": len(page["text"]),
+                    "confidence": page["confidence"],
+                })
+
+        doc.page_texts, doc.pages = await self.ocr_service.fill_missing_pages(
+            doc.pdf_path,
+            doc.pages,
+            min_text_chars=self.min_text_chars,
+            min_confidence=self.min_confidence,
+            max_dpi=self.max_dpi,
+            on_page=on_page if doc.on_event else None,
+        )
+        for page in doc.pages:
+            PAGES.inc(source=page["source"])
+            PAGE_SECONDS.observe(page["seconds"], source=page["source"])
+
+class FingerprintStage(Stage):
+    """Look the document's text up in the fingerprint index.
+
+    A document whose normalized text was extracted before is answered with
+    that result from the cache. A near-duplicate, such as another invoice
+    from the same template, keeps the earlier table layout as a prompt hint.
+    Documents read only in part are not looked up or indexed.
+    """
+
+    name = "fingerprint"
+
+    def __init__(self, index: FingerprintIndex, cache: Optional[ResultCache] = None):
+        self.index = index
+        self.cache = cache
+
+    async def run(self, doc: Document) -> None:
+        if doc.partial:
+            return  # some pages' text would not match the whole document's
+        doc.fingerprint = await asyncio.to_thread(Fingerprint.of, doc.text)
+        if doc.fingerprint is None:
+            return
+        match = await asyncio.to_thread(self.index.lookup, doc.fingerprint)
+        if match is None:
+            FINGERPRINT_LOOKUPS.inc(result="miss")
+            return
+        if match.exact and match.result_key and self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, match.result_key)
+            if cached is not None:
+                FINGERPRINT_LOOKUPS.inc(result="exact")
+                doc.data, doc.cached = cached, True
+                doc.match = {"type": "exact", "similarity": 1.0}
+                return
+        FINGERPRINT_LOOKUPS.inc(result="near")
+        doc.match = {"type": "near", "similarity": match.similarity}
+        doc.layout = match.layout or None
+
+class StructureStage(Stage):
+    """Turn document text into the tables/summary schema.
+
+    Documents whose pages all came from the text layer are first tried with
+    the layout extractor, then with their vendor's learned templates; the
+    rest go to Gemini. In a batch, small documents
+    are packed into shared Gemini calls and long ones are chunked on their own.
+    With compact, the text sent to Gemini is first compacted, see compaction.
+    """
+
+    name = "structure"
+
+    def __init__(self, client: Optional[GeminiClient], worker_pool: WorkerPool,
+                 layout_enabled: bool = True, layout_min_confidence: float = 0.9,
+                 chunk_max_tokens: int = 2000, pack_max_chars: int = 12000, pack_max_docs: int = 8,
+                 templates: Optional[TemplateRegistry] = None, compact: bool = True):
+        self.client = client
+        self.worker_pool = worker_pool
+        self.layout_enabled = layout_enabled
+        self.layout_min_confidence = layout_min_confidence
+        self.chunk_max_tokens = chunk_max_tokens
+        self.pack_max_chars = pack_max_chars
+        self.pack_max_docs = pack_max_docs
+        self.templates = templates
+        self.compact = compact
+        self.stats = LocalExtractionStats()
+
+    async def run(self, doc: Document) -> None:
+        await self.run_many([doc])
+
+    async def run_many(self, docs: List[Document]) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        pending = []
+        for doc in docs:
+            if doc.data is not None:
+                continue
+            if not doc.text.strip():
+                doc.data = {"tables": [], "summary": None, "message": "No text found - might be scanned PDF"}
+                doc.success = doc.cacheable = False
+            else:
+                pending.append(doc)
+
+        local = await asyncio.gather(*(self.extract_locally(doc) for doc in pending))
+        pending = [doc for doc, served in zip(pending, local) if not served]
+
+        packs: List[Dict[str, str]] = []
+        if pending and self.client is None:
+            for doc in pending:
+                doc.data = {"tables": [], "summary": None, "message": "No API key configured",
+                            "text_preview": doc.text[:500]}
+                doc.cacheable = False
+        elif pending:
+            await asyncio.gather(*(self.compact_text(doc) for doc in pending))
+            packs = await self.extract_with_llm(pending)
+
+        for doc in docs:
+            doc.timings.setdefault(self.name, _elapsed_ms(started))
+            record_span(self.name, doc.timings[self.name] / 1000)
+        stats: Dict[str, Any] = {"llm_batches": len(packs)}
+        if packs or pending:
+            stats["prompt_tokens"] = {kind: sum(doc.prompt_tokens[kind] for doc in pending if doc.prompt_tokens)
+                                      for kind in ("raw", "sent")}
+        return stats
+
+    async def extract_locally(self, doc: Document) -> bool:
+        """Extraction without the LLM, used only at or above the confidence threshold"""
+        if any(page["source"] != "text_layer" for page in doc.pages):
+            return False
+        if self.layout_enabled and await self.extract_with_layout(doc):
+            return True
+        return self.templates is not None and await self.extract_with_template(doc)
+
+    async def extract_with_layout(self, doc: Document) -> bool:
+        started = time.perf_counter()
+        try:
+            data = await self.worker_pool.run(extract_layout_tables, doc.pdf_path, doc.parser, doc.page_numbers)
+        except Exception as e:
+            logger.warning(f"Layout extraction of {doc.filename} failed: {e}")
+            return False
+        if data is None or data["confidence"] < self.layout_min_confidence:
+            return False
+        self.stats.record(True, time.perf_counter() - started)
+        doc.data = data
+        doc.timings[self.name] = _elapsed_ms(started)
+        for table in data["tables"]:
+            doc.emit("table", table)
+        return True
+
+    async def extract_with_template(self, doc: Document) -> bool:
+        vendor = vendor_key(doc.text)
+        templates = await asyncio.to_thread(self.templates.find, vendor) if vendor else []
+        if not templates:
+            return False
+        started = time.perf_counter()
+        try:
+            data = await self.worker_pool.run(extract_with_templates, doc.pdf_path, templates,
+                                              self.layout_min_confidence, doc.parser, doc.page_numbers)
+        except Exception as e:
+            logger.warning(f"Template extraction of {doc.filename} failed: {e}")
+            data = None
+        self.stats.record_template(data is not None, time.perf_counter() - started)
+        await asyncio.to_thread(self.templates.record, data and data["template"],
+                                [template["id"] for template in templates])
+        if data is None:
+            return False
+        doc.data = data
+        doc.timings[self.name] = _elapsed_ms(started)
+        for table in data["tables"]:
+            doc.emit("table", table)
+        return True
+
+    async def compact_text(self, doc: Document) -> None:
+        """Compact the document's text for the prompt in a worker process and count what it saved"""
+        if self.compact:
+            try:
+                doc.prompt_pages = await self.worker_pool.run(compact_pages, doc.pdf_path, doc.pages,
+                                                              doc.page_texts, doc.parser)
+            except Exception as e:
+                logger.warning(f"Compacting the text of {doc.filename} failed, sending it as read: {e}")
+        doc.prompt_tokens = {"raw": estimate_tokens(doc.text), "sent": estimate_tokens(doc.prompt_text)}
+        for kind, tokens in doc.prompt_tokens.items():
+            DOCUMENT_TOKENS.inc(tokens, kind=kind)
+
+    async def extract_with_llm(self, docs: List[Document]) -> List[Dict[str, str]]:
+        """Gemini extraction; returns the packs of documents that shared a call"""
+        doc_ids = {f"doc{i}": doc for i, doc in enumerate(docs, 1)}
+        small: Dict[str, str] = {}
+        large: List[str] = []
+        for doc_id, doc in doc_ids.items():
+            text = doc.prompt_text
+            # A lone document is chunked: packing only pays off across documents
+            if len(docs) > 1 and len(text) <= self.pack_max_chars and estimate_tokens(text) <= self.chunk_max_tokens:
+                small[doc_id] = text
+            else:
+                large.append(doc_id)
+        packs = pack_documents(small, max_chars=self.pack_max_chars, max_docs=self.pack_max_docs)
+
+        async def extract_large(doc_id: str) -> None:
+            doc = doc_ids[doc_id]
+            doc.set_status(JobStatus.LLM)
+            started = time.perf_counter()
+            # Stream the answer only when someone is listening for tables
+            on_table = (lambda table: doc.emit("table", table)) if doc.on_event else None
+            pages = doc.prompt_pages if doc.prompt_pages is not None else doc.page_texts
+            doc.data = await extract_tables_chunked(self.client, pages, self.chunk_max_tokens, on_table, doc.layout)
+            self.stats.record(False, time.perf_counter() - started)
+            doc.timings[self.name] = _elapsed_ms(started)
+
+        async def extract_pack(pack: Dict[str, str]) -> None:
+            started = time.perf_counter()
+            for doc_id in pack:
+                doc_ids[doc_id].set_status(JobStatus.LLM)
+            results = await extract_tables_packed(self.client, pack)
+            for doc_id, data in results.items():
+                doc_ids[doc_id].data = data
+                doc_ids[doc_id].timings[self.name] = _elapsed_ms(started)
+                # Each packed document is charged its share of the call
+                self.stats.record(False, (time.perf_counter() - started) / len(pack))
+
+        await asyncio.gather(
+            *(extract_pack(pack) for pack in packs),
+            *(extract_large(doc_id) for doc_id in large),
+        )
+        return packs
+
+class ValidateStage(Stage):
+    """Coerce the structured result into the schema clients rely on.
+
+    Tables without a headers/rows list are dropped, rows are padded or cut to
+    the header width, and a total_amount given as text ("$1,234.00") becomes
+    a number. The summary gets the vendor, taken from the document's first line.
+    """
+
+    name = "validate"
+
+    async def run(self, doc: Document) -> None:
+        data = doc.data
+        if not data or not isinstance(data.get("tables"), list):
+            return
+        tables = []
+        for table in data["tables"]:
+            if not isinstance(table, dict) or not isinstance(table.get("rows"), list):
+                continue
+            headers = table.get("headers") if isinstance(table.get("headers"), list) else []
+            rows = [row for row in table["rows"] if isinstance(row, list)]
+            if headers:
+                width = len(headers)
+                rows = [(row + [""] * width)[:width] for row in rows]
+            tables.append({**table, "headers": headers, "rows": rows})
+        data["tables"] = tables
+
+        summary = data.get("summary")
+        if isinstance(summary, dict):
+            if isinstance(summary.get("total_amount"), str):
+                summary["total_amount"] = parse_amount(summary["total_amount"])
+            if not summary.get("vendor"):
+                summary["vendor"] = vendor_name(doc.text)
+
+class ReconcileStage(Stage):
+    """Check each result's numbers, and read a table again when they do not add up.
+
+    Row arithmetic and subtotal/tax/total reconciliation run over the rows of
+    the whole batch at once, see reconcile(). Each table gets row_flags and
+    the result a "validation" report. With a Gemini client, a table that
+    fails is re-extracted on its own, from the part of the text it came from,
+    and the new reading is kept only if it has fewer problems.
+    """
+
+    name = "reconcile"
+
+    def __init__(self, client: Optional[GeminiClient] = None, reextract: bool = True,
+                 max_tables: int = 1, max_chars: int = 40000):
+        self.client = client
+        self.reextract = reextract
+        self.max_tables = max_tables
+        self.max_chars = max_chars
+
+    async def run(self, doc: Document) -> None:
+        await self.run_many([doc])
+
+    async def run_many(self, docs: List[Document]) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        checked = [doc for doc in docs if doc.data and "error" not in doc.data
+                   and isinstance(doc.data.get("tables"), list)]
+        if checked:
+            texts = [doc.text for doc in checked]
+            reports = await asyncio.to_thread(reconcile, [doc.data for doc in checked], texts)
+            failing = []
+            for doc, text, report in zip(checked, texts, reports):
+                doc.data["validation"] = report
+                RECONCILIATIONS.inc(result="failed" if report["failed_tables"] else "reconciled")
+                if report["failed_tables"] and self.client is not None and self.reextract:
+                    failing.append((doc, text))
+            # Best effort: a failed retry leaves that document as reconciled and the others untouched
+            outcomes = await asyncio.gather(*(self._reextract(doc, text) for doc, text in failing),
+                                            return_exceptions=True)
+            for (doc, _), outcome in zip(failing, outcomes):
+                if isinstance(outcome, Exception):
+                    ERRORS.inc(type="llm_reextract")
+                    logger.warning(f"Re-extraction for {doc.filename} failed: {outcome!r}")
+        elapsed = _elapsed_ms(started)
+        for doc in docs:
+            doc.timings[self.name] = elapsed
+        record_span(self.name, time.perf_counter() - started)
+        return None
+
+    async def _reextract(self, doc: Document, text: str) -> None:
+        report = doc.data["validation"]
+        for t in report["failed_tables"][:self.max_tables]:
+            table = doc.data["tables"][t]
+            source = table_text(text, table, self.max_chars)
+            if source is None:
+                continue
+            RECONCILIATIONS.inc(result="reextracted")
+            new_table = await reextract_table(self.client, source, table, describe_problems(table, report))
+            if new_table is None:
+                continue
+            trial = {**doc.data, "tables": [new_table if i == t else other
+                                            for i, other in enumerate(doc.data["tables"])]}
+            trial_report, = await asyncio.to_thread(reconcile, [trial], [text])
+            fixed = problem_count(trial_report) < problem_count(report)
+            if fixed:
+                RECONCILIATIONS.inc(result="fixed")
+                doc.data, report = trial, trial_report
+            report["reextracted"] = report.get("reextracted", []) + [{"table": t, "fixed": fixed}]
+            doc.data["validation"] = report
+
+class FingerprintIndexStage(Stage):
+    """Add each successfully extracted document to the fingerprint index"""
+
+    name = "fingerprint_index"
+
+    def __init__(self, index: FingerprintIndex, cache_version: str = ""):
+        self.index = index
+        self.cache_version = cache_version
+
+    async def run(self, doc: Document) -> None:
+        await self.run_many([doc])
+
+    async def run_many(self, docs: List[Document]) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        entries = [
+            # Without a sha256 the result is not cached, so only its layout is worth keeping
+            (doc.fingerprint, doc.cache_key(self.cache_version) if doc.sha256 else None,
+             table_layout(doc.data))
+            for doc in docs if doc.fingerprint is not None and doc.reusable
+        ]
+        if entries:
+            await asyncio.to_thread(self.index.add_many, entries)
+        for doc in docs:
+            doc.timings[self.name] = _elapsed_ms(started)
+        record_span(self.name, time.perf_counter() - started)
+        return None
+
+class TemplateLearnStage(Stage):
+    """Learn a vendor template from each document the LLM extracted.
+
+    Only documents read entirely, and entirely from the text layer, qualify,
+    since a template works on text positions, and only results whose numbers
+    reconcile. The learned template must reproduce the LLM's rows and total
+    before it is kept.
+    """
+
+    name = "template_learn"
+
+    def __init__(self, registry: TemplateRegistry, worker_pool: WorkerPool):
+        self.registry = registry
+        self.worker_pool = worker_pool
+
+    async def run(self, doc: Document) -> None:
+        if (not doc.reusable or doc.partial or doc.data.get("extractor") in ("layout", "template")
+                or any(page["source"] != "text_layer" for page in doc.pages or [])):
+            return
+        vendor = vendor_key(doc.text)
+        if vendor is None:
+            return
+        try:
+            template = await self.worker_pool.run(learn_from_pdf, doc.pdf_path, doc.data, doc.parser)
+        except Exception as e:
+            logger.warning(f"Learning a template from {doc.filename} failed: {e}")
+            return
+        if template is not None:
+            await asyncio.to_thread(self.registry.add, vendor, template)
+
+class ExtractionEngine:
+    """Runs documents through a list of stages, with a result cache around them.
+
+    The default pipeline is load -> text layer -> OCR -> structure -> validate
+    -> reconcile, but any list of Stage objects works, so a stage can be swapped
+    without touching the routes. Cached documents skip every stage; failed ones
+    skip the stages after the failure. Each stage's time is kept per document.
+
+    In budget page mode, the default or a document's own, only the pages
+    page_budget selects are read, and the result is cached apart from the
+    whole document's.
+    """
+
+    def __init__(self, stages: List[Stage], cache: Optional[ResultCache] = None, cache_version: str = "",
+                 page_mode: str = "all", page_budget: Optional[PageSelection] = None):
+        if page_mode not in PAGE_MODES:
+            raise ValueError(f"Unknown page mode {page_mode!r}; use one of {', '.join(PAGE_MODES)}")
+        self.stages = stages
+        self.cache = cache
+        self.cache_version = cache_version
+        self.page_mode = page_mode
+        self.page_budget = page_budget or PageSelection()
+
+    def stage(self, name: str) -> Optional[Stage]:
+        return next((stage for stage in self.stages if stage.name == name), None)
+
+    async def run(self, doc: Document) -> Document:
+        await self.run_many([doc])
+        return doc
+
+    async def run_many(self, docs: List[Document]) -> Dict[str, Any]:
+        """Process a batch; returns batch-level counters reported by the stages"""
+        stats: Dict[str, Any] = {}
+        for doc in docs:
+            if (doc.page_mode or self.page_mode) == "budget":
+                doc.page_selection = self.page_budget
+        keys = await self._load_cached(docs)
+        for stage in self.stages:
+            active = [doc for doc in docs if doc.error is None and not doc.cached]
+            if not active:
+                break
+            stats.update(await stage.run_many(active) or {})
+        await self._store(docs, keys)
+        for doc in docs:
+            DOCUMENTS.inc(outcome=self.outcome(doc))
+        return stats
+
+    @staticmethod
+    def outcome(doc: Document) -> str:
+        if doc.cached:
+            return "cached"
+        if doc.error is not None or not doc.success:
+            return "failed"
+        if doc.data and "error" in doc.data:
+            return "error"
+        if doc.data and doc.data.get("extractor") in ("layout", "template"):
+            return doc.data["extractor"]
+        return "extracted"
+
+    async def _load_cached(self, docs: List[Document]) -> Dict[int, str]:
+        keys: Dict[int, str] = {}
+        if self.cache is None:
+            return keys
+        for i, doc in enumerate(docs):
+            if not doc.sha256:
+                continue
+            started = time.perf_counter()
+            keys[i] = doc.cache_key(self.cache_version)
+            cached = await asyncio.to_thread(self.cache.get, keys[i])
+            doc.timings["cache"] = _elapsed_ms(started)
+            record_span("cache", time.perf_counter() - started)
+            CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                doc.data, doc.cached = cached, True
+        return keys
+
+    async def _store(self, docs: List[Document], keys: Dict[int, str]) -> None:
+        for i, key in keys.items():
+            doc = docs[i]
+            if doc.cached or not doc.reusable:
+                continue
+            await asyncio.to_thread(self.cache.put, key, doc.data)
+
+def build_engine(settings: Any, worker_pool: WorkerPool, ocr_service: OCRService,
+                 client: Optional[GeminiClient], cache: Optional[ResultCache] = None,
+                 cache_version: str = "", fingerprints: Optional[FingerprintIndex] = None,
+                 templates: Optional[TemplateRegistry] = None) -> ExtractionEngine:
+    """The default pipeline: load, text layer, OCR, structure, validate, reconcile.
+
+    With a fingerprint index, documents are looked up in it before the
+    structure stage and added to it after validation. With a template
+    registry, the structure stage tries learned templates and LLM results
+    are learned from.
+    """
+    stages: List[Stage] = [
+        LoadStage(),
+        TextLayerStage(worker_pool, backend=settings.PDF_BACKEND, large_bytes=settings.PDF_BACKEND_LARGE_BYTES),
+        OCRStage(
+            ocr_service,
+            enabled=settings.OCR_ENABLED,
+            min_text_chars=settings.OCR_MIN_TEXT_CHARS,
+            min_confidence=settings.OCR_MIN_CONFIDENCE,
+            max_dpi=settings.OCR_MAX_DPI,
+        ),
+    ]
+    if fingerprints is not None:
+        stages.append(FingerprintStage(fingerprints, cache))
+    stages += [
+        StructureStage(
+            client,
+            worker_pool,
+            layout_enabled=settings.LOCAL_TABLES_ENABLED,
+            layout_min_confidence=settings.LOCAL_TABLES_MIN_CONFIDENCE,
+            chunk_max_tokens=settings.CHUNK_MAX_TOKENS,
+            pack_max_chars=settings.BATCH_PACK_MAX_CHARS,
+            pack_max_docs=settings.BATCH_PACK_MAX_DOCS,
+            templates=templates,
+            compact=settings.PROMPT_COMPACT,
+        ),
+        ValidateStage(),
+    ]
+    if settings.RECONCILE_ENABLED:
+        stages.append(ReconcileStage(
+            client,
+            reextract=settings.RECONCILE_REEXTRACT,
+            max_tables=settings.RECONCILE_MAX_TABLES,
+            max_chars=settings.CHUNK_MAX_TOKENS * CHARS_PER_TOKEN,
+        ))
+    if templates is not None:
+        stages.append(TemplateLearnStage(templates, worker_pool))
+    if fingerprints is not None:
+        stages.append(FingerprintIndexStage(fingerprints, cache_version))
+    page_budget = PageSelection(
+        first=settings.PAGE_FIRST,
+        last=settings.PAGE_LAST,
+        keywords=tuple(keyword.strip() for keyword in settings.PAGE_KEYWORDS.split(",") if keyword.strip()),
+        max_chars=settings.PAGE_BUDGET_CHARS,
+    )
+    return ExtractionEngine(stages=stages, cache=cache, cache_version=cache_version,
+                            page_mode=settings.PAGE_MODE, page_budget=page_budget)
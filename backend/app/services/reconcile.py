@@ -0,0 +1,222 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from .columnar import load_pyarrow, parse_decimals
+from .extraction import parse_amount
+from .table_extractor import amounts_close, column_roles
+
+logger = logging.getLogger(__name__)
+
+# Rows that carry the invoice's own sums and charges rather than a line item,
+# in the order they are told apart: "Sub Total" is a subtotal, not a total
+CHARGE_LABELS = {
+    "subtotal": r"\bsub\s*-?\s*total\b",
+    "tax": r"\b(tax|vat|gst|hst)\b",
+    "shipping": r"\b(shipping|freight|delivery|handling)\b",
+    "discount": r"\b(discount|credit)\b",
+    "total": r"\b(grand\s+total|total\s+due|amount\s+due|balance\s+due|total)\b",
+}
+CHARGE_PATTERNS = {kind: re.compile(pattern, re.IGNORECASE) for kind, pattern in CHARGE_LABELS.items()}
+# Amounts in the document text are only read when written as money, so "SKU-1234" is not one
+MONEY = re.compile(r"\(?-?[$€£]?\s?\d[\d,]*\.\d{2}\)?")
+# A label line longer than this is a line item that happens to mention "delivery"
+MAX_LABEL_CHARS = 40
+
+def _flatten(datas: Sequence[Dict[str, Any]]) -> Tuple[Dict[str, List[Any]], List[Tuple[int, int]]]:
+    """Every row of every table as columns of text, and the (document, table) of each table id"""
+    columns: Dict[str, List[Any]] = {"table": [], "quantity": [], "unit_price": [], "total": [], "label": []}
+    tables: List[Tuple[int, int]] = []
+    for d, data in enumerate(datas):
+        for t, table in enumerate(data.get("tables") or []):
+            roles = column_roles(table.get("headers") or [])
+            index = {role: roles.index(role) for role in ("quantity", "unit_price", "total") if role in roles}
+            table_id = len(tables)
+            tables.append((d, t))
+            for row in table["rows"]:
+                columns["table"].append(table_id)
+                for role in ("quantity", "unit_price", "total"):
+                    j = index.get(role)
+                    columns[role].append(str(row[j]) if j is not None and j < len(row) else None)
+                columns["label"].append(" ".join(str(cell) for cell in row))
+    return columns, tables
+
+def check_rows(columns: Dict[str, List[Any]]) -> Dict[str, Any]:
+    """Row arithmetic and charge rows for the flattened rows of a whole batch, as Arrow columns.
+
+    Each row is flagged "ok" when quantity × unit price matches its total
+    within a cent or half a percent, "mismatch" when it does not,
+    "unchecked" when a number is missing, and "charge" when it is a
+    subtotal, tax, shipping, discount or total line rather than an item.
+    """
+    pa = load_pyarrow()
+    pc = pa.compute
+    quantity, unit_price, total = (pc.cast(parse_decimals(pa.array(columns[role], pa.string())), pa.float64())
+                                   for role in ("quantity", "unit_price", "total"))
+    labels = pa.array(columns["label"], pa.string())
+
+    # A charge has a label and no quantity, so an item named "Delivery van" stays an item
+    kind = pa.nulls(len(labels), pa.string())
+    for name, pattern in CHARGE_LABELS.items():
+        matches = pc.and_(pc.is_null(kind), pc.match_substring_regex(labels, pattern, ignore_case=True))
+        kind = pc.if_else(matches, pa.scalar(name), kind)
+    kind = pc.if_else(pc.is_null(quantity), kind, pa.scalar(None, pa.string()))
+    is_charge = pc.is_valid(kind)
+
+    checkable = pc.and_(pc.and_(pc.is_valid(quantity), pc.is_valid(unit_price)),
+                        pc.and_(pc.is_valid(total), pc.invert(is_charge)))
+    difference = pc.abs(pc.subtract(pc.multiply(quantity, unit_price), total))
+    tolerance = pc.max_element_wise(pc.multiply(pc.abs(total), 0.005), 0.011)
+    ok = pc.fill_null(pc.less_equal(difference, tolerance), False)
+    flags = pc.if_else(is_charge, "charge", pc.if_else(checkable, pc.if_else(ok, "ok", "mismatch"), "unchecked"))
+
+    table_ids = pa.array(columns["table"], pa.int64())
+    per_table = pa.table({
+        "table": table_ids,
+        "items": pc.if_else(is_charge, 0.0, pc.fill_null(total, 0.0)),
+        "item_rows": pc.cast(pc.and_(pc.invert(is_charge), pc.is_valid(total)), pa.int64()),
+        "checked": pc.cast(checkable, pa.int64()),
+        "mismatched": pc.cast(pc.equal(flags, "mismatch"), pa.int64()),
+    }).group_by("table").aggregate([("items", "sum"), ("item_rows", "sum"), ("checked", "sum"),
+                                    ("mismatched", "sum")])
+    charges = pa.table({"table": table_ids, "kind": kind, "amount": total}).filter(
+        pc.and_(is_charge, pc.is_valid(total)))
+    return {"flags": flags, "per_table": per_table, "charges": charges}
+
+def text_charges(text: str) -> Dict[str, float]:
+    """Subtotal, tax, shipping, discount and total as printed in the document, the last of each kind.
+
+    The text layer often puts a label and its amount on separate lines, so a
+    label line without an amount takes the next line's.
+    """
+    charges: Dict[str, float] = {}
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    for i, line in enumerate(lines):
+        label = MONEY.sub("", line).strip()
+        if len(label) > MAX_LABEL_CHARS:
+            continue
+        kind = next((name for name, pattern in CHARGE_PATTERNS.items() if pattern.search(label)), None)
+        if kind is None:
+            continue
+        amounts = MONEY.findall(line)
+        if not amounts and i + 1 < len(lines) and MONEY.fullmatch(lines[i + 1]):
+            amounts = [lines[i + 1]]
+        value = parse_amount(amounts[-1]) if amounts else None
+        if value is not None:
+            charges[kind] = value
+    return charges
+
+def _reconcile(items_total: Optional[float], charges: Dict[str, float],
+               summary_total: Optional[float]) -> Dict[str, Optional[bool]]:
+    """items_total is None when the result has no line items to add up"""
+    subtotal = charges.get("subtotal")
+    extras = charges.get("tax", 0.0) + charges.get("shipping", 0.0) - abs(charges.get("discount", 0.0))
+    checks: Dict[str, Optional[bool]] = {"subtotal": None, "total": None, "summary_total": None}
+    if subtotal is not None and items_total is not None:
+        checks["subtotal"] = amounts_close(items_total, subtotal)
+    base = subtotal if subtotal is not None else items_total
+    if "total" in charges and base is not None:
+        checks["total"] = amounts_close(base + extras, charges["total"])
+    if "total" in charges and summary_total is not None:
+        checks["summary_total"] = amounts_close(summary_total, charges["total"])
+    return checks
+
+def reconcile(datas: Sequence[Dict[str, Any]], texts: Sequence[str]) -> List[Dict[str, Any]]:
+    """Check a batch of validated results against their own numbers and their documents' text.
+
+    Adds row_flags to every table and returns, per document, a validation
+    report: rows checked and mismatched, the line items' sum, the charges
+    found (from the table's own subtotal/total rows, else from the text),
+    which reconciliation checks passed, a confidence, and failed_tables, the
+    tables worth extracting again.
+    """
+    columns, tables = _flatten(datas)
+    reports = [{"rows_checked": 0, "rows_mismatched": 0, "items_total": 0.0} for _ in datas]
+    per_table: Dict[int, Dict[str, Any]] = {}
+    table_charges: Dict[int, Dict[str, float]] = {}
+    if tables and columns["table"]:
+        checked = check_rows(columns)
+        flags = checked["flags"].to_pylist()
+        start = 0
+        for table_id, (d, t) in enumerate(tables):
+            table = datas[d]["tables"][t]
+            table["row_flags"] = flags[start:start + len(table["rows"])]
+            start += len(table["rows"])
+        for row in checked["per_table"].to_pylist():
+            per_table[row["table"]] = row
+        for row in checked["charges"].to_pylist():
+            table_charges.setdefault(tables[row["table"]][0], {})[row["kind"]] = row["amount"]
+    for d, t in tables:
+        datas[d]["tables"][t].setdefault("row_flags", [])
+
+    for table_id, (d, t) in enumerate(tables):
+        stats = per_table.get(table_id)
+        if stats is None:
+            continue
+        report = reports[d]
+        report["rows_checked"] += stats["checked_sum"]
+        report["rows_mismatched"] += stats["mismatched_sum"]
+        report["items_total"] += stats["items_sum"]
+
+    for d, (data, text) in enumerate(zip(datas, texts)):
+        report = reports[d]
+        charges = table_charges.get(d)
+        source = "table" if charges else None
+        if not charges:
+            charges = text_charges(text) if text else {}
+            source = "text" if charges else None
+        summary = data.get("summary") if isinstance(data.get("summary"), dict) else {}
+        table_ids = [table_id for table_id, (owner, _) in enumerate(tables) if owner == d]
+        item_tables = [table_id for table_id in table_ids if per_table.get(table_id, {}).get("item_rows_sum")]
+        checks = _reconcile(report["items_total"] if item_tables else None, charges,
+                            parse_amount(summary.get("total_amount")))
+
+        failed = {tables[table_id][1] for table_id in table_ids
+                  if per_table.get(table_id, {}).get("mismatched_sum")}
+        # A sum that does not add up is put down to the table with the most line items
+        items_check = checks["subtotal"] if checks["subtotal"] is not None else (
+            checks["total"] if "subtotal" not in charges else None)
+        if items_check is False and item_tables:
+            largest = max(item_tables, key=lambda table_id: per_table[table_id]["item_rows_sum"])
+            failed.add(tables[largest][1])
+
+        confidence = 1.0
+        if report["rows_checked"]:
+            confidence = 1 - report["rows_mismatched"] / report["rows_checked"]
+        if False in checks.values():
+            confidence *= 0.5
+        report.update({
+            "items_total": round(report["items_total"], 2),
+            "charges": charges,
+            "charges_from": source,
+            "checks": checks,
+            "confidence": round(confidence, 3),
+            "failed_tables": sorted(failed),
+        })
+    return reports
+
+def describe_problems(table: Dict[str, Any], report: Dict[str, Any]) -> List[str]:
+    """What is wrong with a table, in words the model can act on"""
+    problems = []
+    roles = column_roles(table.get("headers") or [])
+    names = {role: table["headers"][roles.index(role)] for role in ("quantity", "unit_price", "total")
+             if role in roles}
+    for i, (row, flag) in enumerate(zip(table["rows"], table.get("row_flags") or [])):
+        if flag == "mismatch":
+            problems.append(f"Row {i + 1} {json.dumps(row)}: {names['quantity']} × {names['unit_price']}"
+                            f" does not equal {names['total']}")
+        if len(problems) == 10:
+            problems.append("...and more rows like these")
+            break
+    charges = report.get("charges") or {}
+    if report["checks"].get("subtotal") is False:
+        problems.append(f"The line items add up to {report['items_total']:.2f}"
+                        f" but the invoice subtotal is {charges['subtotal']:.2f}; rows may be missing or misread")
+    elif report["checks"].get("total") is False and "subtotal" not in charges:
+        problems.append(f"The line items add up to {report['items_total']:.2f},"
+                        f" which does not reconcile with the invoice total of {charges['total']:.2f}")
+    return problems
+
+def problem_count(report: Dict[str, Any]) -> int:
+    return report["rows_mismatched"] + sum(check is False for check in report["checks"].values())
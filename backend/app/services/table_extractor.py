@@ -0,0 +1,246 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from .extraction import parse_amount
+from .pdf_backends import LARGE_BYTES, Fragment, choose_backend, group_lines
+
+logger = logging.getLogger(__name__)
+
+# Header cells recognised for each column of the output schema
+DESCRIPTION_HEADERS = {"item", "items", "product", "service", "details"}
+QUANTITY_HEADERS = {"qty", "quantity", "hours", "hrs", "units"}
+UNIT_PRICE_HEADERS = {"unit price", "price", "rate", "unit cost", "price each", "unit rate"}
+TOTAL_HEADERS = {"total", "amount", "line total", "extended", "ext price"}
+
+SUBTOTAL_LABEL = re.compile(r"\bsub\s*-?\s*total\b", re.IGNORECASE)
+TOTAL_LABELS = [  # strongest first
+    re.compile(r"\bgrand\s+total\b", re.IGNORECASE),
+    re.compile(r"\b(net\s+total|amount\s+due|balance\s+due|total\s+due)\b", re.IGNORECASE),
+    re.compile(r"^\s*total\b", re.IGNORECASE),
+]
+DATE = re.compile(
+    r"\b(\d{4}-\d{2}-\d{2}"
+    r"|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*\.? \d{1,2}(?:-\d{1,2})?, \d{4})\b"
+)
+
+# Approximate advance width of a Helvetica/Times glyph, in ems
+GLYPH_WIDTH = 0.5
+
+def _header_key(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z/ ]", " ", text.lower()).split())
+
+def header_role(text: str) -> Optional[str]:
+    key = _header_key(text)
+    if "description" in key:
+        return "description"
+    if key in QUANTITY_HEADERS:
+        return "quantity"
+    if key in UNIT_PRICE_HEADERS or key.startswith("rate"):
+        return "unit_price"
+    if key in TOTAL_HEADERS:
+        return "total"
+    if key in DESCRIPTION_HEADERS:
+        return "description_fallback"
+    return None
+
+def column_roles(headers: List[Any]) -> List[Optional[str]]:
+    """header_role() of each header, with item/product columns as the description if there is no other"""
+    roles = [header_role(str(header)) for header in headers]
+    fallback = "description_fallback" if "description" in roles else "description"
+    return [fallback if role == "description_fallback" else role for role in roles]
+
+def fragment_extent(fragment: Fragment) -> Tuple[float, float]:
+    x, _, size, text = fragment
+    return x, x + len(text) * size * GLYPH_WIDTH
+
+def find_header(line: List[Fragment]) -> Optional[Dict[str, int]]:
+    """Map output roles to column indexes if this line is an item table header"""
+    roles: Dict[str, int] = {}
+    for i, fragment in enumerate(line):
+        role = header_role(fragment[3])
+        if role and role not in roles:
+            roles[role] = i
+    if "description" not in roles and "description_fallback" in roles:
+        roles["description"] = roles["description_fallback"]
+    roles.pop("description_fallback", None)
+    if "description" in roles and "total" in roles and ("quantity" in roles or "unit_price" in roles):
+        return roles
+    return None
+
+def assign_columns(line: List[Fragment], columns: List[Tuple[float, float]]) -> List[str]:
+    """Place each fragment in the header column it overlaps, or lies closest to"""
+    cells: List[List[str]] = [[] for _ in columns]
+    for fragment in line:
+        left, right = fragment_extent(fragment)
+        centre = (left + right) / 2
+
+        def distance(column: Tuple[float, float]):
+            gap = max(0.0, column[0] - right, left - column[1])
+            return gap, abs((column[0] + column[1]) / 2 - centre)
+
+        best = min(range(len(columns)), key=lambda i: distance(columns[i]))
+        cells[best].append(fragment[3])
+    return [" ".join(cell) for cell in cells]
+
+def read_page_lines(pdf_path: str, backend: str = "auto", large_bytes: int = LARGE_BYTES,
+                    pages: Optional[Sequence[int]] = None) -> List[List[List[Fragment]]]:
+    """The positioned text lines of the given pages, or every page, read with the same backend as the text layer"""
+    parser = choose_backend(pdf_path, backend, large_bytes)
+    return [group_lines(page.fragments) for page in parser.iter_pages(pdf_path, positions=True, numbers=pages)]
+
+def format_money(text: str) -> str:
+    return text if "$" in text else f"${text}"
+
+def amounts_close(a: float, b: float) -> bool:
+    return abs(a - b) <= max(0.011, abs(b) * 0.005)
+
+def extract_layout_tables(pdf_path: str, backend: str = "auto",
+                          pages: Optional[Sequence[int]] = None) -> Optional[Dict[str, Any]]:
+    """Extract the line-item table of a well-structured invoice without the LLM.
+
+    Finds a header line by keywords (Description / Quantity / Unit Price /
+    Total and common synonyms), assigns the text of the following lines to
+    columns by their x position, and reads the subtotal and total from the
+    label/value lines after the table. Returns the endpoint's tables/summary
+    schema plus a confidence in [0, 1] built from row arithmetic and subtotal
+    reconciliation, or None when no item table is found. pages limits it to
+    the pages the text layer stage read. Runs in a worker process.
+    """
+    page_lines = read_page_lines(pdf_path, backend, pages=pages)
+    roles: Optional[Dict[str, int]] = None
+    columns: List[Tuple[float, float]] = []
+    rows: List[List[str]] = []
+    after_table: List[str] = []
+    all_text: List[str] = []
+    in_table = False
+
+    for lines in page_lines:
+        for line in lines:
+            line_text = " ".join(f[3] for f in line)
+            all_text.append(line_text)
+            header = find_header(line)
+            if header and not rows:
+                roles, columns, in_table = header, [fragment_extent(f) for f in line], True
+                continue
+            if not in_table:
+                if roles is not None:
+                    after_table.append(line_text)
+                continue
+
+            cells = assign_columns(line, columns)
+            description = cells[roles["description"]]
+            total = cells[roles["total"]]
+            if description and parse_amount(total) is not None and not SUBTOTAL_LABEL.search(line_text):
+                rows.append([
+                    description,
+                    cells[roles["quantity"]] if "quantity" in roles else "",
+                    format_money(cells[roles["unit_price"]]) if "unit_price" in roles else "",
+                    format_money(total),
+                ])
+            elif rows:
+                in_table = False
+                after_table.append(line_text)
+
+    if not rows:
+        return None
+
+    subtotal = None
+    total_amount = None
+    total_strength = len(TOTAL_LABELS)
+    for line_text in after_table:
+        value = next((parse_amount(token) for token in reversed(line_text.split())
+                      if parse_amount(token) is not None), None)
+        if value is None:
+            continue
+        if SUBTOTAL_LABEL.search(line_text):
+            subtotal = value
+            continue
+        for strength, label in enumerate(TOTAL_LABELS):
+            if label.search(line_text) and strength <= total_strength:
+                total_amount, total_strength = value, strength
+                break
+
+    line_totals = [parse_amount(row[3]) for row in rows]
+    checked = correct = 0
+    for row, line_total in zip(rows, line_totals):
+        quantity, unit_price = parse_amount(row[1]), parse_amount(row[2])
+        if quantity is not None and unit_price is not None:
+            checked += 1
+            correct += amounts_close(quantity * unit_price, line_total)
+    confidence = correct / checked if checked else 0.5
+    items_sum = sum(line_totals)
+    if subtotal is not None:
+        confidence *= 1.0 if amounts_close(items_sum, subtotal) else 0.5
+    elif total_amount is None or not amounts_close(items_sum, total_amount):
+        confidence *= 0.9
+
+    dates = DATE.findall("\n".join(all_text))
+    return {
+        "tables": [
+            {
+                "title": "Invoice Items",
+                "headers": ["Description", "Quantity", "Unit Price", "Total"],
+                "rows": rows,
+            }
+        ],
+        "summary": {
+            "total_amount": total_amount if total_amount is not None else round(items_sum, 2),
+            "invoice_count": 1,
+            "date_range": dates[0] if dates else None,
+        },
+        "extractor": "layout",
+        "confidence": round(confidence, 3),
+    }
+
+class LocalExtractionStats:
+    """How many documents the layout extractor and learned templates served, and the time each path took"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local = 0
+        self.llm = 0
+        self.template = 0
+        self.template_misses = 0
+        self.local_seconds = 0.0
+        self.llm_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def record(self, served_locally: bool, seconds: float) -> None:
+        with self._lock:
+            if served_locally:
+                self.local += 1
+                self.local_seconds += seconds
+            else:
+                self.llm += 1
+                self.llm_seconds += seconds
+
+    def record_template(self, hit: bool, seconds: float) -> None:
+        """A document of a vendor with templates; a miss goes on to the LLM"""
+        with self._lock:
+            if hit:
+                self.template += 1
+                self.template_seconds += seconds
+            else:
+                self.template_misses += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self.local + self.template + self.llm
+            avg_llm = self.llm_seconds / self.llm if self.llm else None
+            avg_template = self.template_seconds / self.template if self.template else None
+            tried = self.template + self.template_misses
+            return {
+                "documents": documents,
+                "served_locally": self.local,
+                "fraction_local": round(self.local / documents, 3) if documents else None,
+                "served_by_template": self.template,
+                "template_hit_rate": round(self.template / tried, 3) if tried else None,
+                "avg_local_ms": round(1000 * self.local_seconds / self.local, 1) if self.local else None,
+                "avg_template_ms": round(1000 * avg_template, 1) if avg_template is not None else None,
+                "avg_llm_ms": round(1000 * avg_llm, 1) if avg_llm is not None else None,
+                # What the template-served documents would have cost at the average LLM latency
+                "template_saved_seconds": round(self.template * (avg_llm - avg_template), 1)
+                if avg_llm is not None and avg_template is not None else None,
+            }
@@ -0,0 +1,311 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from .extraction import parse_amount
+from .table_extractor import (DATE, Fragment, amounts_close, assign_columns, format_money, fragment_extent,
+                              header_role, read_page_lines)
+
+logger = logging.getLogger(__name__)
+
+# Data rows of the first extraction used to work out which column is which
+SAMPLE_ROWS = 5
+AMOUNT_TOKEN = re.compile(r"[-$€£(]*\d[\d,]*(?:\.\d+)?\)?")
+
+Lines = List[List[List[Fragment]]]
+
+def _text(line: List[Fragment]) -> str:
+    return " ".join(fragment[3] for fragment in line)
+
+def _key(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def _label(text: str) -> str:
+    """A line's text with its amounts removed, e.g. "total:" for "TOTAL: $7,182.00" """
+    return _key(AMOUNT_TOKEN.sub(" ", text))
+
+def _cell_key(text: Any) -> str:
+    return re.sub(r"[\s$,]", "", str(text).lower())
+
+def _same_cell(a: Any, b: Any) -> bool:
+    if _cell_key(a) == _cell_key(b):
+        return True
+    x, y = parse_amount(a), parse_amount(b)
+    return x is not None and y is not None and amounts_close(x, y)
+
+def vendor_name(text: str) -> Optional[str]:
+    """The first line with letters, normally the vendor's name"""
+    for line in text.splitlines():
+        if re.search(r"[a-zA-Z]{2}", line):
+            return " ".join(line.split())
+    return None
+
+def vendor_key(text: str) -> Optional[str]:
+    """vendor_name() normalized, with digits masked"""
+    name = vendor_name(text)
+    return None if name is None else re.sub(r"\d", "0", _key(name))[:80]
+
+def _header_line(flat: List[List[Fragment]], rows: List[List[Any]]) -> Optional[int]:
+    """Index of the table's header: the nearest line above the first row with several words and no amounts"""
+    first = [cell for cell in rows[0] if str(cell).strip()]
+    for i, line in enumerate(flat):
+        line_key = _cell_key(_text(line))
+        found = sum(_cell_key(cell) in line_key for cell in first)
+        if found >= max(2, 0.6 * len(first)):
+            for j in range(i - 1, -1, -1):
+                if len(flat[j]) >= 2 and all(parse_amount(fragment[3]) is None for fragment in flat[j]):
+                    return j
+            return None
+    return None
+
+def _column_map(samples: List[Tuple[List[Any], List[str]]], width: int) -> Optional[List[List[int]]]:
+    """Which PDF columns make up each output column: one column, two joined, or none"""
+    columns = len(samples[0][1])
+    options = [[c] for c in range(columns)] + [[c, c + 1] for c in range(columns - 1)]
+    mapping = []
+    for j in range(width):
+        wanted = [(row[j], cells) for row, cells in samples if j < len(row) and str(row[j]).strip()]
+        if not wanted:
+            mapping.append([])
+            continue
+        scores = [sum(_same_cell(value, " ".join(cells[c] for c in option)) for value, cells in wanted)
+                  for option in options]
+        best = max(range(len(options)), key=lambda k: (scores[k], -len(options[k])))
+        if scores[best] < 0.8 * len(wanted):
+            return None
+        mapping.append(options[best])
+    return mapping
+
+def learn_template(page_lines: Lines, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A template that reproduces `data`, a checked extraction of the same document, or None.
+
+    The table is found from where the first extracted row appears, its header
+    line and column positions are taken from the PDF, and each output column
+    is matched to the PDF columns holding its values. The template is kept
+    only if applying it gives back the same rows and total.
+    """
+    tables = [table for table in data.get("tables") or [] if isinstance(table, dict) and table.get("rows")]
+    if len(tables) != 1 or not isinstance(tables[0].get("headers"), list):
+        return None
+    table = tables[0]
+    rows = [row for row in table["rows"] if isinstance(row, list)]
+    flat = [line for lines in page_lines for line in lines]
+    header = _header_line(flat, rows) if rows else None
+    if header is None:
+        return None
+
+    columns = [fragment_extent(fragment) for fragment in flat[header]]
+    samples = []
+    for line in flat[header + 1:]:
+        if len(samples) == min(SAMPLE_ROWS, len(rows)):
+            break
+        samples.append((rows[len(samples)], assign_columns(line, columns)))
+    mapping = _column_map(samples, len(table["headers"])) if samples else None
+    if mapping is None:
+        return None
+
+    summary = data.get("summary") if isinstance(data.get("summary"), dict) else {}
+    total = parse_amount(summary.get("total_amount"))
+    total_label = None
+    date_label = None
+    date_range = str(summary.get("date_range") or "")
+    for line in flat[header + 1:]:
+        text = _text(line)
+        if total is not None and any(_same_cell(token, total) for token in AMOUNT_TOKEN.findall(text)):
+            total_label = _label(text)  # the last such line, usually the grand total
+    for line in flat:
+        text = _text(line)
+        if date_range and date_range.lower() in text.lower():
+            date_label = _key(text[:text.lower().index(date_range.lower())])
+            break
+
+    template = {
+        "header": [_key(fragment[3]) for fragment in flat[header]],
+        "columns": columns,
+        "map": mapping,
+        # Columns filled in every sample row; a line missing one is not a row
+        "required": sorted({c for option in mapping for c in option
+                            if all(cells[c] for _, cells in samples)}),
+        "money": [j for j, option in enumerate(mapping)
+                  if option and all("$" in str(row[j]) for row, _ in samples if str(row[j]).strip())],
+        "title": table.get("title") or "Invoice Items",
+        "headers": table["headers"],
+        "total_label": total_label,
+        "date_label": date_label,
+    }
+    applied = apply_template(page_lines, template)
+    if (applied is None or len(applied["tables"][0]["rows"]) != len(rows)
+            or not all(_same_cell(a, b) for got, want in zip(applied["tables"][0]["rows"], rows)
+                       for a, b in zip(got, want))
+            or (total is not None and not amounts_close(applied["summary"]["total_amount"] or 0, total))):
+        return None
+    return template
+
+def apply_template(page_lines: Lines, template: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Extract a document with a learned template; None when its header is not there"""
+    columns = [tuple(column) for column in template["columns"]]
+    rows: List[List[str]] = []
+    after: List[str] = []
+    all_text: List[str] = []
+    seen = in_table = False
+    for lines in page_lines:
+        for line in lines:
+            text = _text(line)
+            all_text.append(text)
+            if [_key(fragment[3]) for fragment in line] == template["header"]:
+                # Also a header repeated at the top of a continuation page
+                seen = in_table = True
+                continue
+            if not in_table:
+                if seen:
+                    after.append(text)
+                continue
+            cells = assign_columns(line, columns)
+            if all(cells[c] for c in template["required"]):
+                row = [" ".join(cells[c] for c in option) for option in template["map"]]
+                rows.append([format_money(value) if j in template["money"] and value else value
+                             for j, value in enumerate(row)])
+            else:
+                in_table = False
+                after.append(text)
+    if not rows:
+        return None
+
+    confidence = 1.0
+    total_amount = None
+    if template["total_label"]:
+        line = next((text for text in after if _label(text) == template["total_label"]), None)
+        amounts = [parse_amount(token) for token in AMOUNT_TOKEN.findall(line or "")]
+        total_amount = next((amount for amount in reversed(amounts) if amount is not None), None)
+        if total_amount is None:
+            confidence *= 0.5  # the document does not end the way the template's did
+
+    date_range = None
+    if template["date_label"]:
+        for text in all_text:
+            if _key(text).startswith(template["date_label"]):
+                rest = " ".join(text.split()[len(template["date_label"].split()):])
+                # Lines can run on past the date, e.g. into an address printed beside it
+                date = DATE.match(rest)
+                date_range = date.group() if date else rest or None
+                break
+    if date_range is None:
+        dates = DATE.findall("\n".join(all_text))
+        date_range = dates[0] if dates else None
+
+    roles = {header_role(header): j for j, header in enumerate(template["headers"])}
+    if {"quantity", "unit_price", "total"} <= roles.keys():
+        checked = correct = 0
+        for row in rows:
+            quantity, price, line_total = (parse_amount(row[roles[role]]) for role in ("quantity", "unit_price", "total"))
+            if None not in (quantity, price, line_total):
+                checked += 1
+                correct += amounts_close(quantity * price, line_total)
+        if checked:
+            confidence *= correct / checked
+
+    return {
+        "tables": [{"title": template["title"], "headers": template["headers"], "rows": rows}],
+        "summary": {"total_amount": total_amount, "invoice_count": 1, "date_range": date_range},
+        "extractor": "template",
+        "confidence": round(confidence, 3),
+    }
+
+def learn_from_pdf(pdf_path: str, data: Dict[str, Any], backend: str = "auto") -> Optional[Dict[str, Any]]:
+    """learn_template() on a PDF on disk; runs in a worker process"""
+    return learn_template(read_page_lines(pdf_path, backend), data)
+
+def extract_with_templates(pdf_path: str, templates: Sequence[Dict[str, Any]], min_confidence: float,
+                           backend: str = "auto", pages: Optional[Sequence[int]] = None) -> Optional[Dict[str, Any]]:
+    """The first template that reads the PDF, or the given pages of it, at min_confidence or better.
+
+    Runs in a worker process.
+    """
+    page_lines = read_page_lines(pdf_path, backend, pages=pages)
+    for template in templates:
+        data = apply_template(page_lines, template)
+        if data is not None and data["confidence"] >= min_confidence:
+            data["template"] = template["id"]
+            return data
+    return None
+
+class TemplateRegistry:
+    """Learned extraction templates, kept per vendor in SQLite.
+
+    A vendor is identified by the first line of its documents' text. Each
+    vendor keeps its most recently learned templates, at most
+    max_per_vendor, one per table header; a later extraction with the same
+    header replaces the template. Hits and misses are counted per template.
+    """
+
+    def __init__(self, path: Optional[str], max_per_vendor: int = 4):
+        self.max_per_vendor = max_per_vendor
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "learned": 0}
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS templates ("
+            " id INTEGER PRIMARY KEY, vendor TEXT NOT NULL, header TEXT NOT NULL, template TEXT NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL,"
+            " UNIQUE (vendor, header))"
+        )
+        self._db.commit()
+
+    def find(self, vendor: str) -> List[Dict[str, Any]]:
+        """The vendor's templates, the most used first"""
+        with self._lock:
+            return [{**json.loads(template), "id": template_id} for template_id, template in self._db.execute(
+                "SELECT id, template FROM templates WHERE vendor = ? ORDER BY hits DESC, updated DESC", (vendor,)
+            )]
+
+    def add(self, vendor: str, template: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO templates (vendor, header, template, updated) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (vendor, header) DO UPDATE SET template = excluded.template,"
+                " updated = excluded.updated, misses = 0",
+                (vendor, json.dumps(template["header"]), json.dumps(template), now),
+            )
+            self._db.execute(
+                "DELETE FROM templates WHERE vendor = ? AND id NOT IN"
+                " (SELECT id FROM templates WHERE vendor = ? ORDER BY updated DESC LIMIT ?)",
+                (vendor, vendor, self.max_per_vendor),
+            )
+            self._db.commit()
+            self._counters["learned"] += 1
+
+    def record(self, template_id: Optional[int], tried: Sequence[int]) -> None:
+        """A hit for the template that served the document, or a miss for every one tried"""
+        with self._lock:
+            if template_id is not None:
+                self._counters["hits"] += 1
+                self._db.execute("UPDATE templates SET hits = hits + 1 WHERE id = ?", (template_id,))
+            else:
+                self._counters["misses"] += 1
+                self._db.executemany("UPDATE templates SET misses = misses + 1 WHERE id = ?",
+                                     [(i,) for i in tried])
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            tried = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / tried, 3) if tried else None
+            stats["templates"], stats["vendors"] = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT vendor) FROM templates"
+            ).fetchone()
+            return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,96 @@
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .pdf_backends import LARGE_BYTES, PageText, choose_backend
+
+
+@dataclass(frozen=True)
+class PageSelection:
+    """Which pages of a long document are worth reading for the prompt.
+
+    The first and last pages are always read; they carry the vendor, dates
+    and totals. Pages in between are then read in order while fewer than
+    max_chars have been read, and kept when they mention one of keywords,
+    or all of them when there are no keywords. Every page read counts
+    against max_chars, so parsing stops once the prompt budget is spent.
+    """
+
+    first: int = 1
+    last: int = 1
+    keywords: Tuple[str, ...] = ()
+    max_chars: int = 8000
+
+    @property
+    def key(self) -> str:
+        """Identifies the selection in cache keys; a partial result is not the whole document's"""
+        return f"pages:{self.first}:{self.last}:{self.max_chars}:{','.join(self.keywords)}"
+
+    def matches(self, text: str) -> bool:
+        if not self.keywords:
+            return True
+        return re.search("|".join(re.escape(keyword) for keyword in self.keywords), text, re.IGNORECASE) is not None
+
+
+def join_pages(page_texts: Iterable[str]) -> str:
+    """Document text from per-page text, one trailing newline per non-empty page"""
+    return "".join(page_text + "\n" for page_text in page_texts if page_text)
+
+
+def _page_report(page: PageText, started: float) -> Dict[str, Any]:
+    return {
+        "page": page.number,
+        "text": page.text,
+        "width": page.width,
+        "height": page.height,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def extract_pages(pdf_path: str, backend: str = "auto", large_bytes: int = LARGE_BYTES) -> List[Dict[str, Any]]:
+    """Per-page text layer, with each page's size in points and extraction time.
+
+    Pages are parsed one at a time, so only the objects of the page being
+    extracted are held in memory. backend is a name from pdf_backends or
+    "auto" to pick one by file size. Lets callers decide page by page whether
+    OCR is needed. Runs in a worker process, so it must stay a picklable
+    module-level function.
+    """
+    parser = choose_backend(pdf_path, backend, large_bytes)
+    pages = []
+    started = time.perf_counter()
+    for page in parser.iter_pages(pdf_path):
+        pages.append(_page_report(page, started))
+        started = time.perf_counter()
+    return pages
+
+
+def extract_page_selection(pdf_path: str, selection: PageSelection, backend: str = "auto",
+                           large_bytes: int = LARGE_BYTES,
+                           ) -> Tuple[int, List[Dict[str, Any]]]:
+    """extract_pages() for only the pages a selection keeps; returns the page count too.
+
+    Pages that are never read are never parsed, so the cost follows the
+    pages used rather than the document's length. Runs in a worker process.
+    """
+    parser = choose_backend(pdf_path, backend, large_bytes)
+    with parser.open(pdf_path) as pdf:
+        count = len(pdf)
+        ends = sorted(set(range(1, min(selection.first, count) + 1))
+                      | set(range(max(count - selection.last, 0) + 1, count + 1)))
+        pages: Dict[int, Dict[str, Any]] = {}
+        read = 0
+        for number in ends:
+            started = time.perf_counter()
+            pages[number] = _page_report(pdf.page(number), started)
+            read += len(pages[number]["text"])
+        for number in range(selection.first + 1, count - selection.last + 1):
+            if read >= selection.max_chars:
+                break
+            started = time.perf_counter()
+            page = pdf.page(number)
+            read += len(page.text)
+            if selection.matches(page.text):
+                pages[number] = _page_report(page, started)
+    return count, [pages[number] for number in sorted(pages)]
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import tempfile
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
+from fastapi import UploadFile
+import logging
+
+from .metrics import record_span
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the maximum size of {max_size} bytes")
+        self.max_size = max_size
+
+class TooManyFiles(Exception):
+    def __init__(self, max_files: int):
+        super().__init__(f"Batch exceeds the maximum of {max_files} files")
+        self.max_files = max_files
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+
+    def discard(self) -> None:
+        _discard(self.path)
+
+def _discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        logger.warning(f"Could not remove spooled upload {path}")
+
+async def save_upload(file: UploadFile, max_size: int, directory: Optional[str] = None) -> SpooledUpload:
+    """Copy an upload to a named temp file in fixed-size chunks.
+
+    This is a second copy, not a streamed read: Starlette has already spooled
+    the multipart body to its own unnamed temp file before the handler runs,
+    and the request is cut off while it arrives by MaxBodySizeMiddleware. The
+    copy gives parse workers a path to open and computes the content hash on
+    the way through; max_size is the per-file limit inside a larger request.
+    The document is never held in memory as a whole. The caller owns the
+    returned file.
+    """
+    started = time.perf_counter()
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(max_size)
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        _discard(path)
+        raise
+    record_span("read", time.perf_counter() - started)
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())
+
+@asynccontextmanager
+async def spool_upload(file: UploadFile, max_size: int) -> AsyncIterator[SpooledUpload]:
+    """save_upload() to a temp file that is removed when the context exits"""
+    upload = await save_upload(file, max_size)
+    try:
+        yield upload
+    finally:
+        upload.discard()
+
+def _spool_member(source: BinaryIO, max_size: int) -> SpooledUpload:
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(max_size)
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        _discard(path)
+        raise
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())
+
+def unpack_zip(zip_path: str, max_size: int, max_files: int) -> List[Tuple[str, SpooledUpload]]:
+    """Spool every PDF inside a zip archive to its own temp file.
+
+    Sizes are counted while decompressing rather than trusted from the archive
+    headers. On success the caller owns the temp files and must discard() them.
+    """
+    members: List[Tuple[str, SpooledUpload]] = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name.lower().endswith(".pdf") or name.startswith("."):
+                    continue
+                if len(members) >= max_files:
+                    raise TooManyFiles(max_files)
+                with archive.open(info) as source:
+                    members.append((name, _spool_member(source, max_size)))
+    except BaseException:
+        for _, member in members:
+            member.discard()
+        raise
+    return members
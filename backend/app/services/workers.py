@@ -0,0 +1,46 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WorkerPool:
+    """Bounded process pool for CPU-bound PDF work.
+
+    Keeps parsing off the event loop. The semaphore caps how many jobs may be
+    queued on the pool at once so a burst of uploads cannot pile up unbounded.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, initializer: Optional[Callable[[], None]] = None):
+        # spawn avoids forking a process that already runs event-loop threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+        )
+        self._slots = asyncio.Semaphore(max_pending)
+        self.max_workers = max_workers
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) in a worker process and await the result"""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def warm_up(self) -> int:
+        """Start every worker process now rather than on the first documents; returns how many run.
+
+        Processes are spawned on demand, one per job submitted while none is
+        idle, so as many jobs as workers are submitted at once.
+        """
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self._executor, os.getpid)
+                                      for _ in range(self.max_workers)))
+        return len(set(pids))
+
+    def shutdown(self) -> None:
+        logger.info("Shutting down PDF worker pool")
+        self._executor.shutdown(wait=True, cancel_futures=True)
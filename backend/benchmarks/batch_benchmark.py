@@ -0,0 +1,77 @@
+"""
+Throughput of /api/extract/batch against N sequential /api/extract calls.
+
+Run the API against benchmarks/fake_gemini.py with the result cache off, so
+every upload is parsed and sent to the model:
+
+    FAKE_GEMINI_LATENCY=0.5 uvicorn benchmarks.fake_gemini:app --port 9000
+    CACHE_ENABLED=false GEMINI_API_KEY=fake \
+        GEMINI_API_BASE=http://localhost:9000/v1beta uvicorn app.main:app
+    python benchmarks/batch_benchmark.py test-pdfs/*.pdf --copies 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+
+async def llm_calls(client, fake_url):
+    response = await client.get(f"{fake_url}/stats")
+    return response.json()["generateContent"]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdfs", nargs="+", help="PDF files to upload")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--fake-gemini", default="http://localhost:9000")
+    parser.add_argument("--copies", type=int, default=4, help="times each PDF is repeated")
+    args = parser.parse_args()
+
+    files = []
+    for copy in range(args.copies):
+        for path in args.pdfs:
+            with open(path, "rb") as f:
+                files.append((f"{copy}_{os.path.basename(path)}", f.read()))
+
+    report = {"invoices": len(files)}
+    async with httpx.AsyncClient(timeout=600) as client:
+        calls_before = await llm_calls(client, args.fake_gemini)
+        start = time.perf_counter()
+        for name, content in files:
+            response = await client.post(
+                f"{args.url}/api/extract", files={"file": (name, content, "application/pdf")}
+            )
+            response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        calls = await llm_calls(client, args.fake_gemini) - calls_before
+        report["sequential"] = {
+            "seconds": round(elapsed, 2),
+            "invoices_per_second": round(len(files) / elapsed, 2),
+            "invoices_per_llm_call": round(len(files) / calls, 2),
+        }
+
+        calls_before = await llm_calls(client, args.fake_gemini)
+        start = time.perf_counter()
+        response = await client.post(
+            f"{args.url}/api/extract/batch",
+            files=[("files", (name, content, "application/pdf")) for name, content in files],
+        )
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        calls = await llm_calls(client, args.fake_gemini) - calls_before
+        report["batch"] = {
+            "seconds": round(elapsed, 2),
+            "invoices_per_second": round(len(files) / elapsed, 2),
+            "invoices_per_llm_call": round(len(files) / calls, 2),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,264 @@
+"""
+Synthetic invoice corpus for the benchmark suite.
+
+Generates invoices in the styles of pdf-generate.py at any scale: product
+tables, hourly service tables, canvas-drawn tables, and scanned-style
+image-only pages with speckle noise and skew. Table size, page count and the
+share of scanned documents are parameters, and every document is derived from
+a seed, so the same parameters always give byte-identical files. A corpus is
+written once under .cache/bench-corpus/<hash of the parameters> and reused.
+
+    python benchmarks/corpus.py --count 2000 --rows 5-60 --pages 1-3 --scanned 0.1
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Tuple
+
+STYLES = ("product", "services", "canvas")
+
+PRODUCTS = ["Laptop", "Monitor", "Keyboard", "Mouse", "Docking Station", "Headset", "Webcam",
+            "Printer Toner", "Office Chair", "Desk Lamp", "USB-C Cable", "SSD 1TB", "Router"]
+BRANDS = ["Dell", "Logitech", "HP", "Lenovo", "Samsung", "Anker", "Herman Miller", "Cisco"]
+SERVICES = ["Frontend Development", "Backend API Development", "Database Schema Design",
+            "UI/UX Consultation", "Testing and QA", "Deployment", "Documentation", "Training Session"]
+COMPANIES = ["ACME Corporation", "Tech Solutions Inc.", "Gourmet Supplies Distribution",
+             "Northwind Traders", "Globex Industries", "Initech Services"]
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    count: int = 200
+    rows: Tuple[int, int] = (5, 40)  # line items per invoice, inclusive range
+    pages: Tuple[int, int] = (1, 1)  # minimum pages per invoice, inclusive range
+    scanned: float = 0.0  # share of invoices rendered as image-only pages
+    noise: float = 0.3  # scanned-style degradation, 0 to 1
+    seed: int = 0
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(json.dumps(asdict(self), sort_keys=True).encode()).hexdigest()[:12]
+
+def parse_range(value: str) -> Tuple[int, int]:
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+def line_items(rng: random.Random, count: int, services: bool) -> List[Tuple[str, str, int, float]]:
+    """(code, description, quantity, unit price) rows"""
+    items = []
+    for index in range(count):
+        if services:
+            items.append((f"2024-09-{1 + index % 28:02d}", rng.choice(SERVICES), rng.randint(1, 12),
+                          float(rng.choice([100, 125, 150, 175]))))
+        else:
+            name = f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)}"
+            items.append((f"SKU-{rng.randint(0, 9999):04d}", name, rng.randint(1, 50),
+                          round(rng.uniform(2, 1500), 2)))
+    return items
+
+def money(value: float) -> str:
+    return f"${value:,.2f}"
+
+def terms(rng: random.Random) -> str:
+    words = "payment is due within thirty days of the invoice date late balances accrue interest".split()
+    return " ".join(rng.choice(words) for _ in range(400)).capitalize() + "."
+
+def build_platypus(path: str, rng: random.Random, rows: int, pages: int, services: bool) -> None:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    items = line_items(rng, rows, services)
+    if services:
+        header = ['Date', 'Service Description', 'Hours', 'Rate/Hour', 'Amount']
+    else:
+        header = ['Item Code', 'Description', 'Quantity', 'Unit Price', 'Total']
+    data = [header] + [[code, description, str(quantity), money(price), money(quantity * price)]
+                       for code, description, quantity, price in items]
+    subtotal = sum(quantity * price for _, _, quantity, price in items)
+    tax = round(subtotal * 0.08, 2)
+
+    company = rng.choice(COMPANIES).upper()
+    number = f"INV-2024-{rng.randint(0, 99999):05d}"
+
+    def story():
+        table = Table(data, colWidths=[1.1*inch, 2.6*inch, 0.8*inch, 1*inch, 1.1*inch], repeatRows=1)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2563eb')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ]))
+        return [
+            Paragraph(company, styles['Title']),
+            Paragraph(f"Invoice #: {number}", styles['Normal']),
+            Paragraph("Date: October 15, 2024", styles['Normal']),
+            Spacer(1, 0.3*inch),
+            table,
+            Spacer(1, 0.3*inch),
+            Table([['', 'Subtotal:', money(subtotal)],
+                   ['', 'Tax (8%):', money(tax)],
+                   ['', 'TOTAL:', money(subtotal + tax)]],
+                  colWidths=[3.9*inch, 1.5*inch, 1.2*inch]),
+        ]
+
+    doc = SimpleDocTemplate(path, pagesize=letter, invariant=1)
+    doc.build(story())
+    # Pad short invoices with terms pages until they reach the page count
+    missing = pages - doc.page
+    if missing > 0:
+        padding = []
+        for _ in range(missing):
+            padding += [PageBreak(), Paragraph("Terms and Conditions", styles['Heading2']),
+                        Paragraph(terms(rng), styles['Normal'])]
+        SimpleDocTemplate(path, pagesize=letter, invariant=1).build(story() + padding)
+
+def build_canvas(path: str, rng: random.Random, rows: int, pages: int) -> None:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path, pagesize=letter, invariant=1)
+    width, height = letter
+    items = line_items(rng, rows, services=False)
+    page_count = 1
+
+    def table_header(y):
+        c.setFont("Helvetica-Bold", 10)
+        c.rect(50, y - 20, 500, 20)
+        for x, label in ((55, "Item"), (200, "Description"), (350, "Qty"), (400, "Unit"),
+                         (450, "Price"), (500, "Total")):
+            c.drawString(x, y - 15, label)
+        c.setFont("Helvetica", 9)
+        return y - 30
+
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(width/2, height - 50, rng.choice(COMPANIES).upper())
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(55, height - 100, f"INVOICE #: FOOD-2024-{rng.randint(0, 9999):04d}")
+    c.drawString(55, height - 115, "DATE: October 18, 2024")
+    y = table_header(height - 200)
+    for code, description, quantity, price in items:
+        if y < 80:
+            c.showPage()
+            page_count += 1
+            y = table_header(height - 60)
+        c.drawString(55, y, code)
+        c.drawString(120, y, description)
+        c.drawString(355, y, str(quantity))
+        c.drawString(400, y, "EA")
+        c.drawString(450, y, money(price))
+        c.drawString(500, y, money(quantity * price))
+        y -= 15
+
+    subtotal = sum(quantity * price for _, _, quantity, price in items)
+    if y < 120:
+        c.showPage()
+        page_count += 1
+        y = height - 60
+    c.line(350, y - 5, 550, y - 5)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(400, y - 25, "Subtotal:")
+    c.drawString(490, y - 25, money(subtotal))
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(400, y - 45, "TOTAL:")
+    c.drawString(485, y - 45, money(subtotal))
+    while page_count < pages:
+        c.showPage()
+        page_count += 1
+        text = c.beginText(50, height - 60)
+        text.setFont("Helvetica", 9)
+        words = terms(rng).split()
+        for start in range(0, len(words), 14):
+            text.textLine(" ".join(words[start:start + 14]))
+        c.drawText(text)
+    c.save()
+
+def build_scanned(path: str, rng: random.Random, rows: int, pages: int, noise: float) -> None:
+    """Image-only pages at 200 DPI with speckles and a slight skew, like a photocopy"""
+    from PIL import Image, ImageDraw
+
+    items = line_items(rng, rows, services=False)
+    per_page = -(-len(items) // pages)
+    images = []
+    for page in range(pages):
+        image = Image.new("L", (1700, 2200), color=255)
+        draw = ImageDraw.Draw(image)
+        draw.text((100, 80), f"{rng.choice(COMPANIES).upper()}    INVOICE INV-2024-{page:04d}", fill=0)
+        y = 200
+        for code, description, quantity, price in items[page * per_page:(page + 1) * per_page]:
+            draw.text((100, y), f"{code}   {description}   {quantity}   {money(price)}   {money(quantity * price)}", fill=0)
+            y += 45
+        speckles = int(noise * 20000)
+        draw.point([(rng.randrange(1700), rng.randrange(2200)) for _ in range(speckles)], fill=0)
+        image = image.rotate(rng.uniform(-2, 2) * noise, fillcolor=255)
+        images.append(image)
+    fixed = time.gmtime(1728950400)  # PIL stamps the current time otherwise
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=200,
+                   creationDate=fixed, modDate=fixed)
+
+def build_invoice(path: str, style: str, seed: int, rows: int, pages: int, noise: float) -> None:
+    rng = random.Random(seed)
+    if style == "scanned":
+        build_scanned(path, rng, rows, pages, noise)
+    elif style == "canvas":
+        build_canvas(path, rng, rows, pages)
+    else:
+        build_platypus(path, rng, rows, pages, services=style == "services")
+
+def build_corpus(spec: CorpusSpec, root: str = ".cache/bench-corpus") -> dict:
+    """Generate the corpus for `spec` unless it already exists; return its manifest"""
+    directory = os.path.join(root, spec.key)
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return {**json.load(f), "directory": directory}
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(spec.seed)
+    files = []
+    for index in range(spec.count):
+        style = "scanned" if rng.random() < spec.scanned else rng.choice(STYLES)
+        rows = rng.randint(*spec.rows)
+        pages = rng.randint(*spec.pages)
+        name = f"invoice_{index:05d}_{style}.pdf"
+        path = os.path.join(directory, name)
+        build_invoice(path, style, rng.getrandbits(32), rows, pages, spec.noise)
+        files.append({"name": name, "style": style, "rows": rows, "bytes": os.path.getsize(path)})
+
+    manifest = {"key": spec.key, "spec": asdict(spec), "files": files}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return {**manifest, "directory": directory}
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--count", type=int, default=CorpusSpec.count)
+    parser.add_argument("--rows", type=parse_range, default="5-40", help="line items per invoice, e.g. 5-40")
+    parser.add_argument("--pages", type=parse_range, default="1", help="minimum pages per invoice, e.g. 1-3")
+    parser.add_argument("--scanned", type=float, default=CorpusSpec.scanned, help="share of image-only invoices")
+    parser.add_argument("--noise", type=float, default=CorpusSpec.noise)
+    parser.add_argument("--seed", type=int, default=CorpusSpec.seed)
+
+def spec_from_args(args: argparse.Namespace) -> CorpusSpec:
+    return CorpusSpec(count=args.count, rows=args.rows, pages=args.pages,
+                      scanned=args.scanned, noise=args.noise, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    args = parser.parse_args()
+    manifest = build_corpus(spec_from_args(args))
+    styles = {}
+    for entry in manifest["files"]:
+        styles[entry["style"]] = styles.get(entry["style"], 0) + 1
+    print(json.dumps({"directory": manifest["directory"], "files": len(manifest["files"]), "styles": styles}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Local stand-in for the Gemini generateContent and streamGenerateContent APIs.
+
+Answers every request with a fixed invoice extraction after a configurable
+delay, so the backend can be load tested without network access or quota.
+Failures can be injected to exercise the client's retries, rate limiting and
+circuit breaker: a share of requests answered with 503, a quota beyond which
+requests get 429, or a full outage. Set them with environment variables or
+at runtime with POST /faults.
+
+    FAKE_GEMINI_LATENCY=0.5 FAKE_GEMINI_ERROR_RATE=0.1 FAKE_GEMINI_QUOTA_RPS=20 \
+        uvicorn benchmarks.fake_gemini:app --port 9000
+    GEMINI_API_KEY=fake GEMINI_API_BASE=http://localhost:9000/v1beta uvicorn app.main:app
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+faults = {
+    "latency": float(os.getenv("FAKE_GEMINI_LATENCY", "0.5")),
+    "error_rate": float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0")),  # share answered with 503
+    "quota_rps": float(os.getenv("FAKE_GEMINI_QUOTA_RPS", "0")),  # 0 means no quota
+    "outage": False,  # answer everything with 503
+}
+
+CANNED_RESULT = {
+    "tables": [
+        {
+            "title": "Invoice Items",
+            "headers": ["Description", "Quantity", "Unit Price", "Total"],
+            "rows": [
+                ["Dell Latitude 5520 Laptop", "5", "$1,200.00", "$6,000.00"],
+                ["Logitech MX Master 3 Mouse", "10", "$99.99", "$999.90"],
+            ]
+        }
+    ],
+    "summary": {
+        "total_amount": 6999.90,
+        "invoice_count": 1,
+        "date_range": "2024-10-15"
+    }
+}
+
+DOCUMENT_MARKER = re.compile(r"=== DOCUMENT (\S+) ===")
+STREAM_PIECE_CHARS = 16  # roughly four tokens per streamed chunk
+
+app = FastAPI()
+calls = {"generateContent": 0, "streamGenerateContent": 0, "ok": 0, "rate_limited": 0, "unavailable": 0}
+recent_calls: list = []
+
+def candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+def over_quota() -> bool:
+    """Sliding one-second window of accepted calls"""
+    now = time.monotonic()
+    while recent_calls and now - recent_calls[0] > 1:
+        recent_calls.pop(0)
+    if faults["quota_rps"] and len(recent_calls) >= faults["quota_rps"]:
+        return True
+    recent_calls.append(now)
+    return False
+
+def error(status: int, message: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse({"error": {"code": status, "message": message}}, status_code=status, headers=headers)
+
+def injected_fault() -> Optional[JSONResponse]:
+    if faults["outage"] or random.random() < faults["error_rate"]:
+        calls["unavailable"] += 1
+        return error(503, "The model is overloaded. Please try again later.")
+    if over_quota():
+        calls["rate_limited"] += 1
+        return error(429, "Resource has been exhausted (e.g. check quota).", {"Retry-After": "1"})
+    return None
+
+def answer(payload: dict) -> str:
+    prompt = payload["contents"][0]["parts"][0]["text"]
+    doc_ids = DOCUMENT_MARKER.findall(prompt)
+    if doc_ids:
+        result = {"documents": {doc_id: CANNED_RESULT for doc_id in doc_ids}}
+    else:
+        result = CANNED_RESULT
+    return "```json\n" + json.dumps(result) + "\n```"
+
+@app.get("/v1beta/models/{model}")
+async def get_model(model: str):
+    """What the app's warm-up asks for; only opens the connection"""
+    return {"name": f"models/{model}"}
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, payload: dict):
+    calls["generateContent"] += 1
+    fault = injected_fault()
+    if fault:
+        return fault
+    await asyncio.sleep(faults["latency"])
+    calls["ok"] += 1
+    return candidate(answer(payload))
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, payload: dict):
+    """The same answer as Server-Sent Events: the first piece after a fifth of
+    the latency, the rest spread evenly over the remainder, like tokens"""
+    calls["streamGenerateContent"] += 1
+    fault = injected_fault()
+    if fault:
+        return fault
+    text = answer(payload)
+    pieces = [text[i:i + STREAM_PIECE_CHARS] for i in range(0, len(text), STREAM_PIECE_CHARS)]
+
+    async def events():
+        await asyncio.sleep(0.2 * faults["latency"])
+        for piece in pieces:
+            yield f"data: {json.dumps(candidate(piece))}\r\n\r\n"
+            await asyncio.sleep(0.8 * faults["latency"] / len(pieces))
+        calls["ok"] += 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def stats():
+    return calls
+
+@app.post("/faults")
+async def set_faults(changes: dict):
+    faults.update({key: value for key, value in changes.items() if key in faults})
+    return faults
@@ -0,0 +1,193 @@
+"""
+Near-duplicate detection quality and fingerprint index speed at scale.
+
+`accuracy` reads the text of a synthetic corpus (benchmarks/corpus.py), adds
+half of the documents to a FingerprintIndex, then looks up variants of them:
+re-issued copies that differ only in case and spacing (should be exact
+matches), copies with a "COPY" stamp and a new date, the same invoice with
+every amount changed, and one with a line item rewritten (should all be near
+matches). The other half, never added, should either miss or match a known
+document of the same template, never one of another template. It also
+reports how much shorter the prompt gets with the matched layout as a hint.
+
+`scale` fills an on-disk index with random signatures, a share of them
+clustered around a few templates as real traffic is, and reports insert
+rate, lookup latency for exact, near and unknown documents, and file size.
+
+    PYTHONPATH=. python benchmarks/fingerprints.py accuracy --count 300
+    PYTHONPATH=. python benchmarks/fingerprints.py scale --documents 1000000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+from app.services.extraction import build_prompt
+from app.services.fingerprint import PERMUTATIONS, Fingerprint, FingerprintIndex
+from app.services.text_layer import extract_pages, join_pages
+from benchmarks.corpus import add_arguments, build_corpus, spec_from_args
+from benchmarks.load_test import percentile
+
+AMOUNT = re.compile(r"\d[\d,]*\.\d\d")
+DATE = re.compile(r"(January|February|March|April|May|June|July|August|September|October|November|December) \d+, \d{4}")
+LAYOUT = [{"title": "Invoice Items", "headers": ["Item Code", "Description", "Quantity", "Unit Price", "Total"]}]
+
+
+def reissued(text, rng):
+    return "\n".join(line.upper() if rng.random() < 0.2 else "  " + line + " " for line in text.splitlines())
+
+
+def stamped(text, rng):
+    return "COPY - REISSUED\n" + DATE.sub("November 2, 2024", text)
+
+
+def new_amounts(text, rng):
+    return AMOUNT.sub(lambda m: f"{rng.uniform(1, 9999):,.2f}", text)
+
+
+def one_line_changed(text, rng):
+    lines = text.splitlines()
+    lines[rng.randrange(len(lines))] = "Replacement line item written for this invoice only"
+    return "\n".join(lines)
+
+
+VARIANTS = {"reissued": reissued, "stamped": stamped, "new_amounts": new_amounts,
+            "one_line_changed": one_line_changed}
+
+
+def accuracy(args):
+    manifest = build_corpus(spec_from_args(args))
+    documents = [(entry["style"], join_pages(page["text"] for page in extract_pages(
+                      os.path.join(manifest["directory"], entry["name"]))))
+                 for entry in manifest["files"]]
+    documents = [(style, text) for style, text in documents if text.strip()]
+    rng = random.Random(args.seed)
+    rng.shuffle(documents)
+    # Half the corpus is indexed; the other half plays the documents never seen
+    known, unseen = documents[:len(documents) // 2], documents[len(documents) // 2:]
+
+    index = FingerprintIndex(None, min_similarity=args.min_similarity)
+    index.add_many((Fingerprint.of(text), style, LAYOUT) for style, text in known)
+
+    report = {}
+
+    def record(kind, found, correct, similarity=None):
+        stats = report.setdefault(kind, {"cases": 0, "correct": 0, "found": {}, "similarities": []})
+        stats["cases"] += 1
+        stats["correct"] += correct
+        stats["found"][found] = stats["found"].get(found, 0) + 1
+        if similarity is not None:
+            stats["similarities"].append(similarity)
+
+    for style, text in known:
+        for kind, variant in VARIANTS.items():
+            match = index.lookup(Fingerprint.of(variant(text, rng)))
+            found = "miss" if match is None else ("exact" if match.exact else "near")
+            # The result key stands in for the style here
+            right = match is not None and match.result_key == style
+            record(kind, found, right and found == ("exact" if kind == "reissued" else "near"),
+                   match and match.similarity)
+    for style, text in unseen:
+        match = index.lookup(Fingerprint.of(text))
+        if match is None:
+            record("unseen", "miss", True)
+        else:
+            same = match.result_key == style
+            record("unseen", "same_template" if same else "other_template", same, match.similarity)
+
+    for stats in report.values():
+        stats["rate"] = round(stats.pop("correct") / stats["cases"], 3)
+        similarities = stats.pop("similarities")
+        if similarities:
+            stats["median_similarity"] = round(percentile(similarities, 50), 2)
+
+    plain = sum(len(build_prompt(text)) for _, text in known)
+    hinted = sum(len(build_prompt(text, LAYOUT)) for _, text in known)
+    report["prompt_chars"] = {"generic": plain, "with_layout": hinted, "saved": round(1 - hinted / plain, 3)}
+    return report
+
+
+def random_fingerprint(rng, near=None, changed=0.2):
+    """A random signature, or one sharing about 1 - changed of its values with `near`"""
+    if near is None:
+        signature = tuple(rng.getrandbits(32) for _ in range(PERMUTATIONS))
+    else:
+        signature = tuple(rng.getrandbits(32) if rng.random() < changed else value for value in near)
+    return Fingerprint(hashlib.sha256(rng.randbytes(16)).hexdigest(), signature)
+
+
+def timed_lookups(index, fingerprints):
+    latencies = []
+    for fingerprint in fingerprints:
+        started = time.perf_counter()
+        index.lookup(fingerprint)
+        latencies.append(1000 * (time.perf_counter() - started))
+    return {"p50_ms": round(percentile(latencies, 50), 3), "p99_ms": round(percentile(latencies, 99), 3)}
+
+
+def scale(args):
+    rng = random.Random(args.seed)
+    templates = [random_fingerprint(rng).signature for _ in range(args.templates)]
+    directory = tempfile.mkdtemp(prefix="fingerprints-")
+    path = os.path.join(directory, "index.sqlite3")
+    index = FingerprintIndex(path)
+
+    sample = []
+    started = time.perf_counter()
+    for start in range(0, args.documents, args.batch):
+        batch = []
+        for _ in range(min(args.batch, args.documents - start)):
+            if rng.random() < args.clustered:
+                fingerprint = random_fingerprint(rng, rng.choice(templates))
+            else:
+                fingerprint = random_fingerprint(rng)
+            batch.append((fingerprint, None, LAYOUT))
+        index.add_many(batch)
+        sample += [fingerprint for fingerprint, _, _ in batch[::100]]
+    insert_seconds = time.perf_counter() - started
+
+    probes = rng.sample(sample, min(len(sample), args.lookups))
+    report = {
+        "documents": args.documents,
+        "inserts_per_second": round(args.documents / insert_seconds),
+        "lookup": {
+            "exact": timed_lookups(index, probes),
+            "near": timed_lookups(index, [random_fingerprint(rng, p.signature) for p in probes]),
+            "unknown": timed_lookups(index, [random_fingerprint(rng) for _ in probes]),
+            "template": timed_lookups(index, [random_fingerprint(rng, rng.choice(templates)) for _ in probes]),
+        },
+    }
+    # Closing checkpoints the WAL into the database file
+    index.close()
+    report["file_mb"] = round(os.path.getsize(path) / 1e6, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    accuracy_parser = commands.add_parser("accuracy", help="match variants of a synthetic corpus")
+    add_arguments(accuracy_parser)
+    accuracy_parser.add_argument("--min-similarity", type=float, default=0.7)
+
+    scale_parser = commands.add_parser("scale", help="insert and lookup speed of a large index")
+    scale_parser.add_argument("--documents", type=int, default=1_000_000)
+    scale_parser.add_argument("--batch", type=int, default=10_000, help="documents per transaction")
+    scale_parser.add_argument("--templates", type=int, default=50)
+    scale_parser.add_argument("--clustered", type=float, default=0.3, help="share of documents near a template")
+    scale_parser.add_argument("--lookups", type=int, default=2000)
+    scale_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    report = accuracy(args) if args.command == "accuracy" else scale(args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+GeminiClient behaviour under injected failures from benchmarks/fake_gemini.py.
+
+Runs bursts of calls through the client while the fake server answers with
+random 503s, enforces a quota with 429s, goes down entirely, or responds
+slower than the call deadline, and reports success rates, retries, 429s seen
+and how quickly calls fail once the circuit is open.
+
+    uvicorn benchmarks.fake_gemini:app --port 9000
+    PYTHONPATH=. python benchmarks/gemini_resilience.py
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+
+from app.services.gemini_client import GeminiClient, GeminiError
+
+
+async def set_faults(fake_url, **faults):
+    async with httpx.AsyncClient() as client:
+        defaults = {"latency": 0.05, "error_rate": 0, "quota_rps": 0, "outage": False}
+        await client.post(f"{fake_url}/faults", json={**defaults, **faults})
+        return (await client.get(f"{fake_url}/stats")).json()
+
+
+async def fake_stats_since(fake_url, before):
+    async with httpx.AsyncClient() as client:
+        after = (await client.get(f"{fake_url}/stats")).json()
+    return {key: after[key] - before[key] for key in after}
+
+
+async def burst(client, calls, deadline=None):
+    async def one():
+        start = time.perf_counter()
+        try:
+            await client.generate("Extract the tables", deadline=deadline)
+            ok = True
+        except (httpx.HTTPError, GeminiError):
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(one() for _ in range(calls)))
+    latencies = sorted(seconds for _, seconds in outcomes)
+    return {
+        "calls": calls,
+        "succeeded": sum(ok for ok, _ in outcomes),
+        "seconds": round(time.perf_counter() - start, 2),
+        "max_call_ms": round(1000 * latencies[-1], 1),
+    }
+
+
+def make_client(fake_url, **options):
+    return GeminiClient(api_key="fake", api_base=f"{fake_url}/v1beta", model="fake",
+                        backoff_base=0.1, backoff_max=2.0, **options)
+
+
+async def scenario(name, fake_url, faults, calls, deadline=None, **options):
+    before = await set_faults(fake_url, **faults)
+    client = make_client(fake_url, **options)
+    try:
+        result = await burst(client, calls, deadline)
+        result["client"] = client.stats()
+        result["server"] = await fake_stats_since(fake_url, before)
+    finally:
+        await client.aclose()
+    return name, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fake-gemini", default="http://localhost:9000")
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    url, calls = args.fake_gemini, args.calls
+
+    report = dict([
+        await scenario("healthy", url, {}, calls),
+        await scenario("random_503s", url, {"error_rate": 0.3}, calls),
+        await scenario("quota_unpaced", url, {"quota_rps": 10}, calls, requests_per_minute=0),
+        await scenario("quota_paced", url, {"quota_rps": 10}, calls, requests_per_minute=600, burst=10),
+        await scenario("outage", url, {"outage": True}, calls, failure_threshold=5, reset_timeout=30),
+        await scenario("slow_model", url, {"latency": 3.0}, 5, deadline=1.0),
+    ])
+    await set_faults(url, latency=0.5)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,236 @@
+"""
+Fuzz the model-output parser with a corpus of malformed answers.
+
+Builds a deterministic corpus from well-formed extraction answers by
+truncating them, wrapping them in fences and prose, and injecting the
+mistakes models make: trailing or missing commas, single quotes, Python
+literals, unescaped quotes, comments and random character noise. Each case
+is parsed by the old fence/rfind + json.loads heuristic and by
+parse_model_output(), and, to check that streaming changes nothing, fed to
+TableStreamParser in random pieces. Reports per mutation how often each
+parser needs a re-request (no rows recovered), row recall and precision,
+crashes, and parse throughput.
+
+    PYTHONPATH=. python benchmarks/json_fuzz.py --cases 300 --seed 1
+    PYTHONPATH=. python benchmarks/json_fuzz.py --dump /tmp/bad-outputs
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import random
+import re
+import time
+
+from app.services.extraction import TableStreamParser, parse_model_output
+
+ANSWERS = [
+    {
+        "tables": [{
+            "title": "Invoice Items",
+            "headers": ["Description", "Quantity", "Unit Price", "Total"],
+            "rows": [
+                ["Dell Latitude 5520 Laptop", "5", "$1,200.00", "$6,000.00"],
+                ["Logitech MX Master 3 Mouse", "10", "$99.99", "$999.90"],
+                ["Dell 27\" UltraSharp Monitor", "5", "$450.00", "$2,250.00"],
+                ["USB-C Docking Station, 4K", "5", "$189.00", "$945.00"],
+            ],
+        }],
+        "summary": {"total_amount": 10194.9, "invoice_count": 1, "date_range": "2024-10-15"},
+    },
+    {
+        "tables": [
+            {
+                "title": "Services",
+                "headers": ["Description", "Quantity", "Unit Price", "Total"],
+                "rows": [[f"Consulting {{phase {i}}} [remote]", str(i), "$150", f"${150 * i:,.2f}"] for i in range(1, 25)],
+            },
+            {
+                "title": "Expenses",
+                "headers": ["Description", "Quantity", "Unit Price", "Total"],
+                "rows": [["Café déjeuner – client", "1", "€42.50", "€42.50"], ["Train ticket \\ return", "2", "$80", "$160"]],
+            },
+        ],
+        "summary": {"total_amount": 45202.5, "invoice_count": 1, "date_range": "September 1-30, 2024"},
+    },
+    {
+        "documents": {
+            f"doc{d}": {
+                "tables": [{
+                    "title": "Invoice Items",
+                    "headers": ["Description", "Quantity", "Unit Price", "Total"],
+                    "rows": [[f"Item {d}-{r}", str(r), "$10.00", f"${10 * r:.2f}"] for r in range(1, 8)],
+                }],
+                "summary": {"total_amount": 280.0, "invoice_count": 1, "date_range": None},
+            } for d in range(1, 5)
+        },
+    },
+]
+
+PROSE = ["Here is the extracted data:\n", "Sure! Below is the JSON you asked for.\n\n", ""]
+EPILOGUE = ["", "\nLet me know if you need anything else.", "\nNote: amounts are in {USD}."]
+
+
+def rows_of(answer):
+    documents = answer.get("documents")
+    answers = documents.values() if isinstance(documents, dict) else [answer]
+    return [tuple(map(str, row)) for doc in answers if isinstance(doc, dict)
+            for table in doc.get("tables") or [] if isinstance(table, dict)
+            for row in table.get("rows") or [] if isinstance(row, list)]
+
+
+def fenced(text, rng):
+    fence = rng.choice(["```json\n{}\n```", "```\n{}\n```", "{}"])
+    return rng.choice(PROSE) + fence.format(text) + rng.choice(EPILOGUE)
+
+
+def mutate(kind, answer, rng):
+    compact = rng.random() < 0.5
+    text = json.dumps(answer, ensure_ascii=rng.random() < 0.5, indent=None if compact else 2)
+    if kind == "clean":
+        return fenced(text, rng)
+    if kind == "truncated":
+        # Cut off mid-answer, so the closing fence never arrives either
+        return rng.choice(PROSE) + rng.choice(["```json\n", "```\n", ""]) + text[:rng.randrange(len(text) // 10, len(text))]
+    if kind == "trailing_commas":
+        # Only brackets that close a container, not ones inside strings like "[remote]"
+        return fenced(re.sub(r'(?<=["\]}])(\s*)([\]}])', r",\1\2", text), rng)
+    if kind == "missing_commas":
+        return fenced(text.replace("], [", "] [").replace('", "', '" "'), rng)
+    if kind == "single_quotes":
+        return fenced(text.replace('\\"', "″").replace('"', "'").replace("″", '"'), rng)
+    if kind == "python_literals":
+        return fenced(text.replace("null", "None").replace("true", "True").replace("false", "False"), rng)
+    if kind == "unescaped_quotes":
+        return fenced(text.replace('\\"', '"'), rng)
+    if kind == "comments":
+        return fenced(text.replace('"summary"', '// totals follow\n"summary"').replace('"rows"', '/* items */ "rows"'), rng)
+    if kind == "noise":
+        chars = list(text)
+        for _ in range(rng.randint(1, 4)):
+            i = rng.randrange(len(chars))
+            op = rng.choice(["drop", "dup", "insert"])
+            if op == "drop":
+                del chars[i]
+            elif op == "dup":
+                chars.insert(i, chars[i])
+            else:
+                chars.insert(i, rng.choice(',:"{}[] x'))
+        return fenced("".join(chars), rng)
+    raise ValueError(kind)
+
+
+MUTATIONS = ["clean", "truncated", "trailing_commas", "missing_commas", "single_quotes",
+             "python_literals", "unescaped_quotes", "comments", "noise"]
+
+
+def build_corpus(cases, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(cases):
+        kind = MUTATIONS[n % len(MUTATIONS)]
+        answer = copy.deepcopy(rng.choice(ANSWERS))
+        corpus.append({"kind": kind, "answer": answer, "text": mutate(kind, answer, rng)})
+    return corpus
+
+
+def legacy_parse(generated_text):
+    """parse_model_output() before the streaming parser"""
+    if "```json" in generated_text:
+        generated_text = generated_text.split("```json")[1].split("```")[0]
+    elif "{" in generated_text:
+        start = generated_text.find("{")
+        end = generated_text.rfind("}") + 1
+        generated_text = generated_text[start:end]
+    return json.loads(generated_text)
+
+
+def streamed_parse(text, rng):
+    parser = TableStreamParser()
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 40)
+        parser.feed(text[i:i + step])
+        i += step
+    return parser.result()
+
+
+def score(parse, corpus):
+    by_kind = {}
+    crashes = 0
+    seconds = 0.0
+    for case in corpus:
+        expected = rows_of(case["answer"])
+        started = time.perf_counter()
+        try:
+            got = rows_of(parse(case["text"]))
+        except ValueError:
+            got = []
+        except Exception:
+            crashes += 1
+            got = []
+        seconds += time.perf_counter() - started
+        stats = by_kind.setdefault(case["kind"], {"cases": 0, "rerequests": 0, "expected_rows": 0,
+                                                  "recovered_rows": 0, "correct_rows": 0})
+        stats["cases"] += 1
+        stats["rerequests"] += not got
+        stats["expected_rows"] += len(expected)
+        stats["recovered_rows"] += len(got)
+        stats["correct_rows"] += len(set(got) & set(expected))
+
+    report = {}
+    for kind, stats in by_kind.items():
+        report[kind] = {
+            "rerequest_rate": round(stats["rerequests"] / stats["cases"], 3),
+            "row_recall": round(stats["correct_rows"] / max(1, stats["expected_rows"]), 3),
+            "row_precision": round(stats["correct_rows"] / max(1, stats["recovered_rows"]), 3),
+        }
+    total_bytes = sum(len(case["text"]) for case in corpus)
+    report["overall"] = {
+        "rerequest_rate": round(sum(s["rerequests"] for s in by_kind.values()) / len(corpus), 3),
+        "crashes": crashes,
+        "mb_per_second": round(total_bytes / seconds / 1e6, 2),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", type=int, default=450)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dump", help="also write every case to this directory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    corpus = build_corpus(args.cases, args.seed)
+    if args.dump:
+        os.makedirs(args.dump, exist_ok=True)
+        for n, case in enumerate(corpus):
+            with open(os.path.join(args.dump, f"{n:04d}_{case['kind']}.txt"), "w") as f:
+                f.write(case["text"])
+
+    rng = random.Random(args.seed)
+    stream_mismatches = 0
+    for case in corpus:
+        try:
+            whole = parse_model_output(case["text"])
+        except ValueError:
+            whole = None
+        try:
+            pieces = streamed_parse(case["text"], rng)
+        except ValueError:
+            pieces = None
+        stream_mismatches += whole != pieces
+
+    print(json.dumps({
+        "cases": len(corpus),
+        "legacy": score(legacy_parse, corpus),
+        "streaming": score(parse_model_output, corpus),
+        "stream_mismatches": stream_mismatches,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Concurrency load test for /api/extract.
+
+Uploads the same PDF at increasing concurrency levels and reports latency
+percentiles for each level. With parsing in the process pool and Gemini calls
+on the shared async client, p99 should stay roughly flat from 1 to 64.
+
+    python benchmarks/load_test.py test-pdfs/invoice_001_digital.pdf \
+        --url http://localhost:8000 --levels 1 4 16 64 --requests 128
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(client, url, pdf_bytes, filename, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                f"{url}/api/extract",
+                files={"file": (filename, pdf_bytes, "application/pdf")},
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdf", help="PDF file to upload")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=128, help="requests per level")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+    filename = args.pdf.rsplit("/", 1)[-1]
+
+    limits = httpx.Limits(max_connections=max(args.levels))
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        results = []
+        for level in args.levels:
+            result = await run_level(client, args.url, pdf_bytes, filename, level, args.requests)
+            print(json.dumps(result))
+            results.append(result)
+
+    baseline = results[0]["p99_ms"]
+    worst = max(r["p99_ms"] for r in results)
+    print(f"p99 spread: {baseline} ms -> {worst} ms ({worst / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
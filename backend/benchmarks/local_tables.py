@@ -0,0 +1,74 @@
+"""
+Share of invoices the layout extractor serves without Gemini, and its latency.
+
+Runs the extractor in-process on each PDF, then uploads every PDF to the API
+and compares request latency of locally served and LLM-extracted documents.
+Run the API against benchmarks/fake_gemini.py with the result cache off:
+
+    FAKE_GEMINI_LATENCY=0.5 uvicorn benchmarks.fake_gemini:app --port 9000
+    CACHE_ENABLED=false GEMINI_API_KEY=fake \
+        GEMINI_API_BASE=http://localhost:9000/v1beta uvicorn app.main:app
+    PYTHONPATH=. python benchmarks/local_tables.py test-pdfs/*.pdf
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.table_extractor import extract_layout_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdfs", nargs="+", help="PDF files to extract")
+    parser.add_argument("--url", default="http://localhost:8000")
+    args = parser.parse_args()
+
+    documents = {}
+    for path in args.pdfs:
+        start = time.perf_counter()
+        data = extract_layout_tables(path)
+        elapsed = time.perf_counter() - start
+        confidence = data["confidence"] if data else None
+        documents[os.path.basename(path)] = {
+            "confidence": confidence,
+            "served_locally": confidence is not None and confidence >= settings.LOCAL_TABLES_MIN_CONFIDENCE,
+            "extract_ms": round(1000 * elapsed, 1),
+        }
+
+    request_ms = {"local": [], "llm": []}
+    with httpx.Client(timeout=600) as client:
+        for path in args.pdfs:
+            with open(path, "rb") as f:
+                content = f.read()
+            start = time.perf_counter()
+            response = client.post(
+                f"{args.url}/api/extract",
+                files={"file": (os.path.basename(path), content, "application/pdf")},
+            )
+            response.raise_for_status()
+            elapsed = 1000 * (time.perf_counter() - start)
+            extractor = response.json()["data"].get("extractor")
+            request_ms["local" if extractor == "layout" else "llm"].append(elapsed)
+        health = client.get(f"{args.url}/health").json()
+
+    served = sum(doc["served_locally"] for doc in documents.values())
+    report = {
+        "documents": documents,
+        "fraction_local": round(served / len(documents), 3),
+        "request_ms": {
+            path: round(statistics.mean(times), 1) if times else None
+            for path, times in request_ms.items()
+        },
+        "server": health.get("local_tables"),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Peak memory of PDF text extraction: buffered vs. streaming.
+
+Builds a long invoice with reportlab (500 pages by default) and measures the
+peak RSS of each strategy in a fresh subprocess:
+
+  buffered   read the whole file into bytes, wrap it in BytesIO, += page text
+  streaming  hand PyPDF2 the file on disk and join page text from a generator
+             (what /api/extract does now)
+
+    python benchmarks/memory_profile.py --pages 500
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def build_long_invoice(path, pages):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for page in range(pages):
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(50, height - 50, f"ACME CORPORATION - Statement page {page + 1}")
+        c.setFont("Helvetica", 9)
+        y = height - 80
+        for row in range(45):
+            item = page * 45 + row
+            c.drawString(50, y, f"SKU-{item:06d}")
+            c.drawString(130, y, f"Line item description number {item}")
+            c.drawString(380, y, str(row + 1))
+            c.drawString(430, y, "$19.99")
+            c.drawString(500, y, f"${(row + 1) * 19.99:,.2f}")
+            y -= 15
+        c.showPage()
+    c.save()
+
+
+def buffered(path):
+    import PyPDF2
+
+    with open(path, "rb") as f:
+        content = f.read()
+    reader = PyPDF2.PdfReader(io.BytesIO(content))
+    text = ""
+    for page in reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            text += page_text + "\n"
+    return text
+
+
+def streaming(path):
+    from app.services.text_layer import extract_pages, join_pages
+
+    return join_pages(page["text"] for page in extract_pages(path))
+
+
+def measure(mode, path):
+    """Child process entry point: run one strategy, print its stats"""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    text = {"buffered": buffered, "streaming": streaming}[mode](path)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": mode,
+        "seconds": round(elapsed, 2),
+        "chars": len(text),
+        "peak_rss_mb": round(peak / 1024, 1),
+        "growth_mb": round((peak - baseline) / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long_invoice.pdf")
+        build_long_invoice(path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        for mode in ("buffered", "streaming"):
+            subprocess.run([sys.executable, __file__, "--measure", mode, path], check=True)
+
+
+if __name__ == "__main__":
+    main()
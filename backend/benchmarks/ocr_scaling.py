@@ -0,0 +1,87 @@
+"""
+OCR wall time and memory versus worker count on a scanned-style invoice.
+
+Builds an image-only PDF (no text layer, 50 pages by default) and OCRs it
+with OCRService.fill_missing_pages at increasing worker counts. Needs the
+tesseract and poppler binaries.
+
+    python benchmarks/ocr_scaling.py --pages 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def build_scanned_invoice(path, pages):
+    from PIL import Image, ImageDraw
+
+    images = []
+    for page in range(pages):
+        image = Image.new("L", (1700, 2200), color=255)  # letter at 200 DPI
+        draw = ImageDraw.Draw(image)
+        draw.text((100, 80), f"ACME CORPORATION    INVOICE INV-2024-{page:04d}", fill=0)
+        y = 200
+        for row in range(40):
+            draw.text((100, y), f"SKU-{row:04d}   Line item {row}   {row + 1}   $19.99   ${(row + 1) * 19.99:,.2f}", fill=0)
+            y += 45
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=200)
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+async def ocr_all(path, workers, dpi):
+    """Every page through the worker pool, as the OCR stage runs it; the text of all pages"""
+    from app.services.ocr_service import OCRService
+    from app.services.text_layer import extract_pages
+    from app.services.workers import WorkerPool
+
+    pool = WorkerPool(max_workers=workers, max_pending=4 * workers)
+    try:
+        pages = await pool.run(extract_pages, path)
+        texts, _ = await OCRService(pool).fill_missing_pages(path, pages, max_dpi=dpi)
+    finally:
+        pool.shutdown()
+    return "\n".join(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scanned_invoice.pdf")
+        build_scanned_invoice(path, args.pages)
+
+        results = []
+        for workers in args.workers:
+            start = time.perf_counter()
+            text = asyncio.run(ocr_all(path, workers, args.dpi))
+            elapsed = time.perf_counter() - start
+            results.append({"mode": "streaming", "workers": workers, "seconds": round(elapsed, 2),
+                            "chars": len(text), "peak_rss_mb": peak_rss_mb()})
+            print(json.dumps(results[-1]))
+
+    base = results[0]["seconds"]
+    for result in results[1:]:
+        print(f"{result['workers']} workers: {base / result['seconds']:.2f}x speedup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+CPU time of reading every page against reading only the prompt budget's pages.
+
+Builds long statements of several lengths (benchmarks/memory_profile.py) and
+reads each with text_layer.extract_pages() and with extract_page_selection()
+under the default PageSelection, per installed fast backend. Reports process
+CPU seconds, pages parsed and characters kept. With a budget, CPU time should
+stay flat as the statement grows, since pages past the budget are never parsed.
+
+    PYTHONPATH=. python benchmarks/page_budget.py --pages 10 100 500
+    PYTHONPATH=. python benchmarks/page_budget.py --first 2 --last 1 --max-chars 16000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from app.services.pdf_backends import available_backends
+from app.services.text_layer import PageSelection, extract_page_selection, extract_pages
+from benchmarks.memory_profile import build_long_invoice
+
+
+def cpu(function, *args):
+    start = time.process_time()
+    result = function(*args)
+    return result, round(time.process_time() - start, 4)
+
+
+def measure(path, backend, selection):
+    pages, all_seconds = cpu(extract_pages, path, backend)
+    (count, selected), budget_seconds = cpu(extract_page_selection, path, selection, backend)
+    return {
+        "backend": backend,
+        "all": {"pages": len(pages), "cpu_seconds": all_seconds,
+                "chars": sum(len(page["text"]) for page in pages)},
+        "budget": {"pages": len(selected), "cpu_seconds": budget_seconds,
+                   "chars": sum(len(page["text"]) for page in selected),
+                   "read": [page["page"] for page in selected]},
+        "speedup": round(all_seconds / budget_seconds, 1) if budget_seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300], help="statement lengths")
+    parser.add_argument("--backends", nargs="+", help="default: every installed backend but pdfminer")
+    parser.add_argument("--first", type=int, default=1)
+    parser.add_argument("--last", type=int, default=1)
+    parser.add_argument("--keywords", nargs="*", default=[])
+    parser.add_argument("--max-chars", type=int, default=8000)
+    args = parser.parse_args()
+
+    backends = args.backends or [name for name in available_backends() if name != "pdfminer"]
+    selection = PageSelection(first=args.first, last=args.last, keywords=tuple(args.keywords),
+                              max_chars=args.max_chars)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            path = os.path.join(tmp, f"statement_{pages}.pdf")
+            build_long_invoice(path, pages)
+            for backend in backends:
+                results.append({"statement_pages": pages, **measure(path, backend, selection)})
+    print(json.dumps({"selection": selection.key, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
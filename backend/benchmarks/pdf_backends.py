@@ -0,0 +1,113 @@
+"""
+Text layer throughput and memory of each PDF parser backend.
+
+Parses a synthetic corpus (benchmarks/corpus.py) and one long statement with
+every installed backend in app/services/pdf_backends.py, each in a fresh
+subprocess so peak RSS is its own. Reports pages per second for text only
+and for text with positions (what the layout and template extractors read),
+peak RSS, and how often the layout extractor still finds the same tables as
+with PyPDF2.
+
+    PYTHONPATH=. python benchmarks/pdf_backends.py --count 200 --long-pages 500
+    PYTHONPATH=. python benchmarks/pdf_backends.py --backends pypdf2 pypdfium2 --long-pages 0
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.services.pdf_backends import available_backends, get_backend
+from app.services.table_extractor import extract_layout_tables
+from benchmarks.corpus import add_arguments, build_corpus, spec_from_args
+from benchmarks.memory_profile import build_long_invoice
+
+
+def parse_all(backend, paths, positions):
+    pages = 0
+    chars = 0
+    start = time.perf_counter()
+    for path in paths:
+        for page in backend.iter_pages(path, positions=positions):
+            pages += 1
+            chars += len(page.text)
+    elapsed = time.perf_counter() - start
+    return {"pages": pages, "chars": chars, "seconds": round(elapsed, 3),
+            "pages_per_second": round(pages / elapsed, 1) if elapsed else None}
+
+
+def measure(name, listing):
+    """Child process entry point: parse the listed PDFs with one backend, print its stats"""
+    with open(listing) as f:
+        paths = json.load(f)
+    backend = get_backend(name)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report = {"backend": name, "text": parse_all(backend, paths, False),
+              "positions": parse_all(backend, paths, True)}
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report["peak_rss_mb"] = round(peak / 1024, 1)
+    report["growth_mb"] = round((peak - baseline) / 1024, 1)
+    print(json.dumps(report))
+
+
+def layout_agreement(names, paths):
+    """Share of documents whose layout-extracted tables match PyPDF2's, per backend"""
+    reference = {}
+    for path in paths:
+        data = extract_layout_tables(path, "pypdf2")
+        reference[path] = data and data["tables"]
+    agreement = {}
+    for name in names:
+        same = 0
+        for path in paths:
+            data = extract_layout_tables(path, name)
+            same += (data and data["tables"]) == reference[path]
+        agreement[name] = round(same / len(paths), 3) if paths else None
+    return agreement
+
+
+def run_set(label, names, paths, listing):
+    with open(listing, "w") as f:
+        json.dump(paths, f)
+    results = {}
+    for name in names:
+        output = subprocess.run([sys.executable, __file__, "--measure", name, listing],
+                                check=True, capture_output=True, text=True).stdout
+        results[name] = json.loads(output.splitlines()[-1])
+    return {"set": label, "files": len(paths), "backends": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    parser.add_argument("--backends", nargs="+", help="default: every installed backend")
+    parser.add_argument("--long-pages", type=int, default=300, help="pages of the long statement; 0 skips it")
+    parser.add_argument("--measure", nargs=2, metavar=("BACKEND", "LISTING"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    names = args.backends or available_backends()
+    manifest = build_corpus(spec_from_args(args))
+    paths = [os.path.join(manifest["directory"], entry["name"]) for entry in manifest["files"]
+             if entry["style"] != "scanned"]
+    with tempfile.TemporaryDirectory() as tmp:
+        listing = os.path.join(tmp, "listing.json")
+        report = {"corpus": manifest["key"], "sets": [run_set("corpus", names, paths, listing)]}
+        if args.long_pages:
+            long_path = os.path.join(tmp, f"statement_{args.long_pages}.pdf")
+            build_long_invoice(long_path, args.long_pages)
+            report["sets"].append(run_set(f"statement_{args.long_pages}", names, [long_path], listing))
+
+    report["layout_agreement"] = layout_agreement([name for name in names if name != "pypdf2"], paths)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
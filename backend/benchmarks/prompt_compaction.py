@@ -0,0 +1,110 @@
+"""
+Tokens sent to Gemini with and without prompt compaction, on the synthetic invoice set.
+
+For every text-layer invoice of a synthetic corpus (benchmarks/corpus.py),
+builds the extraction prompt from the text as read and from the text after
+app/services/compaction.py, and reports estimated tokens for both, and for
+the text as read under the longer prompt used before PROMPT_VERSION 4. As an
+accuracy check that needs no model, the line items the layout extractor
+finds serve as ground truth: every cell must still be in the compacted
+text (cells kept), and a row reads best when its cells share one line
+(rows on one line).
+
+    PYTHONPATH=. python benchmarks/prompt_compaction.py --count 120
+    PYTHONPATH=. python benchmarks/prompt_compaction.py --count 40 --pages 2-4
+"""
+
+import argparse
+import json
+import os
+import time
+
+from app.services.chunking import estimate_tokens
+from app.services.compaction import compact_pages
+from app.services.extraction import build_prompt
+from app.services.table_extractor import extract_layout_tables
+from app.services.text_layer import extract_pages, join_pages
+from benchmarks.corpus import add_arguments, build_corpus, spec_from_args
+
+# Estimated tokens of the version 3 prompt without the invoice text, kept for comparison
+PROMPT_V3_OVERHEAD_TOKENS = 276
+
+
+def row_checks(text, rows):
+    """(cells found anywhere, cells, rows whose cells all sit on one line, rows)"""
+    lines = text.splitlines()
+    found = together = cells = 0
+    for row in rows:
+        row_cells = [str(cell) for cell in row if str(cell)]
+        cells += len(row_cells)
+        found += sum(cell in text for cell in row_cells)
+        together += any(all(cell in line for cell in row_cells) for line in lines)
+    return found, cells, together, len(rows)
+
+
+def measure(path):
+    pages = extract_pages(path, "pypdf2")
+    for page in pages:
+        page["source"] = "text_layer"
+    page_texts = [page["text"] for page in pages]
+    raw = join_pages(page_texts)
+    started = time.perf_counter()
+    compact = join_pages(compact_pages(path, pages, page_texts, "pypdf2"))
+    seconds = time.perf_counter() - started
+    reference = extract_layout_tables(path, "pypdf2")
+    rows = [row for table in (reference or {}).get("tables", []) for row in table["rows"]]
+    return {
+        "pages": len(pages),
+        "text_tokens": (estimate_tokens(raw), estimate_tokens(compact)),
+        "prompt_tokens": (estimate_tokens(build_prompt(raw)), estimate_tokens(build_prompt(compact))),
+        "rows": (row_checks(raw, rows), row_checks(compact, rows)),
+        "seconds": seconds,
+    }
+
+
+def summarize(results):
+    def total(key, i):
+        return sum(result[key][i] for result in results)
+
+    def share(i, j):
+        denominator = sum(result["rows"][i][j + 1] for result in results)
+        return round(sum(result["rows"][i][j] for result in results) / denominator, 3) if denominator else None
+
+    raw, compact = total("prompt_tokens", 0), total("prompt_tokens", 1)
+    v3 = total("text_tokens", 0) + PROMPT_V3_OVERHEAD_TOKENS * len(results)
+    return {
+        "documents": len(results),
+        "pages": sum(result["pages"] for result in results),
+        "text_tokens": {"raw": total("text_tokens", 0), "compact": total("text_tokens", 1)},
+        "prompt_tokens": {"v3_raw": v3, "raw": raw, "compact": compact,
+                          "saved_vs_v3": round(1 - compact / v3, 3) if v3 else None,
+                          "saved_vs_raw": round(1 - compact / raw, 3) if raw else None},
+        "cells_kept": {"raw": share(0, 0), "compact": share(1, 0)},
+        "rows_on_one_line": {"raw": share(0, 2), "compact": share(1, 2)},
+        "compaction_ms_per_document": round(1000 * sum(r["seconds"] for r in results) / len(results), 2)
+        if results else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    manifest = build_corpus(spec_from_args(args))
+    by_style = {}
+    for entry in manifest["files"]:
+        if entry["style"] == "scanned":
+            continue
+        by_style.setdefault(entry["style"], []).append(measure(os.path.join(manifest["directory"], entry["name"])))
+    report = {
+        "corpus": manifest["key"],
+        "prompt_overhead_tokens": estimate_tokens(build_prompt("")),
+        "all": summarize([result for results in by_style.values() for result in results]),
+        "styles": {style: summarize(results) for style, results in sorted(by_style.items())},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
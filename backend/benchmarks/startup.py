@@ -0,0 +1,104 @@
+"""
+Cold start of the API: import-time profile and time to a healthy /health.
+
+Imports app.main in a fresh interpreter under `python -X importtime` and
+reports the total, the slowest packages by their own import time and which
+of the heavy optional libraries (parsers, OCR, pyarrow) were loaded; those
+are only needed inside parse workers or on first use, so none should be.
+Then starts `uvicorn app.main:app` --runs times and reports the seconds from
+process start to the first 200 from /health. Exits non-zero when a budget is
+exceeded or a heavy library is imported, so CI can run it as a check.
+
+    PYTHONPATH=. python benchmarks/startup.py --runs 5
+    PYTHONPATH=. python benchmarks/startup.py --import-budget-ms 800 --healthy-budget-ms 2500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Needed only in parse and OCR workers, or by one endpoint, so never by importing the app
+HEAVY_MODULES = ("PyPDF2", "pypdfium2", "pdfminer", "pdf2image", "pytesseract", "PIL", "pyarrow")
+
+
+def import_profile(module, top, repeats=3):
+    """The fastest of a few -X importtime runs, with own time summed per top-level package"""
+    return min((profile_once(module, top) for _ in range(repeats)), key=lambda profile: profile["total_ms"])
+
+
+def profile_once(module, top):
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True).stderr
+    packages = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+        if name.strip() == module:
+            total = int(cumulative)
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {
+        "module": module,
+        "total_ms": round(total / 1000, 1),
+        "slowest_packages_ms": {package: round(us / 1000, 1) for package, us in slowest},
+        "heavy_loaded": [name for name in HEAVY_MODULES if name in packages],
+    }
+
+
+def time_to_healthy(port, timeout=60):
+    env = {**os.environ, "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "fake")}
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {process.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        raise RuntimeError("/health did not answer")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=3, help="server starts to time; 0 profiles imports only")
+    parser.add_argument("--top", type=int, default=15, help="slowest packages to list")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--import-budget-ms", type=float, help="fail when importing the app takes longer")
+    parser.add_argument("--healthy-budget-ms", type=float, help="fail when the median time to /health is longer")
+    args = parser.parse_args()
+
+    report = {"imports": import_profile(args.module, args.top)}
+    failures = [f"{name} is imported at startup" for name in report["imports"]["heavy_loaded"]]
+    if args.import_budget_ms and report["imports"]["total_ms"] > args.import_budget_ms:
+        failures.append(f"import took {report['imports']['total_ms']} ms, budget {args.import_budget_ms}")
+    if args.runs:
+        seconds = [time_to_healthy(args.port) for _ in range(args.runs)]
+        healthy_ms = round(statistics.median(seconds) * 1000, 1)
+        report["healthy"] = {"runs": [round(s * 1000, 1) for s in seconds], "median_ms": healthy_ms}
+        if args.healthy_budget_ms and healthy_ms > args.healthy_budget_ms:
+            failures.append(f"/health took {healthy_ms} ms, budget {args.healthy_budget_ms}")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Time to first table: /api/extract/stream versus /api/extract.
+
+Uploads a PDF to both endpoints in turn and reports, per endpoint, when the
+first byte, the page count, the first table and the full result arrived.
+Every upload gets a unique trailing comment so the result cache never
+answers. Run the app against benchmarks/fake_gemini.py with the layout
+extractor off, so the tables come from the streamed model answer.
+
+    FAKE_GEMINI_LATENCY=1.0 uvicorn benchmarks.fake_gemini:app --port 9000
+    LOCAL_TABLES_ENABLED=false GEMINI_API_KEY=fake \
+        GEMINI_API_BASE=http://localhost:9000/v1beta uvicorn app.main:app
+    python benchmarks/streaming.py test-pdfs/invoice_005_summary.pdf --requests 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from load_test import percentile
+
+
+def unique(pdf_bytes, n):
+    # Bytes after %%EOF are ignored by PDF readers but change the sha256
+    return pdf_bytes + f"\n% benchmark upload {n} {time.time_ns()}\n".encode()
+
+
+async def full(client, url, filename, pdf_bytes):
+    start = time.perf_counter()
+    response = await client.post(f"{url}/api/extract", files={"file": (filename, pdf_bytes, "application/pdf")})
+    response.raise_for_status()
+    done = time.perf_counter() - start
+    return {"first_byte": done, "pages": done, "first_table": done, "result": done}
+
+
+async def streamed(client, url, filename, pdf_bytes):
+    start = time.perf_counter()
+    marks = {}
+    async with client.stream("POST", f"{url}/api/extract/stream",
+                             files={"file": (filename, pdf_bytes, "application/pdf")}) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            marks.setdefault("first_byte", time.perf_counter() - start)
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                if event == "error":
+                    raise RuntimeError(json.loads(line[6:])["detail"])
+                name = {"pages": "pages", "table": "first_table", "result": "result"}.get(event)
+                if name:
+                    marks.setdefault(name, time.perf_counter() - start)
+    return marks
+
+
+async def measure(endpoint, client, url, filename, pdf_bytes, requests):
+    samples = []
+    for n in range(requests):
+        samples.append(await endpoint(client, url, filename, unique(pdf_bytes, n)))
+    return {
+        mark: {
+            "p50_ms": round(1000 * percentile([s[mark] for s in samples if mark in s], 50), 1),
+            "p95_ms": round(1000 * percentile([s[mark] for s in samples if mark in s], 95), 1),
+        }
+        for mark in ("first_byte", "pages", "first_table", "result")
+        if any(mark in s for s in samples)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("pdf", help="PDF file to upload")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=10, help="uploads per endpoint")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+    filename = os.path.basename(args.pdf)
+    async with httpx.AsyncClient(timeout=120) as client:
+        report = {
+            "/api/extract": await measure(full, client, args.url, filename, pdf_bytes, args.requests),
+            "/api/extract/stream": await measure(streamed, client, args.url, filename, pdf_bytes, args.requests),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
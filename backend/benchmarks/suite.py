@@ -0,0 +1,230 @@
+"""
+Reproducible end-to-end benchmark of the extraction pipeline.
+
+Runs a synthetic corpus from benchmarks/corpus.py through the engine the app
+builds (pipeline.build_engine), with Gemini replaced by an in-process stub
+that answers after a configurable latency, so the numbers depend only on the
+code and the machine. Reports throughput, latency percentiles, per-stage
+time, LLM calls and peak RSS as JSON, by default to
+benchmarks/results/<commit>.json; `compare` diffs two reports and exits
+non-zero when a metric regressed past the threshold.
+
+    PYTHONPATH=. python benchmarks/suite.py run --count 500 --llm-latency 0.3
+    PYTHONPATH=. python benchmarks/suite.py run --count 500 --batch-size 10 --no-layout
+    PYTHONPATH=. python benchmarks/suite.py compare benchmarks/results/a1b2c3d.json benchmarks/results/e4f5a6b.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.services.ocr_service import OCRService
+from app.services.pipeline import Document, ExtractionEngine, build_engine
+from app.services.workers import WorkerPool
+from benchmarks.corpus import add_arguments, build_corpus, spec_from_args
+from benchmarks.fake_gemini import CANNED_RESULT, DOCUMENT_MARKER
+from benchmarks.load_test import percentile
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class StubGemini:
+    """Answers like benchmarks/fake_gemini.py, in process, after `latency` seconds"""
+
+    def __init__(self, latency, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.prompt_chars = 0
+        self._rng = random.Random(seed)
+
+    async def generate(self, prompt, deadline=None):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+        doc_ids = DOCUMENT_MARKER.findall(prompt)
+        result = {"documents": {doc_id: CANNED_RESULT for doc_id in doc_ids}} if doc_ids else CANNED_RESULT
+        return "```json\n" + json.dumps(result) + "\n```"
+
+
+def summarize(values):
+    if not values:
+        return {}
+    return {
+        "mean": round(sum(values) / len(values), 2),
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"main": round(own / 1024, 1), "workers": round(children / 1024, 1)}
+
+
+async def process(engine, paths, concurrency, batch_size):
+    """Run every path through the engine; returns the documents and per-unit latencies in ms"""
+    semaphore = asyncio.Semaphore(concurrency)
+    docs = [Document(path, os.path.basename(path)) for path in paths]
+    units = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+    latencies = []
+
+    async def one(unit):
+        async with semaphore:
+            started = time.perf_counter()
+            await engine.run_many(unit)
+            latencies.append(1000 * (time.perf_counter() - started))
+
+    await asyncio.gather(*(one(unit) for unit in units))
+    return docs, latencies
+
+
+async def run(args):
+    manifest = build_corpus(spec_from_args(args))
+    paths = [os.path.join(manifest["directory"], entry["name"]) for entry in manifest["files"]]
+    run_settings = settings.model_copy(update={
+        "LOCAL_TABLES_ENABLED": args.layout,
+        "OCR_ENABLED": args.ocr,
+    })
+    worker_pool = WorkerPool(max_workers=args.workers, max_pending=settings.MAX_CONCURRENT_PARSES)
+    stub = StubGemini(args.llm_latency, args.llm_jitter)
+    engine: ExtractionEngine = build_engine(
+        run_settings,
+        worker_pool=worker_pool,
+        ocr_service=OCRService(worker_pool),
+        client=stub,
+    )
+    try:
+        # Start the worker processes before the clock does
+        await process(engine, paths[:args.warmup], args.concurrency, args.batch_size)
+        stub.calls = stub.prompt_chars = 0
+        started = time.perf_counter()
+        docs, latencies = await process(engine, paths, args.concurrency, args.batch_size)
+        wall = time.perf_counter() - started
+    finally:
+        worker_pool.shutdown()
+
+    stages = {}
+    for doc in docs:
+        for name, ms in doc.timings.items():
+            stages.setdefault(name, []).append(ms)
+    pages = sum(len(doc.pages or []) for doc in docs)
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("command", "output")},
+        "corpus": {"key": manifest["key"], "documents": len(docs),
+                   "bytes": sum(entry["bytes"] for entry in manifest["files"]),
+                   "styles": dict(Counter(entry["style"] for entry in manifest["files"]))},
+        "results": {
+            "seconds": round(wall, 3),
+            "documents_per_second": round(len(docs) / wall, 2),
+            "pages_per_second": round(pages / wall, 2),
+            # Per engine call: one document, or one batch with --batch-size
+            "latency_ms": summarize(latencies),
+            "stage_ms": {name: summarize(values) for name, values in stages.items()},
+            "outcomes": dict(Counter(ExtractionEngine.outcome(doc) for doc in docs)),
+            "llm_calls": stub.calls,
+            "llm_prompt_chars": stub.prompt_chars,
+            "peak_rss_mb": peak_rss_mb(),
+        },
+    }
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        items = {}
+        for key, inner in value.items():
+            items.update(flatten(inner, f"{prefix}.{key}" if prefix else key))
+        return items
+    return {prefix: value} if isinstance(value, (int, float)) else {}
+
+
+def compare(before, after, threshold):
+    """Print each metric's change; returns the names of metrics that got worse than threshold %"""
+    if before["parameters"] != after["parameters"] or before["machine"] != after["machine"]:
+        print("warning: the reports were run with different parameters or on different machines")
+    old, new = flatten(before["results"]), flatten(after["results"])
+    print(f"{'metric':<40} {before['commit']:>12} {after['commit']:>12} {'change':>9}")
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if name.startswith("outcomes."):
+            continue
+        change = 100 * (new[name] - old[name]) / old[name] if old[name] else 0.0
+        # Throughput should go up; times, calls and memory should go down
+        worse = -change if name.endswith("per_second") else change
+        # Sub-millisecond stage times are timer noise
+        flag = "  <-- regression" if worse > threshold and max(old[name], new[name]) >= 1 else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<40} {old[name]:>12g} {new[name]:>12g} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark the pipeline on a synthetic corpus")
+    add_arguments(run_parser)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--batch-size", type=int, default=1, help="documents per engine.run_many call")
+    run_parser.add_argument("--workers", type=int, default=settings.PDF_PARSE_WORKERS)
+    run_parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stub Gemini call")
+    run_parser.add_argument("--llm-jitter", type=float, default=0.0)
+    run_parser.add_argument("--layout", action=argparse.BooleanOptionalAction, default=settings.LOCAL_TABLES_ENABLED)
+    run_parser.add_argument("--ocr", action=argparse.BooleanOptionalAction, default=settings.OCR_ENABLED)
+    run_parser.add_argument("--warmup", type=int, default=3)
+    run_parser.add_argument("--output", help="report path (default: benchmarks/results/<commit>.json)")
+
+    compare_parser = commands.add_parser("compare", help="diff two reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="percent change that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        sys.exit(1 if compare(before, after, args.threshold) else 0)
+
+    logging.basicConfig(level=logging.ERROR)
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Vendor template learning on a synthetic corpus.
+
+Runs the corpus from benchmarks/corpus.py through the engine one document at
+a time with the layout extractor off, so every document would otherwise need
+Gemini. Gemini is replaced by an oracle that answers, after a configurable
+latency, with the extraction of the document in the prompt as read by the
+layout extractor. Templates are learned from the first documents of each
+vendor and layout; the report gives the template hit rate, LLM calls
+avoided, latency saved, and how many template results are wrong: a row
+count other than the corpus manifest's, or, where the oracle's answer is
+complete, rows or a total other than the oracle's.
+
+    PYTHONPATH=. python benchmarks/templates.py --count 300 --llm-latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+from app.config import settings
+from app.services.ocr_service import OCRService
+from app.services.pipeline import Document, ExtractionEngine, build_engine
+from app.services.table_extractor import extract_layout_tables
+from app.services.templates import TemplateRegistry
+from app.services.text_layer import extract_pages, join_pages
+from app.services.workers import WorkerPool
+from benchmarks.corpus import add_arguments, build_corpus, spec_from_args
+
+
+class OracleGemini:
+    """Answers with the known extraction of whichever document the prompt contains"""
+
+    def __init__(self, answers, latency):
+        self.answers = answers  # document text -> result
+        self.latency = latency
+        self.calls = 0
+
+    async def generate(self, prompt, deadline=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for text, result in self.answers.items():
+            if text in prompt:
+                return json.dumps(result)
+        return json.dumps({"tables": [], "summary": None})
+
+
+def document_key(path):
+    """The start of a document's text, which the oracle finds in prompts"""
+    return join_pages(page["text"] for page in extract_pages(path)).strip()[:400]
+
+
+def rows_of(data):
+    return [tuple(row) for table in data.get("tables") or [] for row in table.get("rows") or []]
+
+
+async def run(args):
+    manifest = build_corpus(spec_from_args(args))
+    entries = {os.path.join(manifest["directory"], entry["name"]): entry for entry in manifest["files"]
+               if entry["style"] != "scanned"}
+    paths = list(entries)
+    answers = {}
+    for path in paths:
+        truth = extract_layout_tables(path)
+        if truth is not None:
+            truth = {key: value for key, value in truth.items() if key not in ("extractor", "confidence")}
+            answers[document_key(path)] = truth
+
+    worker_pool = WorkerPool(max_workers=args.workers, max_pending=settings.MAX_CONCURRENT_PARSES)
+    oracle = OracleGemini(answers, args.llm_latency)
+    registry = TemplateRegistry(None)
+    engine: ExtractionEngine = build_engine(
+        settings.model_copy(update={"LOCAL_TABLES_ENABLED": False, "OCR_ENABLED": False}),
+        worker_pool=worker_pool,
+        ocr_service=OCRService(worker_pool),
+        client=oracle,
+        templates=registry,
+    )
+    wrong = 0
+    started = time.perf_counter()
+    try:
+        docs = []
+        for path in paths:
+            doc = await engine.run(Document(path, os.path.basename(path)))
+            docs.append(doc)
+            if ExtractionEngine.outcome(doc) == "template":
+                rows = rows_of(doc.data)
+                truth = answers.get(document_key(path))
+                # The layout extractor stops at a page break, so its answer can be short
+                complete = truth is not None and len(rows_of(truth)) == entries[path]["rows"]
+                wrong += len(rows) != entries[path]["rows"] or (complete and (
+                    rows != rows_of(truth) or doc.data["summary"]["total_amount"] != truth["summary"]["total_amount"]))
+    finally:
+        worker_pool.shutdown()
+    wall = time.perf_counter() - started
+
+    structure = engine.stage("structure")
+    return {
+        "documents": len(docs),
+        "seconds": round(wall, 2),
+        "outcomes": dict(Counter(ExtractionEngine.outcome(doc) for doc in docs)),
+        "llm_calls": oracle.calls,
+        "template_results_wrong": wrong,
+        "registry": registry.stats(),
+        "structure": structure.stats.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per oracle Gemini call")
+    parser.add_argument("--workers", type=int, default=settings.PDF_PARSE_WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Throughput of the gunicorn deployment as web workers are added, and drain on restart.
+
+Starts `gunicorn app.main:app -c gunicorn.conf.py` with each worker count in
+turn, pointed at benchmarks/fake_gemini.py with the result cache and
+fingerprints off so every upload is parsed, and posts a synthetic corpus
+(benchmarks/corpus.py) to /api/extract at a fixed concurrency per worker.
+Reports documents per second, p95 latency and scaling efficiency against
+one worker; near 1.0 up to the core count is the goal, and above the core
+count it can only fall. With --drain, sends SIGTERM while requests are in
+flight and counts how many still complete.
+
+    FAKE_GEMINI_LATENCY=0.2 uvicorn benchmarks.fake_gemini:app --port 9000
+    PYTHONPATH=. python benchmarks/worker_scaling.py --workers 1 2 4 --count 120 --drain
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.corpus import add_arguments, build_corpus, spec_from_args
+from benchmarks.load_test import percentile
+
+
+def start_server(workers, port, fake_gemini):
+    env = {
+        **os.environ,
+        "WEB_WORKERS": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+        "PDF_PARSE_WORKERS": str(workers),
+        "GEMINI_API_KEY": "fake",
+        "GEMINI_API_BASE": f"{fake_gemini}/v1beta",
+        "CACHE_ENABLED": "false",
+        "FINGERPRINT_ENABLED": "false",
+        "TEMPLATES_ENABLED": "false",
+    }
+    return subprocess.Popen([sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_healthy(client, url, process, timeout=60):
+    """Seconds from now until /health answers, which with WARM_UP is after the warm-up"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            if (await client.get(f"{url}/health")).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("gunicorn did not become healthy")
+
+
+async def post_all(client, url, files, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(name, data):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/api/extract", files={"file": (name, data, "application/pdf")})
+                errors += response.status_code != 200
+            except httpx.TransportError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(name, data) for name, data in files))
+    return time.perf_counter() - started, latencies, errors
+
+
+async def measure(workers, files, args):
+    url = f"http://127.0.0.1:{args.port}"
+    process = start_server(workers, args.port, args.fake_gemini)
+    try:
+        async with httpx.AsyncClient(timeout=300, limits=httpx.Limits(max_connections=256)) as client:
+            startup = await wait_healthy(client, url, process)
+            # One pass first so every worker has served a request before the timed one
+            await post_all(client, url, files[:args.concurrency * workers], args.concurrency * workers)
+            elapsed, latencies, errors = await post_all(client, url, files, args.concurrency * workers)
+            result = {
+                "workers": workers,
+                "startup_seconds": round(startup, 2),
+                "documents": len(files),
+                "errors": errors,
+                "docs_per_second": round(len(files) / elapsed, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            }
+            if args.drain:
+                result["drain"] = await drain(client, url, process, files[:args.concurrency * workers])
+            return result
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
+
+
+async def drain(client, url, process, files):
+    """SIGTERM once the requests are in flight; with a graceful drain every one of them completes"""
+    posting = asyncio.create_task(post_all(client, url, files, len(files)))
+    await asyncio.sleep(0.2)
+    process.send_signal(signal.SIGTERM)
+    _, _, errors = await posting
+    return {"in_flight": len(files), "completed": len(files) - errors}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight per web worker")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--fake-gemini", default="http://localhost:9000")
+    parser.add_argument("--drain", action="store_true", help="also check a SIGTERM mid-load loses no request")
+    args = parser.parse_args()
+
+    manifest = build_corpus(spec_from_args(args))
+    files = []
+    for entry in manifest["files"]:
+        with open(os.path.join(manifest["directory"], entry["name"]), "rb") as f:
+            files.append((entry["name"], f.read()))
+
+    results = []
+    for workers in args.workers:
+        result = await measure(workers, files, args)
+        print(json.dumps(result))
+        results.append(result)
+    baseline = results[0]["docs_per_second"] / results[0]["workers"]
+    for result in results:
+        result["efficiency"] = round(result["docs_per_second"] / (baseline * result["workers"]), 2)
+    print(json.dumps({"corpus": manifest["key"], "cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
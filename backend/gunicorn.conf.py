@@ -0,0 +1,54 @@
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+One web worker per core unless WEB_WORKERS says otherwise. Each worker is
+a full copy of the app with its own parse pool and Gemini client, so the
+deployment-wide limits in app/config.py are divided between them; caches,
+fingerprints, templates and the job queue are SQLite files all workers
+share. /metrics sums the counters every worker leaves in METRICS_DIR, while
+/health shows only the answering worker's. On SIGTERM gunicorn stops
+accepting connections and gives workers SHUTDOWN_DRAIN_SECONDS to finish
+what they hold.
+"""
+
+import os
+
+workers = int(os.getenv("WEB_WORKERS") or 0) or os.cpu_count() or 1
+# Read by app.config in every worker, so it has to be set before the first import of it
+os.environ["WEB_WORKERS"] = str(workers)
+os.environ["JOB_REQUEUE_ON_START"] = "false"
+
+from app.config import settings  # noqa: E402
+
+worker_class = "uvicorn_worker.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+graceful_timeout = int(settings.SHUTDOWN_DRAIN_SECONDS)
+# UvicornWorker sends its heartbeat from the event loop, so long async requests do not
+# count against this; a worker whose loop is stuck this long, on a blocking call, is restarted
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+
+def on_starting(server):
+    """Once, in the master: make the cache dirs, reset worker metrics and requeue jobs left running"""
+    from app.services.jobs import create_job_store
+
+    for path in (settings.CACHE_PATH, settings.FINGERPRINT_PATH, settings.TEMPLATES_PATH, settings.JOB_DB_PATH):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.makedirs(settings.JOB_UPLOAD_DIR, exist_ok=True)
+    # Counters start again from zero with the new workers
+    if os.path.isdir(settings.METRICS_DIR):
+        for name in os.listdir(settings.METRICS_DIR):
+            os.remove(os.path.join(settings.METRICS_DIR, name))
+    if settings.JOB_BACKEND == "memory" and workers > 1:
+        server.log.warning("JOB_BACKEND=memory gives each worker its own queue; jobs polled on another worker are not found")
+    store = create_job_store(settings.JOB_BACKEND, settings.JOB_DB_PATH)
+    try:
+        requeued = store.requeue_unfinished()
+    finally:
+        store.close()
+    if requeued:
+        server.log.info(f"Requeued {requeued} unfinished jobs")
@@ -1,14 +1,34 @@
 import React, { useState } from 'react';
 import FileUpload from './components/FileUpload';
 import DataTable from './components/DataTable';
-import { extractPDFData } from './services/api';
-import type { ExtractedData } from './types';
+import { extractPDFDataStream } from './services/api';
+import type { ExtractedData, StreamEvent, Table } from './types';
 import './App.css';
 
 const App: React.FC = () => {
   const [loading, setLoading] = useState(false);
   const [extractedData, setExtractedData] = useState<ExtractedData | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [progress, setProgress] = useState<string | null>(null);
+  const [partialTables, setPartialTables] = useState<Table[]>([]);
+
+  const handleStreamEvent = (event: StreamEvent) => {
+    switch (event.type) {
+      case 'pages':
+        setProgress(`Read ${event.data.count} page${event.data.count === 1 ? '' : 's'}`);
+        break;
+      case 'ocr':
+        setProgress(`Running OCR on ${event.data.pages.length} scanned page${event.data.pages.length === 1 ? '' : 's'}`);
+        break;
+      case 'page':
+        if (event.data.source !== 'text_layer') setProgress(`OCR finished page ${event.data.page}`);
+        break;
+      case 'table':
+        setProgress('Extracting tables...');
+        setPartialTables((tables) => [...tables, event.data.table]);
+        break;
+    }
+  };
 
   const handleFileUpload = async (file: File) => {
     // File format validation
@@ -40,14 +60,17 @@ const App: React.FC = () => {
     setLoading(true);
     setError(null);
     setExtractedData(null);
+    setProgress(null);
+    setPartialTables([]);
 
     try {
-      const data = await extractPDFData(file);
+      const data = await extractPDFDataStream(file, handleStreamEvent);
       setExtractedData(data);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to extract data');
     } finally {
       setLoading(false);
+      setPartialTables([]);
     }
   };
 
@@ -64,10 +87,14 @@ const App: React.FC = () => {
         {loading && (
           <div className="loading">
             <div className="spinner"></div>
-            <p>Processing PDF... This may take a moment.</p>
+            <p>{progress ?? 'Processing PDF... This may take a moment.'}</p>
           </div>
         )}
 
+        {loading && partialTables.map((table, index) => (
+          <DataTable key={index} table={table} />
+        ))}
+
         {error && (
           <div className="error">
             <p>❌ {error}</p>
@@ -77,6 +104,13 @@ const App: React.FC = () => {
         {extractedData && (
           <div className="results">
             <h2>Extracted Data</h2>
+            {extractedData.serverTiming && Object.keys(extractedData.serverTiming).length > 0 && (
+              <p className="timings">
+                {Object.entries(extractedData.serverTiming)
+                  .map(([stage, ms]) => `${stage.replace('_', ' ')} ${ms.toFixed(0)} ms`)
+                  .join(' · ')}
+              </p>
+            )}
             {extractedData.data.summary && (
   <div className="summary">
     <h3>Summary</h3>
@@ -49,9 +49,11 @@ const DataTable: React.FC<DataTableProps> = ({ table }) => {
               return (
                 <tr 
                   key={rowIndex} 
+                  title={table.row_flags?.[rowIndex] === 'mismatch' ? 'Quantity × unit price does not match the total' : undefined}
                   className={`
                     ${rowIndex % 2 === 0 ? 'even-row' : 'odd-row'}
                     ${isTotal ? 'total-row' : ''}
+                    ${table.row_flags?.[rowIndex] === 'mismatch' ? 'mismatch-row' : ''}
                   `}
                 >
                   {row.map((cell, cellIndex) => (
@@ -1,7 +1,27 @@
-import type { ExtractedData } from '../types/index';
+import type {
+  BatchExtractedData,
+  ExtractedData,
+  LineItemFormat,
+  LineItemTotals,
+  StreamEvent,
+} from '../types/index';
 
 const API_URL = 'http://localhost:8000';
 
+// "text_layer;dur=24.2, structure;dur=11.9" -> { text_layer: 24.2, structure: 11.9 }
+export function parseServerTiming(header: string | null): Record<string, number> {
+  const timings: Record<string, number> = {};
+  if (!header) return timings;
+  header.split(',').forEach((entry) => {
+    const [name, ...params] = entry.trim().split(';');
+    const duration = params.find((param) => param.trim().startsWith('dur='));
+    if (name && duration) {
+      timings[name] = parseFloat(duration.trim().slice(4));
+    }
+  });
+  return timings;
+}
+
 export async function extractPDFData(file: File): Promise<ExtractedData> {
   const formData = new FormData();
   formData.append('file', file);
@@ -16,5 +36,118 @@ export async function extractPDFData(file: File): Promise<ExtractedData> {
     throw new Error(error.detail || 'Failed to extract PDF data');
   }
 
+  const data: ExtractedData = await response.json();
+  data.serverTiming = parseServerTiming(response.headers.get('Server-Timing'));
+  return data;
+}
+
+// Like extractPDFData, but reports progress events from /api/extract/stream as they arrive
+export async function extractPDFDataStream(
+  file: File,
+  onEvent: (event: StreamEvent) => void,
+): Promise<ExtractedData> {
+  const formData = new FormData();
+  formData.append('file', file);
+
+  const response = await fetch(`${API_URL}/api/extract/stream`, {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok || !response.body) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to extract PDF data');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result: ExtractedData | null = null;
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const messages = buffer.split('\n\n');
+    buffer = messages.pop() ?? '';
+    for (const message of messages) {
+      const lines = message.split('\n');
+      const type = lines.find((line) => line.startsWith('event: '))?.slice(7);
+      const data = lines.find((line) => line.startsWith('data: '))?.slice(6);
+      if (!type || data === undefined) continue;
+      const event = { type, data: JSON.parse(data) } as StreamEvent;
+      if (event.type === 'error') {
+        throw new Error(event.data.detail || 'Failed to extract PDF data');
+      }
+      if (event.type === 'result') {
+        result = event.data;
+        result.serverTiming = event.data.timings;
+      }
+      onEvent(event);
+    }
+  }
+
+  if (!result) {
+    throw new Error('The connection closed before the result arrived');
+  }
+  return result;
+}
+
+export async function extractPDFBatch(files: File[]): Promise<BatchExtractedData> {
+  const formData = new FormData();
+  files.forEach((file) => formData.append('files', file));
+
+  const response = await fetch(`${API_URL}/api/extract/batch`, {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to extract PDF data');
+  }
+
+  return response.json();
+}
+
+export async function exportLineItems(files: File[], format: LineItemFormat = 'csv'): Promise<Blob> {
+  const formData = new FormData();
+  files.forEach((file) => formData.append('files', file));
+  formData.append('format', format);
+
+  const response = await fetch(`${API_URL}/api/export`, {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to export line items');
+  }
+
+  return response.blob();
+}
+
+export async function aggregateLineItems(
+  files: File[],
+  by: string[] = ['vendor'],
+  start?: string,
+  end?: string
+): Promise<{ by: string[]; groups: LineItemTotals[] }> {
+  const formData = new FormData();
+  files.forEach((file) => formData.append('files', file));
+  formData.append('by', by.join(','));
+  if (start) formData.append('start', start);
+  if (end) formData.append('end', end);
+
+  const response = await fetch(`${API_URL}/api/export/aggregate`, {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to aggregate line items');
+  }
+
   return response.json();
 }
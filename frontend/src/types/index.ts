@@ -2,12 +2,27 @@ export interface Table {
   title: string;
   headers: string[];
   rows: string[][];
+  // One per row: quantity × unit price checked against the row total
+  row_flags?: ('ok' | 'mismatch' | 'unchecked' | 'charge')[];
+}
+
+export interface Validation {
+  rows_checked: number;
+  rows_mismatched: number;
+  items_total: number;
+  charges: Record<string, number>;
+  charges_from: 'table' | 'text' | null;
+  checks: { subtotal: boolean | null; total: boolean | null; summary_total: boolean | null };
+  confidence: number;
+  failed_tables: number[];
+  reextracted?: { table: number; fixed: boolean }[];
 }
 
 export interface Summary {
   total_amount: number;
   invoice_count: number;
   date_range: string;
+  vendor?: string | null;
 }
 
 export interface ExtractedData {
@@ -16,5 +31,46 @@ export interface ExtractedData {
   data: {
     tables: Table[];
     summary: Summary | null;
+    validation?: Validation;
   };
-}
\ No newline at end of file
+  cached?: boolean;
+  match?: { type: 'exact' | 'near'; similarity: number };
+  // Pages in the PDF, when only some of them were read
+  page_count?: number;
+  // Estimated tokens of the document text, as read and as sent to Gemini
+  prompt_tokens?: { raw: number; sent: number };
+  timings?: Record<string, number>;
+  serverTiming?: Record<string, number>;
+}
+
+export type StreamEvent =
+  | { type: 'document'; data: { filename: string; bytes: number } }
+  | { type: 'pages'; data: { count: number; read: number[] } }
+  | { type: 'page'; data: { page: number; source: string; chars: number; confidence?: number | null } }
+  | { type: 'ocr'; data: { pages: number[] } }
+  | { type: 'table'; data: { index: number; table: Table } }
+  | { type: 'summary'; data: Summary | null }
+  | { type: 'result'; data: ExtractedData }
+  | { type: 'error'; data: { detail: string } };
+
+export interface BatchExtractedData {
+  success: boolean;
+  count: number;
+  llm_batches: number;
+  results: Record<string, ExtractedData>;
+}
+export type LineItemFormat = 'csv' | 'parquet' | 'arrow';
+
+export interface LineItemTotals {
+  vendor?: string | null;
+  currency?: string | null;
+  year?: string | null;
+  month?: string | null;
+  date?: string | null;
+  documents: number;
+  line_items: number;
+  // Decimal strings, exact
+  quantity: string | null;
+  amount: string | null;
+  invoice_total: string | null;
+}